@@ -0,0 +1,237 @@
+import argparse
+import contextlib
+import datetime
+import glob
+import io
+import json
+import math
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+import uuid
+from decode_json import CompactDecodeJson, DecodeJson, IndexedDecodeJson, StreamingDecodeJson
+from generate_view_md import GeneratorContext, ViewGenerator
+from json2plantuml import PlantUMLConverter
+
+SCRIPTS_PATH = os.path.dirname(os.path.abspath(__file__))
+SCHEMAS_PATH = os.path.join(SCRIPTS_PATH, '..', 'schemas')
+
+class SyntheticModel:
+    """
+    Build a project shaped like elausa_aspice/schemas: SWE1 requirements, and SWE2 layers
+    and interfaces where every component satisfies requirements and owns ports.
+    Fixed fields such as 'tags' and 'icon' are taken from the schemas' 'const' values.
+    """
+    def __init__(self, components, ports=4, requirements_per_component=2, seed=0):
+        self.random = random.Random(seed)
+        self.constants = self._load_constants()
+        self.ports = ports
+        self.nodes = 0
+        self.requirements = [self._node('reqs', f'REQ{i}', description=f'Requirement {i}') for i in range(max(1, components))]
+        self.requirements_per_component = requirements_per_component
+        self.interfaces = [self._node('interface', f'if{i}', description='') for i in range(max(1, components // 2))]
+        # At most 20 components per layer
+        layer_count = max(1, math.ceil(components / 20))
+        layers = [self._layer(index, len(range(index, components, layer_count))) for index in range(layer_count)]
+        self.data = self._node('aspice_profile', 'benchmark', **{
+            '$model': 'aspice_profile.model.json',
+            'description': '',
+            'SWE1-Requirements': self.requirements,
+            'SWE2-Architecture': {'Layers': layers, 'Interfaces': self.interfaces, 'icon': 'folder'},
+        })
+
+    def _load_constants(self):
+        constants = {}
+        for schema_path in glob.glob(os.path.join(SCHEMAS_PATH, '*.model.json')):
+            with open(schema_path, 'r', encoding='utf-8') as schema_file:
+                schema = json.load(schema_file)
+            properties = schema.get('properties', {})
+            name = os.path.basename(schema_path)[:-len('.model.json')]
+            constants[name] = {key: value['const'] for key, value in properties.items()
+                               if isinstance(value, dict) and 'const' in value}
+        return constants
+
+    def _id(self):
+        return str(uuid.UUID(int=self.random.getrandbits(128)))
+
+    def _ref(self, node):
+        return f"${{id:{node['id']}}}"
+
+    def _node(self, schema, label, **fields):
+        self.nodes += 1
+        node = {'id': self._id(), 'label': label}
+        node.update(self.constants.get(schema, {}))
+        node.update(fields)
+        return node
+
+    def _layer(self, index, components):
+        return self._node('layer', f'layer{index}', description='', Layers=[],
+                          Components=[self._component(f'c{index}_{i}', depth=0) for i in range(max(1, components))])
+
+    def _component(self, label, depth):
+        requirements = self.random.sample(self.requirements, min(self.requirements_per_component, len(self.requirements)))
+        ports = [self._node('port', f'{label}_p{i}', description='', direction=['in', 'out'][i % 2],
+                            interface=self._ref(self.random.choice(self.interfaces)), use='')
+                 for i in range(self.ports)]
+        subcomponents = [self._component(f'{label}_{i}', depth + 1) for i in range(2)] if depth == 0 else []
+        return self._node('component', label, description='', requirements=[self._ref(req) for req in requirements],
+                          ports=ports, Components=subcomponents)
+
+def benchmarks(model_path, model):
+    """Return {name: (function, items)}, each function runs one entry point over the whole model."""
+    decoder = DecodeJson(model_path)
+    ids = list(decoder.id_index)
+    root_id = model.data['id']
+    requirements = [req['id'] for req in model.requirements]
+    elements = model.requirements + model.interfaces
+    swe1 = os.path.join(SCRIPTS_PATH, 'swe1_blueprint.md')
+    swe2 = os.path.join(SCRIPTS_PATH, 'swe2_blueprint.md')
+
+    def search_all():
+        for id in ids:
+            decoder.search_by_id(id)
+
+    def refs_all():
+        for id in requirements:
+            decoder.get_refs_to_object(id, 'component')
+
+    def stream_last():
+        streaming = StreamingDecodeJson(model_path)
+        streaming.search_by_id(ids[-1])
+        streaming.close()
+
+    def index_reopen():
+        indexed = IndexedDecodeJson(model_path)
+        indexed.search_by_id(ids[-1])
+        indexed.close()
+
+    # Timed runs reopen the index sidecar, it is built here once
+    IndexedDecodeJson(model_path).close()
+
+    def render(blueprint):
+        return lambda: ViewGenerator(model_path, root_id, blueprint, context=GeneratorContext(model_path, decoder))
+
+    return {
+        'decoder.load': (lambda: DecodeJson(model_path), model.nodes),
+        'decoder.compact_load': (lambda: CompactDecodeJson(model_path), model.nodes),
+        'decoder.search_by_id': (search_all, len(ids)),
+        'decoder.get_refs_to_object': (refs_all, len(requirements)),
+        'decoder.streaming_scan': (stream_last, model.nodes),
+        'decoder.index_reopen': (index_reopen, model.nodes),
+        'plantuml.element': (lambda: [PlantUMLConverter(element).plantuml_output for element in elements], len(elements)),
+        'view.swe1': (render(swe1), len(requirements)),
+        'view.swe2': (render(swe2), model.nodes),
+    }
+
+def measure(function, repeat):
+    """
+    Return the best and mean wall time over 'repeat' runs, and the peak traced memory of one run
+    with the memory still held while its result is alive, e.g. a loaded model.
+    """
+    times = []
+    # The generators print diagnostics, keep them out of the report
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(repeat):
+            start = time.perf_counter()
+            function()
+            times.append(time.perf_counter() - start)
+        tracemalloc.start()
+        result = function()
+        retained, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        del result
+    return min(times), sum(times) / len(times), peak, retained
+
+def scaling_exponent(points):
+    """Slope of log(time) over log(size) between the smallest and largest size, 1.0 is linear."""
+    points = [(size, seconds) for size, seconds in points if size > 0 and seconds > 0]
+    if len(points) < 2 or points[0][0] == points[-1][0]:
+        return None
+    (size_a, time_a), (size_b, time_b) = points[0], points[-1]
+    return math.log(time_b / time_a) / math.log(size_b / size_a)
+
+def run(sizes, repeat, only=None):
+    results = {'metadata': {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'date': datetime.datetime.now().isoformat(timespec='seconds'),
+        'sizes': sizes,
+        'repeat': repeat,
+    }, 'benchmarks': {}}
+    with tempfile.TemporaryDirectory() as temp_path:
+        for size in sizes:
+            model = SyntheticModel(size)
+            model_path = os.path.join(temp_path, f'model-{size}.json')
+            with open(model_path, 'w') as model_file:
+                json.dump(model.data, model_file, indent=2)
+            for name, (function, items) in benchmarks(model_path, model).items():
+                if only and not any(name.startswith(prefix) for prefix in only):
+                    continue
+                best, mean, peak, retained = measure(function, repeat)
+                results['benchmarks'].setdefault(name, []).append({
+                    'size': size,
+                    'nodes': model.nodes,
+                    'items': items,
+                    'best_s': best,
+                    'mean_s': mean,
+                    'items_per_s': items / best if best else None,
+                    'peak_memory_bytes': peak,
+                    'retained_memory_bytes': retained,
+                })
+                print(f"{name:<34} size={size:<6} nodes={model.nodes:<8} best={best * 1000:10.2f} ms "
+                      f"{items / best if best else 0:12.0f} items/s  peak={peak / 1e6:8.2f} MB  retained={retained / 1e6:8.2f} MB", file=sys.stderr)
+    for name, points in results['benchmarks'].items():
+        exponent = scaling_exponent([(point['nodes'], point['best_s']) for point in points])
+        for point in points:
+            point['scaling_exponent'] = exponent
+    return results
+
+def compare(results, baseline, threshold):
+    """Print the time ratio against a previous results file and return the regressed benchmarks."""
+    regressions = []
+    for name, points in results['benchmarks'].items():
+        previous = {point['size']: point for point in baseline.get('benchmarks', {}).get(name, [])}
+        for point in points:
+            before = previous.get(point['size'])
+            if not before or not before['best_s']:
+                continue
+            ratio = point['best_s'] / before['best_s']
+            flag = ''
+            if ratio > 1 + threshold:
+                flag = '  REGRESSION'
+                regressions.append((name, point['size'], ratio))
+            print(f"{name:<34} size={point['size']:<6} {ratio:6.2f}x{flag}", file=sys.stderr)
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the decoder, PlantUML converter and Markdown views on synthetic models.")
+    parser.add_argument('--sizes', default='10,100,1000', help="Comma-separated number of components per model")
+    parser.add_argument('--repeat', type=int, default=3, help="Timed runs per benchmark, the best one is reported")
+    parser.add_argument('--only', help="Comma-separated benchmark name prefixes to run")
+    parser.add_argument('-o', '--output', help="Where to write the JSON results")
+    parser.add_argument('--compare', help="Previous JSON results to compare against")
+    parser.add_argument('--threshold', type=float, default=0.10, help="Slowdown ratio reported as a regression")
+    args = parser.parse_args()
+
+    sizes = sorted(int(size) for size in args.sizes.split(',') if size.strip())
+    only = [prefix.strip() for prefix in args.only.split(',')] if args.only else None
+    results = run(sizes, args.repeat, only)
+
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(results, output_file, indent=2)
+    else:
+        print(json.dumps(results, indent=2))
+
+    if args.compare:
+        with open(args.compare, 'r') as baseline_file:
+            regressions = compare(results, json.load(baseline_file), args.threshold)
+        if regressions:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
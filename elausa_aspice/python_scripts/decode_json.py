@@ -1,94 +1,141 @@
+import array
+import bisect
+import collections
+import hashlib
 import json
+import mmap
+import os
 import re
+import struct
 import sys
+from file_writer import write_atomic
 
 class DecodeJson:
-    def __init__(self, json_path):
+    def __init__(self, json_path, object_pairs_hook=None):
         self.json_path = json_path
         try:
             # Load the JSON data from the file
             with open(self.json_path, 'r') as json_file:
-                self.json_data = json.load(json_file)
+                self.json_data = json.load(json_file, object_pairs_hook=object_pairs_hook)
         except FileNotFoundError:
             print(f"File {self.json_path} not found.")
             sys.exit(1)  # Exit the program if the file is not found
         except json.JSONDecodeError:
             print(f"Failed to decode JSON from file {self.json_path}.")
             sys.exit(1)  # Exit if there's an error in JSON format
-            
-            
+
+        # Build the id, path and reference indexes once so lookups do not walk the tree
+        self.id_index = {}
+        self.path_index = {}
+        self.parent_index = {}
+        self.refs_index = {}
+        # Objects with an 'id' are numbered in document order; preorder_index holds the (entry, exit)
+        # numbers of each one, so its subtree is every number in that range
+        self.preorder_index = {}
+        self.tag_index = {}  # tag -> ([entry numbers], [ids]), both in document order
+        self.node_count = 0
+        self._resolved = {}
+        self._build_index(self.json_data, [], [])
+
+    def _build_index(self, json_data, path, ancestors, parent=None):
+        """Helper function for recursively indexing every object that has an 'id'."""
+        if isinstance(json_data, dict):
+            tagged = False
+            entry = None
+            if 'id' in json_data:
+                obj_path = tuple(path)
+                try:
+                    # Keep the first match, the same one the tree walk used to return
+                    self.id_index.setdefault(json_data['id'], (json_data, obj_path))
+                except TypeError:
+                    pass  # Unhashable 'id' values can never be searched for
+                self.path_index[obj_path] = json_data
+                # Point to the nearest enclosing object with an 'id', ancestors are then found without walking paths
+                self.parent_index[id(json_data)] = (parent, obj_path)
+                parent = json_data
+                entry = self.node_count
+                self.node_count += 1
+                self._index_tags(json_data, entry)
+                # The root object is never reported as a referencing parent
+                tagged = bool(path) and isinstance(json_data.get('tags'), list)
+            if tagged:
+                ancestors.append(json_data)
+            for key, value in json_data.items():
+                if isinstance(value, (dict, list)):
+                    path.append(key)
+                    self._build_index(value, path, ancestors, parent)
+                    path.pop()
+                else:
+                    self._index_ref(value, ancestors)
+            if tagged:
+                ancestors.pop()
+            if entry is not None:
+                self.preorder_index[id(json_data)] = (entry, self.node_count - 1)
+
+        elif isinstance(json_data, list):
+            for index, item in enumerate(json_data):
+                if isinstance(item, (dict, list)):
+                    path.append(str(index))
+                    self._build_index(item, path, ancestors, parent)
+                    path.pop()
+                else:
+                    self._index_ref(item, ancestors)
+
+    def _index_tags(self, json_data, entry):
+        """Add the object to the id list of each of its tags."""
+        tags = json_data.get('tags')
+        if not isinstance(tags, list):
+            return
+        for tag in dict.fromkeys(tag for tag in tags if isinstance(tag, str)):
+            entries, ids = self.tag_index.setdefault(tag, ([], []))
+            entries.append(entry)
+            ids.append(json_data['id'])
+
+    def _index_ref(self, value, ancestors):
+        """Record a '${id:X}' value under the nearest enclosing parent of each tag."""
+        if not (isinstance(value, str) and value.startswith('${id:') and value.endswith('}')):
+            return
+        refs_by_tag = self.refs_index.setdefault(value[5:-1], {})
+        seen_tags = set()
+        for parent in reversed(ancestors):
+            for tag in parent['tags']:
+                if isinstance(tag, str) and tag not in seen_tags:
+                    seen_tags.add(tag)
+                    refs_by_tag.setdefault(tag, []).append(parent)
+
     def get_ids_by_tag(self, tag):
         """Get a list of 'id' values for objects with the specified tag."""
         try:
-            id_list = []
-            self._recursive_search_by_tag(tag, self.json_data, id_list)
-            return id_list
+            return list(self.tag_index.get(tag, ([], []))[1])
         except Exception as e:
             print(f"Error encountered during search: {e}")
             return None
-        
-    def _recursive_search_by_tag(self, tag, json_data, id_list):
-        """Helper function for recursively searching by tag."""
-        try:
-            if isinstance(json_data, dict):
-                if 'tags' in json_data and tag in json_data['tags']:
-                    id_list.append(json_data['id'])  # Append the 'id' value to the list
-                for key, value in json_data.items():
-                    self._recursive_search_by_tag(tag, value, id_list)
-
-            elif isinstance(json_data, list):
-                for item in json_data:
-                    self._recursive_search_by_tag(tag, item, id_list)
-        except Exception as e:
-            print(f"Error during recursive search: {e}")
-            
+
     def get_ids_by_tag_within_parent_id(self, tag, parent_id):
         """Get a list of 'id' values for objects with the specified tag within a parent object."""
         try:
-            id_list = []
-            self._recursive_search_by_tag_within_parent_id(tag, parent_id, self.json_data, id_list)
-            return id_list
+            parent = self.search_by_id(parent_id)[0]
+            if parent is None:
+                return []
+            entries, ids = self.tag_index.get(tag, ([], []))
+            # The parent's subtree is a contiguous range of the tag's entry numbers
+            first, last = self.preorder_index[id(parent)]
+            return ids[bisect.bisect_left(entries, first):bisect.bisect_right(entries, last)]
         except Exception as e:
             print(f"Error encountered during search: {e}")
             return None
-        
-    def _recursive_search_by_tag_within_parent_id(self, tag, parent_id, json_data, id_list):
-        """Helper function for recursively searching by tag within a parent object."""
-        try:
-            if isinstance(json_data, dict):
-                if 'id' in json_data and json_data['id'] == parent_id:
-                    self._recursive_search_by_tag(tag, json_data, id_list)
-                for key, value in json_data.items():
-                    self._recursive_search_by_tag_within_parent_id(tag, parent_id, value, id_list)
-
-            elif isinstance(json_data, list):
-                for item in json_data:
-                    self._recursive_search_by_tag_within_parent_id(tag, parent_id, item, id_list)
-        except Exception as e:
-            print(f"Error during recursive search: {e}")
 
     def search_by_id(self, target_id, path=[]):
         """Search for an object by its 'id' field within self.json_data."""
         try:
-            if isinstance(self.json_data, dict):
-                for key, value in self.json_data.items():
-                    if key == "id" and value == target_id:
-                        return self.json_data, path  # Return the entire object and its path
-                    else:
-                        result = self._recursive_search(target_id, value, path + [key])
-                        if result[0]:  # Return as soon as the object is found
-                            return result  # Already a tuple (object, path)
-
-            elif isinstance(self.json_data, list):
-                for index, item in enumerate(self.json_data):
-                    result = self._recursive_search(target_id, item, path + [str(index)])
-                    if result[0]:
-                        return result  # Already a tuple (object, path)
-        except Exception as e:
-            print(f"Error encountered during search: {e}")
-            return None, path
+            entry = self.id_index.get(target_id)
+        except TypeError:
+            entry = None  # Unhashable ids cannot be in the index
+        if entry is None:
+            return None, path  # Return (None, path) if no matching object is found
 
-        return None, path  # Return (None, path) if no matching object is found
+        obj, obj_path = entry
+        return obj, path + list(obj_path)  # Return a fresh path list, callers may modify it
     
     def search_by_path(self, path):
         """Search for an object by its path within self.json_data."""
@@ -96,6 +143,11 @@ class DecodeJson:
             if not path:
                 return self.json_data  # Return the root object if the path is empty
 
+            # Objects with an 'id' are answered straight from the path index
+            result = self.path_index.get(tuple(str(key) for key in path))
+            if result is not None:
+                return result
+
             result = self.json_data
             for key in path:
                 if isinstance(key, str) and key.isdigit():
@@ -107,26 +159,6 @@ class DecodeJson:
             return None
         except Exception as e:
             print(f"Unexpected error during search: {e}")
-
-    def _recursive_search(self, target_id, json_data, path):
-        """Helper function for recursively searching by 'id'."""
-        try:
-            if isinstance(json_data, dict):
-                for key, value in json_data.items():
-                    if key == "id" and value == target_id:
-                        return json_data, path  # Return the matched dictionary object and path
-                    result = self._recursive_search(target_id, value, path + [key])
-                    if result[0]:
-                        return result  # Already a tuple (object, path)
-
-            elif isinstance(json_data, list):
-                for index, item in enumerate(json_data):
-                    result = self._recursive_search(target_id, item, path + [str(index)])
-                    if result[0]:
-                        return result  # Already a tuple (object, path)
-        except Exception as e:
-            print(f"Error during recursive search: {e}")
-        return None, path  # Return (None, path) if nothing is found at this level
     
     def extract_guid(self, text):
         """Extract a GUID from the provided text."""
@@ -139,47 +171,39 @@ class DecodeJson:
             print(f"Error extracting GUID: {e}")
             return None
 
+    def resolve(self, reference):
+        """Return the object a reference such as '${id:...}' points to, caching the result per reference."""
+        try:
+            return self._resolved[reference]
+        except KeyError:
+            pass
+        except TypeError:
+            return self.search_by_id(self.extract_guid(reference))[0]  # Unhashable references are not cached
+        target = self.search_by_id(self.extract_guid(reference))[0]
+        self._resolved[reference] = target
+        return target
+
     def return_parent(self, target_id, tag):
         """Return the parent object of an item with the specified 'id' and 'tag'."""
-        def search_parent(path_child, tag):
-            try:
-                # Base case: If path is empty, return None (we have reached the root)
-                if not path_child:
-                    return [None, []]
-
-                result = self.json_data  # Start with the root of the JSON
-                for key in path_child:
-                    if isinstance(key, str) and key.isdigit():
-                        key = int(key)  # Convert string key to integer if it's a numeric index
-                    result = result[key]  # Navigate one level deeper
-
-                # If 'id' and 'tags' exist and the tag matches, return the current object
-                if 'id' in result and 'tags' in result and tag in result['tags']:
-                    return [result, path_child]
-
-                # If no match, go up one level in the path
-                path_child.pop()
-                return search_parent(path_child, tag)
-
-            except KeyError as e:
-                print(f"KeyError encountered: {e} in path {path_child}")
-                return None, path_child
-            except Exception as e:
-                print(f"Unexpected error during parent search: {e}")
-                return None, path_child
-
         try:
             # First, find the child item with the specified 'id'
-            [child, path_child] = self.search_by_id(target_id)
+            child = self.search_by_id(target_id)[0]
             if not child:
                 return [None, []]
 
-            # Then, find the parent with the matching 'tag'
-            return search_parent(path_child, tag)
+            # Then, follow the parent pointers up to the first object with the matching 'tag'
+            while child is not None:
+                parent, child_path = self.parent_index[id(child)]
+                if not child_path:
+                    break  # We have reached the root
+                if 'tags' in child and tag in child['tags']:
+                    return [child, list(child_path)]
+                child = parent
+            return [None, []]
         except Exception as e:
             print(f"Error in return_parent: {e}")
             return [None, []]
-        
+
     def search_parent_by_path(self, rootData, path, tag):
         # Base case: If path is empty, return the rootData (we have found the object)
         if not path:
@@ -203,7 +227,15 @@ class DecodeJson:
         path.pop()  # Go up one level
         return self.search_parent_by_path(rootData, path, tag)
     
+    def get_refs_to_object(self, target_id, tag):
+        """Get the parents with the specified tag that reference the object with 'target_id'."""
+        return list(self.refs_index.get(target_id, {}).get(tag, []))
+
     def get_all_refs_to_object(self, target_id, data, rootData, tag, path=""):
+        # A search over the whole document is answered from the reference index
+        if data is self.json_data and rootData is self.json_data and not path:
+            return self.get_refs_to_object(target_id, tag)
+
         refs = []
 
         if isinstance(data, dict):
@@ -225,4 +257,788 @@ class DecodeJson:
                     if parent_result and parent_result[1]:
                         refs.append(parent_result[0])  # Append the parent list
 
-        return refs
\ No newline at end of file
+        return refs
+
+class _CompactNode:
+    """An object (keys is its shared tuple of keys) or an array (keys is None) of a CompactDecodeJson model."""
+    __slots__ = ('keys', 'values')
+
+    def __init__(self, keys, values):
+        self.keys = keys
+        self.values = values
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except (KeyError, IndexError, TypeError):
+            return default
+
+    def __getitem__(self, key):
+        if self.keys is None:
+            return self.values[key]
+        try:
+            return self.values[self.keys.index(key)]
+        except ValueError:
+            raise KeyError(key)
+
+    def __contains__(self, item):
+        # Keys for objects, items for arrays, as for dicts and lists
+        return item in (self.values if self.keys is None else self.keys)
+
+    def __iter__(self):
+        return iter(self.values if self.keys is None else self.keys)
+
+class CompactDecodeJson(DecodeJson):
+    """
+    Same queries as DecodeJson over a compact copy of the model, for models too large to keep as
+    nested dicts. Keys, tags and short strings are interned, objects are __slots__ records holding
+    a key tuple shared by every object with the same keys, and arrays of strings are shared by
+    every object holding the same ones. Objects with an 'id' are numbered in document order and
+    their parents, subtree ranges and tag lists are kept in integer arrays indexed by that number.
+    Returned objects are rebuilt as plain dicts and lists.
+    """
+    # Longer strings, such as documentation, are rarely repeated and are kept as parsed
+    MAX_INTERNED_LENGTH = 128
+
+    def __init__(self, json_path):
+        self.json_path = json_path
+        self._strings = {}
+        self._shapes = {}
+        self._string_arrays = {}
+        try:
+            # Objects are compacted as soon as they are parsed, the whole model never exists as dicts
+            with open(self.json_path, 'r') as json_file:
+                self.root = self._compact(json.load(json_file, object_pairs_hook=self._compact_object))
+        except FileNotFoundError:
+            print(f"File {self.json_path} not found.")
+            sys.exit(1)  # Exit the program if the file is not found
+        except json.JSONDecodeError:
+            print(f"Failed to decode JSON from file {self.json_path}.")
+            sys.exit(1)  # Exit if there's an error in JSON format
+
+        # Per numbered object: the object, the number of its nearest numbered ancestor (-1 for none),
+        # the last number of its subtree, and its path below that ancestor
+        self.nodes = []
+        self.parents = array.array('l')
+        self.exits = array.array('l')
+        self.subpaths = []
+        self.id_index = {}  # id -> number, the first object wins
+        self.tag_index = {}  # tag -> (array of numbers, [ids]), both in document order
+        self.refs_index = {}  # referenced id -> {tag: array of numbers}
+        self._subpath_table = {}
+        self._resolved = {}
+        if isinstance(self.root, _CompactNode):
+            self._build_index(self.root, [], [], -1)
+        # The interning tables are only needed while loading
+        self._strings = self._shapes = self._string_arrays = self._subpath_table = None
+
+    # The model is never kept as plain dicts and lists, whole model queries go through the indexes
+    # (get_refs_to_object instead of get_all_refs_to_object over json_data)
+    json_data = None
+
+    def _compact(self, value):
+        if isinstance(value, str):
+            if len(value) > self.MAX_INTERNED_LENGTH:
+                return value
+            return self._strings.setdefault(value, value)
+        if isinstance(value, list):
+            values = tuple(self._compact(item) for item in value)
+            if all(type(item) is str for item in values):
+                shared = self._string_arrays.get(values)
+                if shared is None:
+                    shared = self._string_arrays[values] = _CompactNode(None, values)
+                return shared
+            return _CompactNode(None, values)
+        return value
+
+    def _compact_object(self, pairs):
+        if len(pairs) != len({key for key, value in pairs}):
+            pairs = list(dict(pairs).items())  # The last duplicate key wins, as in json.load
+        keys = tuple(sys.intern(key) for key, value in pairs)
+        keys = self._shapes.setdefault(keys, keys)
+        return _CompactNode(keys, tuple(self._compact(value) for key, value in pairs))
+
+    def _build_index(self, node, path, ancestors, parent, parent_depth=0):
+        """Helper function for recursively numbering and indexing every object that has an 'id'."""
+        number = None
+        tagged = False
+        if node.keys is not None:
+            if 'id' in node.keys:
+                number = len(self.nodes)
+                subpath = tuple(path[parent_depth:])
+                self.nodes.append(node)
+                self.parents.append(parent)
+                self.exits.append(number)
+                self.subpaths.append(self._subpath_table.setdefault(subpath, subpath))
+                try:
+                    self.id_index.setdefault(node['id'], number)
+                except TypeError:
+                    pass  # Unhashable 'id' values can never be searched for
+                tags = node.get('tags')
+                if isinstance(tags, _CompactNode) and tags.keys is None:
+                    for tag in dict.fromkeys(tag for tag in tags if isinstance(tag, str)):
+                        numbers, ids = self.tag_index.setdefault(tag, (array.array('l'), []))
+                        numbers.append(number)
+                        ids.append(node['id'])
+                    # The root object is never reported as a referencing parent
+                    tagged = bool(path)
+                parent, parent_depth = number, len(path)
+            if tagged:
+                ancestors.append(number)
+            items = zip(node.keys, node.values)
+        else:
+            # Array indexes are interned, they repeat in every path
+            items = ((sys.intern(str(index)), item) for index, item in enumerate(node.values))
+
+        for key, value in items:
+            if isinstance(value, _CompactNode):
+                path.append(key)
+                self._build_index(value, path, ancestors, parent, parent_depth)
+                path.pop()
+            else:
+                self._index_ref(value, ancestors)
+        if tagged:
+            ancestors.pop()
+        if number is not None:
+            self.exits[number] = len(self.nodes) - 1
+
+    def _index_ref(self, value, ancestors):
+        """Record a '${id:X}' value under the nearest enclosing parent of each tag."""
+        if not (isinstance(value, str) and value.startswith('${id:') and value.endswith('}')):
+            return
+        refs_by_tag = self.refs_index.setdefault(value[5:-1], {})
+        seen_tags = set()
+        for number in reversed(ancestors):
+            for tag in self.nodes[number]['tags']:
+                if isinstance(tag, str) and tag not in seen_tags:
+                    seen_tags.add(tag)
+                    refs_by_tag.setdefault(tag, array.array('l')).append(number)
+
+    def _export(self, node):
+        """Rebuild a compact node as plain dicts and lists."""
+        if not isinstance(node, _CompactNode):
+            return node
+        if node.keys is None:
+            return [self._export(item) for item in node.values]
+        return {key: self._export(value) for key, value in zip(node.keys, node.values)}
+
+    def _number(self, target_id):
+        try:
+            return self.id_index.get(target_id)
+        except TypeError:
+            return None  # Unhashable ids cannot be in the index
+
+    def _path(self, number):
+        parts = []
+        while number != -1:
+            parts.append(self.subpaths[number])
+            number = self.parents[number]
+        return [key for subpath in reversed(parts) for key in subpath]
+
+    def _is_root(self, number):
+        return self.parents[number] == -1 and not self.subpaths[number]
+
+    def search_by_id(self, target_id, path=[]):
+        """Search for an object by its 'id' field within the model."""
+        number = self._number(target_id)
+        if number is None:
+            return None, path  # Return (None, path) if no matching object is found
+        return self._export(self.nodes[number]), path + self._path(number)
+
+    def search_by_path(self, path):
+        """Search for an object by its path within the model."""
+        try:
+            result = self.root
+            for key in path:
+                if isinstance(key, str) and key.isdigit():
+                    key = int(key)  # Convert the string key to an integer
+                if result.keys is not None:
+                    key = str(key)  # Object keys are strings, as in the path index
+                result = result[key]  # Navigate one level deeper in the model
+            return self._export(result)
+        except KeyError as e:
+            print(f"KeyError encountered: {e} in path {path}")
+            return None
+        except Exception as e:
+            print(f"Unexpected error during search: {e}")
+
+    def get_ids_by_tag_within_parent_id(self, tag, parent_id):
+        """Get a list of 'id' values for objects with the specified tag within a parent object."""
+        try:
+            number = self._number(parent_id)
+            if number is None:
+                return []
+            numbers, ids = self.tag_index.get(tag, ((), []))
+            # The parent's subtree is a contiguous range of numbers
+            return ids[bisect.bisect_left(numbers, number):bisect.bisect_right(numbers, self.exits[number])]
+        except Exception as e:
+            print(f"Error encountered during search: {e}")
+            return None
+
+    def return_parent(self, target_id, tag):
+        """Return the parent object of an item with the specified 'id' and 'tag'."""
+        number = self._number(target_id)
+        # The item itself is checked first, the root object never is
+        while number is not None and number != -1 and not self._is_root(number):
+            node = self.nodes[number]
+            if 'tags' in node and tag in node['tags']:
+                return [self._export(node), self._path(number)]
+            number = self.parents[number]
+        return [None, []]
+
+    def get_refs_to_object(self, target_id, tag):
+        """Get the parents with the specified tag that reference the object with 'target_id'."""
+        return [self._export(self.nodes[number]) for number in self.refs_index.get(target_id, {}).get(tag, ())]
+
+class _StreamRecord:
+    """Offsets and metadata of one object with an 'id' seen by StreamingDecodeJson."""
+    __slots__ = ('start', 'end', 'depth', 'subpath', 'tags', 'parent')
+
+    def __init__(self, start, path, parent):
+        self.start = start
+        self.end = None  # Set once the closing brace has been scanned
+        # Only the part of the path below the parent record is stored
+        self.depth = len(path)
+        self.subpath = tuple(path[parent.depth:]) if parent is not None else tuple(path)
+        self.tags = ()
+        self.parent = parent
+
+    @property
+    def path(self):
+        parts = []
+        record = self
+        while record is not None:
+            parts.append(record.subpath)
+            record = record.parent
+        return [key for subpath in reversed(parts) for key in subpath]
+
+class StreamingDecodeJson:
+    """
+    Answer id lookups without loading the whole file. The file is memory-mapped and scanned
+    as a stream of tokens only as far as a lookup needs; the index keeps offsets, paths and
+    tags, and a subtree is parsed only when it is returned.
+    """
+    # Strings (with an optional ':' when they are keys) and the structural characters we track
+    _TOKEN = re.compile(rb'"([^"\\]*(?:\\.[^"\\]*)*)"(\s*:)?|[{}\[\],]')
+    # Objects parsed most recently, a converter looks the same elements up many times
+    LOADED_CACHE_SIZE = 256
+
+    extract_guid = DecodeJson.extract_guid
+    resolve = DecodeJson.resolve
+
+    def __init__(self, json_path):
+        self.json_path = json_path
+        try:
+            with open(self.json_path, 'rb') as json_file:
+                self._map = mmap.mmap(json_file.fileno(), 0, access=mmap.ACCESS_READ)
+        except FileNotFoundError:
+            print(f"File {self.json_path} not found.")
+            sys.exit(1)  # Exit the program if the file is not found
+        except ValueError:
+            print(f"Failed to decode JSON from file {self.json_path}.")
+            sys.exit(1)  # Empty files cannot be mapped
+        self.id_index = {}
+        self._resolved = {}
+        self._loaded = collections.OrderedDict()
+        self.finished = False
+        self._tokens = self._TOKEN.finditer(self._map)
+        # Each frame is [opener, start offset, record, array index, pending key, tags list]
+        self._stack = []
+        self._path = []
+
+    def close(self):
+        # The token iterator holds a view of the map, release it first
+        self._tokens = iter(())
+        self.finished = True
+        self._map.close()
+
+    @staticmethod
+    def _decode_string(raw):
+        # Keys and tags repeat on every node, interning keeps one copy of each
+        if b'\\' in raw:
+            return sys.intern(json.loads(b'"' + raw + b'"'))
+        return sys.intern(raw.decode('utf-8'))
+
+    def _fail(self):
+        print(f"Failed to decode JSON from file {self.json_path}.")
+        sys.exit(1)  # Exit if there's an error in JSON format
+
+    def _advance(self):
+        """Scan tokens until an object with an 'id' is closed; return its record, or None at the end."""
+        stack = self._stack
+        path = self._path
+        for match in self._tokens:
+            token = match.group(0)
+            first = token[0]
+            if first == 0x22:  # '"'
+                if not stack:
+                    continue
+                top = stack[-1]
+                if match.group(2):
+                    top[4] = self._decode_string(match.group(1))  # An object key
+                elif top[0] == 0x7b and top[4] == 'id' and top[2] is None:
+                    # The object's id, remember where it starts and which object encloses it
+                    value = self._decode_string(match.group(1))
+                    parent = None
+                    for frame in reversed(stack[:-1]):
+                        if frame[2] is not None:
+                            parent = frame[2]
+                            break
+                    top[2] = _StreamRecord(top[1], path, parent)
+                    self.id_index.setdefault(value, top[2])
+                elif top[0] == 0x5b and top[5] is not None:
+                    top[5].append(self._decode_string(match.group(1)))
+            elif first == 0x7b or first == 0x5b:  # '{' or '['
+                tags = None
+                if stack:
+                    top = stack[-1]
+                    if top[0] == 0x7b:
+                        path.append(top[4])
+                        if top[4] == 'tags' and first == 0x5b:
+                            tags = top[5] = []  # The parent object keeps the tag list
+                    else:
+                        path.append(str(top[3]))
+                stack.append([first, match.start(), None, 0, None, tags])
+            elif first == 0x2c:  # ','
+                if stack:
+                    if stack[-1][0] == 0x5b:
+                        stack[-1][3] += 1
+                    else:
+                        stack[-1][4] = None
+            else:  # '}' or ']'
+                if not stack or stack[-1][0] != (0x7b if first == 0x7d else 0x5b):
+                    self._fail()
+                frame = stack.pop()
+                if stack:
+                    path.pop()
+                record = frame[2]
+                if record is not None:
+                    record.end = match.end()
+                    if frame[5]:
+                        record.tags = tuple(frame[5])
+                    return record
+        if stack:
+            self._fail()
+        self.finished = True
+        return None
+
+    def _find(self, target_id):
+        """Return the record of 'target_id', scanning until its 'id' has been seen."""
+        record = self.id_index.get(target_id)
+        while record is None and not self.finished:
+            self._advance()
+            record = self.id_index.get(target_id)
+        return record
+
+    def _complete(self, record):
+        """Keep scanning until the object of 'record' has been closed."""
+        while record.end is None and not self.finished:
+            self._advance()
+        return record.end is not None
+
+    def _load(self, record):
+        """Parse the object of a completed record, keeping the last LOADED_CACHE_SIZE ones so memory stays bounded."""
+        obj = self._loaded.pop(record, None)
+        if obj is None:
+            try:
+                obj = json.loads(self._map[record.start:record.end])
+            except json.JSONDecodeError:
+                self._fail()
+            if len(self._loaded) >= self.LOADED_CACHE_SIZE:
+                self._loaded.popitem(last=False)
+        self._loaded[record] = obj
+        return obj
+
+    def search_by_id(self, target_id, path=[]):
+        """Search for an object by its 'id' field, scanning the file only as far as needed."""
+        record = self._find(target_id)
+        if record is None or not self._complete(record):
+            return None, path  # Return (None, path) if no matching object is found
+        return self._load(record), path + record.path
+
+    def return_parent(self, target_id, tag):
+        """Return the parent object of an item with the specified 'id' and 'tag'."""
+        record = self._find(target_id)
+        # The item itself is checked first, the root object never is
+        while record is not None and record.depth:
+            if self._complete(record) and tag in record.tags:
+                return [self._load(record), record.path]
+            record = record.parent
+        return [None, []]
+
+class IndexedDecodeJson:
+    """
+    Answer queries from a binary index written next to the model (e.g. 954068.json.idx) and
+    memory-mapped on later runs, so reopening a model needs no parse. The index holds the byte
+    range, parent and path of every object with an 'id', the tag postings and the reference
+    postings. It is rebuilt when the model's size changes, or when its mtime changes and its
+    SHA-256 no longer matches. Objects are parsed from their byte range only when returned.
+    """
+    MAGIC = b'ELAIDX' + (b'LE' if sys.byteorder == 'little' else b'BE')
+    VERSION = 1
+    # magic, version, model size, model mtime_ns, model SHA-256, number of sections
+    _HEADER = struct.Struct('=8sqqq32sq')
+    _MTIME_OFFSET = 24
+    # Every section is an array of native int64 except the UTF-8 string blob at the end.
+    # Objects with an 'id' are numbered in document order and index the per object arrays.
+    _SECTIONS = (
+        'starts', 'ends', 'parents', 'exits', 'ids', 'subpaths',  # Per object, ids and subpaths are strings
+        'id_order',  # Numbers of the first object of each id, sorted by id
+        'tag_names', 'tag_offsets', 'tag_postings',  # Tags sorted by name, each with its numbers
+        'ref_keys', 'ref_offsets', 'ref_postings',  # Referenced ids sorted, each with (tag, number) pairs
+        'string_offsets', 'strings'
+    )
+    # Strings and the '{' '}' of objects, strings are matched whole so braces inside them are skipped
+    _OBJECT_TOKEN = re.compile(rb'"[^"\\]*(?:\\.[^"\\]*)*"|[{}]')
+
+    extract_guid = DecodeJson.extract_guid
+    resolve = DecodeJson.resolve
+    # Walk the model given to them, a whole model search parses json_data
+    search_parent_by_path = DecodeJson.search_parent_by_path
+    get_all_refs_to_object = DecodeJson.get_all_refs_to_object
+
+    def __init__(self, json_path, index_path=None, rebuild=False):
+        self.json_path = json_path
+        self.index_path = index_path or json_path + '.idx'
+        try:
+            with open(self.json_path, 'rb') as json_file:
+                stat = os.fstat(json_file.fileno())
+                self._map = mmap.mmap(json_file.fileno(), 0, access=mmap.ACCESS_READ)
+        except FileNotFoundError:
+            print(f"File {self.json_path} not found.")
+            sys.exit(1)  # Exit the program if the file is not found
+        except ValueError:
+            print(f"Failed to decode JSON from file {self.json_path}.")
+            sys.exit(1)  # Empty files cannot be mapped
+
+        self._index = None if rebuild else self._open_index(stat)
+        if self._index is None:
+            self._index = self._write_index(stat)
+        self._read_sections()
+        self._resolved = {}
+
+    def close(self):
+        # The section views hold the maps, release them first
+        for view in self._views:
+            view.release()
+        self._views = []
+        if isinstance(self._index, mmap.mmap):
+            self._index.close()
+        self._map.close()
+
+    @property
+    def json_data(self):
+        """The whole model, parsed on every access."""
+        return json.loads(self._map[:])
+
+    def _open_index(self, stat):
+        """Return the mapped index file if it matches the model, None if it has to be built."""
+        try:
+            with open(self.index_path, 'rb') as index_file:
+                index = mmap.mmap(index_file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return None
+        try:
+            magic, version, size, mtime_ns, digest, count = self._HEADER.unpack_from(index)
+        except struct.error:
+            index.close()
+            return None
+        if magic != self.MAGIC or version != self.VERSION or count != len(self._SECTIONS) or size != stat.st_size:
+            index.close()
+            return None
+        if mtime_ns != stat.st_mtime_ns:
+            # The model was touched or copied, its content decides
+            if hashlib.sha256(self._map).digest() != digest:
+                index.close()
+                return None
+            try:
+                with open(self.index_path, 'r+b') as index_file:
+                    index_file.seek(self._MTIME_OFFSET)
+                    index_file.write(struct.pack('=q', stat.st_mtime_ns))
+            except OSError:
+                pass  # Only means the hash is checked again next time
+        return index
+
+    def _write_index(self, stat):
+        """Build the index and store it next to the model. Returns its bytes."""
+        try:
+            data = self._build_index(stat)
+        except ValueError as e:
+            print(f"Failed to index JSON file {self.json_path}: {e}")
+            sys.exit(1)
+        # Renamed into place so a concurrent run never maps a half written index
+        try:
+            write_atomic(self.index_path, data)
+        except OSError as e:
+            print(f"Could not write the index file {self.index_path}: {e}", file=sys.stderr)
+        return data
+
+    def _object_offsets(self):
+        """
+        Return the start and end offsets of every object of the model, in document order, and the
+        positions of the objects in the order they are closed, which is the order the parser builds them.
+        """
+        starts = []
+        ends = []
+        closed = []
+        stack = []
+        for match in self._OBJECT_TOKEN.finditer(self._map):
+            first = match.group(0)[0]
+            if first == 0x7b:  # '{'
+                stack.append(len(starts))
+                starts.append(match.start())
+                ends.append(None)
+            elif first == 0x7d:  # '}'
+                position = stack.pop()
+                ends[position] = match.end()
+                closed.append(position)
+        return starts, ends, closed
+
+    @staticmethod
+    def _id_key(value):
+        # Ids are stored JSON encoded, so ids that are not strings keep their type
+        return json.dumps(value)
+
+    def _build_index(self, stat):
+        # Every object the parser builds, in order, including the ones a duplicate key later replaces
+        parsed = []
+        def object_pairs_hook(pairs):
+            parsed.append(dict(pairs))
+            return parsed[-1]
+        decoder = DecodeJson(self.json_path, object_pairs_hook)
+        starts, ends, closed = self._object_offsets()
+        if len(parsed) != len(closed):
+            raise ValueError("the objects of the file could not be located")
+
+        # path_index holds the objects with an 'id' in document order
+        objects = list(decoder.path_index.items())
+        numbers = {id(obj): number for number, (path, obj) in enumerate(objects)}
+
+        # Position of each numbered object among all the objects of the file
+        positions = {id(obj): position for obj, position in zip(parsed, closed) if id(obj) in numbers}
+
+        strings = {}
+        def string(text):
+            return strings.setdefault(text, len(strings))
+
+        sections = {name: array.array('q') for name in self._SECTIONS if name != 'strings'}
+        for number, (path, obj) in enumerate(objects):
+            parent = decoder.parent_index[id(obj)][0]
+            parent_number = numbers[id(parent)] if parent is not None else -1
+            parent_depth = len(objects[parent_number][0]) if parent is not None else 0
+            position = positions[id(obj)]
+            sections['starts'].append(starts[position])
+            sections['ends'].append(ends[position])
+            sections['parents'].append(parent_number)
+            sections['exits'].append(decoder.preorder_index[id(obj)][1])
+            sections['ids'].append(string(self._id_key(obj['id'])))
+            sections['subpaths'].append(string(json.dumps(list(path[parent_depth:]))))
+
+        id_order = sorted((self._id_key(key).encode('utf-8'), numbers[id(obj)]) for key, (obj, path) in decoder.id_index.items())
+        sections['id_order'].extend(number for key, number in id_order)
+
+        tags = sorted(decoder.tag_index, key=lambda tag: tag.encode('utf-8'))
+        tag_numbers = {tag: index for index, tag in enumerate(tags)}
+        sections['tag_offsets'].append(0)
+        for tag in tags:
+            sections['tag_names'].append(string(tag))
+            sections['tag_postings'].extend(decoder.tag_index[tag][0])
+            sections['tag_offsets'].append(len(sections['tag_postings']))
+
+        sections['ref_offsets'].append(0)
+        for target in sorted(decoder.refs_index, key=lambda target: target.encode('utf-8')):
+            sections['ref_keys'].append(string(target))
+            for tag, parents in decoder.refs_index[target].items():
+                for parent in parents:
+                    sections['ref_postings'].extend((tag_numbers[tag], numbers[id(parent)]))
+            sections['ref_offsets'].append(len(sections['ref_postings']) // 2)
+
+        blob = bytearray()
+        sections['string_offsets'].append(0)
+        for text in strings:
+            blob += text.encode('utf-8')
+            sections['string_offsets'].append(len(blob))
+
+        payloads = [sections[name].tobytes() for name in self._SECTIONS if name != 'strings'] + [bytes(blob)]
+        table = array.array('q')
+        offset = self._HEADER.size + 16 * len(payloads)
+        for payload in payloads:
+            table.extend((offset, len(payload)))
+            offset += len(payload)
+        header = self._HEADER.pack(self.MAGIC, self.VERSION, stat.st_size, stat.st_mtime_ns,
+                                   hashlib.sha256(self._map).digest(), len(payloads))
+        return header + table.tobytes() + b''.join(payloads)
+
+    def _read_sections(self):
+        view = memoryview(self._index)
+        table = view[self._HEADER.size:self._HEADER.size + 16 * len(self._SECTIONS)].cast('q')
+        self._views = [view, table]
+        sections = {}
+        for index, name in enumerate(self._SECTIONS):
+            section = view[table[2 * index]:table[2 * index] + table[2 * index + 1]]
+            sections[name] = section if name == 'strings' else section.cast('q')
+            self._views.append(sections[name])
+        self._starts = sections['starts']
+        self._ends = sections['ends']
+        self._parents = sections['parents']
+        self._exits = sections['exits']
+        self._ids = sections['ids']
+        self._subpaths = sections['subpaths']
+        self._id_order = sections['id_order']
+        self._tag_offsets = sections['tag_offsets']
+        self._tag_postings = sections['tag_postings']
+        self._ref_keys = sections['ref_keys']
+        self._ref_offsets = sections['ref_offsets']
+        self._ref_postings = sections['ref_postings']
+        self._string_offsets = sections['string_offsets']
+        self._strings = sections['strings']
+        # A handful of tags, looked up by name on every tag query
+        self._tags = {self._string(name): index for index, name in enumerate(sections['tag_names'])}
+        # Lookups repeat while rendering views, remember the ones already answered
+        self._numbers = {}
+        self._decoded_subpaths = {}
+
+    def _string_bytes(self, index):
+        return bytes(self._strings[self._string_offsets[index]:self._string_offsets[index + 1]])
+
+    def _string(self, index):
+        return self._string_bytes(index).decode('utf-8')
+
+    def _find_sorted(self, keys, string_of, key):
+        """Binary search 'key' among the strings string_of(item) of the sorted section 'keys'."""
+        low, high = 0, len(keys)
+        while low < high:
+            middle = (low + high) // 2
+            if self._string_bytes(string_of(keys[middle])) < key:
+                low = middle + 1
+            else:
+                high = middle
+        if low < len(keys) and self._string_bytes(string_of(keys[low])) == key:
+            return low
+        return None
+
+    def _number(self, target_id):
+        try:
+            return self._numbers[target_id]
+        except (KeyError, TypeError):
+            pass
+        try:
+            key = self._id_key(target_id).encode('utf-8')
+        except (TypeError, ValueError):
+            return None  # Ids that cannot be encoded cannot be in the index
+        position = self._find_sorted(self._id_order, lambda number: self._ids[number], key)
+        number = self._id_order[position] if position is not None else None
+        try:
+            self._numbers[target_id] = number
+        except TypeError:
+            pass  # Unhashable ids are not remembered
+        return number
+
+    def _load(self, number):
+        try:
+            return json.loads(self._map[self._starts[number]:self._ends[number]])
+        except json.JSONDecodeError:
+            print(f"Failed to decode JSON from file {self.json_path}.")
+            sys.exit(1)  # The model changed since it was opened
+
+    def _subpath(self, number):
+        index = self._subpaths[number]
+        subpath = self._decoded_subpaths.get(index)
+        if subpath is None:
+            subpath = self._decoded_subpaths[index] = json.loads(self._string(index))
+        return list(subpath)
+
+    def _path(self, number):
+        parts = []
+        while number != -1:
+            parts.append(self._subpath(number))
+            number = self._parents[number]
+        return [key for subpath in reversed(parts) for key in subpath]
+
+    def _is_root(self, number):
+        return self._parents[number] == -1 and not self._subpath(number)
+
+    def _tag_range(self, tag):
+        index = self._tags.get(tag) if isinstance(tag, str) else None
+        if index is None:
+            return 0, 0
+        return self._tag_offsets[index], self._tag_offsets[index + 1]
+
+    def _has_tag(self, number, tag):
+        start, end = self._tag_range(tag)
+        position = bisect.bisect_left(self._tag_postings, number, start, end)
+        return position < end and self._tag_postings[position] == number
+
+    def search_by_id(self, target_id, path=[]):
+        """Search for an object by its 'id' field, parsing only that object."""
+        number = self._number(target_id)
+        if number is None:
+            return None, path  # Return (None, path) if no matching object is found
+        return self._load(number), path + self._path(number)
+
+    def search_by_path(self, path):
+        """Search for an object by its path, parsing only the deepest indexed object on the path."""
+        try:
+            if not path:
+                return self.json_data  # Return the root object if the path is empty
+
+            keys = [str(key) for key in path]
+            # Walk down the objects with an 'id' whose path is a prefix of the requested one
+            number, depth = -1, 0
+            child, last = 0, len(self._starts) - 1
+            while child <= last:
+                subpath = self._subpath(child)
+                if keys[depth:depth + len(subpath)] == subpath:
+                    number, depth = child, depth + len(subpath)
+                    child, last = child + 1, self._exits[child]
+                else:
+                    child = self._exits[child] + 1
+
+            result = self._load(number) if number != -1 else self.json_data
+            for key in keys[depth:]:
+                if key.isdigit():
+                    key = int(key)  # Convert the string key to an integer
+                result = result[key]  # Navigate one level deeper in the dictionary
+            return result
+        except KeyError as e:
+            print(f"KeyError encountered: {e} in path {path}")
+            return None
+        except Exception as e:
+            print(f"Unexpected error during search: {e}")
+
+    def get_ids_by_tag(self, tag):
+        """Get a list of 'id' values for objects with the specified tag."""
+        start, end = self._tag_range(tag)
+        return [json.loads(self._string(self._ids[number])) for number in self._tag_postings[start:end]]
+
+    def get_ids_by_tag_within_parent_id(self, tag, parent_id):
+        """Get a list of 'id' values for objects with the specified tag within a parent object."""
+        number = self._number(parent_id)
+        if number is None:
+            return []
+        start, end = self._tag_range(tag)
+        # The parent's subtree is a contiguous range of numbers
+        low = bisect.bisect_left(self._tag_postings, number, start, end)
+        high = bisect.bisect_right(self._tag_postings, self._exits[number], low, end)
+        return [json.loads(self._string(self._ids[number])) for number in self._tag_postings[low:high]]
+
+    def return_parent(self, target_id, tag):
+        """Return the parent object of an item with the specified 'id' and 'tag'."""
+        number = self._number(target_id)
+        # The item itself is checked first, the root object never is
+        while number is not None and number != -1 and not self._is_root(number):
+            if self._has_tag(number, tag):
+                return [self._load(number), self._path(number)]
+            number = self._parents[number]
+        return [None, []]
+
+    def get_refs_to_object(self, target_id, tag):
+        """Get the parents with the specified tag that reference the object with 'target_id'."""
+        if not isinstance(target_id, str) or self._tags.get(tag) is None:
+            return []
+        position = self._find_sorted(self._ref_keys, lambda index: index, target_id.encode('utf-8'))
+        if position is None:
+            return []
+        tag_number = self._tags[tag]
+        pairs = self._ref_postings[2 * self._ref_offsets[position]:2 * self._ref_offsets[position + 1]]
+        return [self._load(pairs[index + 1]) for index in range(0, len(pairs), 2) if pairs[index] == tag_number]
@@ -1,35 +1,48 @@
 import argparse
-from decode_json import DecodeJson
+from concurrent.futures import ProcessPoolExecutor
+import contextlib
+from decode_json import CompactDecodeJson, DecodeJson, IndexedDecodeJson
+import io
 import markdown
 import os
 from json2plantuml import (
     PlantUMLConverter
 )       
+from plantuml_renderer import render_diagrams
+from preview_server import serve
 import re
+import sys
+from validate_json import check_model
 
-def evaluate_expression(expression):
-    # Remove any whitespace
-    expression = expression.replace(" ", "")
-
-    # Match the expression pattern
-    match = re.match(r"(\d+)([+\-*/])(\d+)", expression)
-    if not match:
-        raise ValueError("Invalid expression format")
-
-    num1, operator, num2 = match.groups()
-    num1, num2 = int(num1), int(num2)
-
-    if operator == '+':
-        result = num1 + num2
-    elif operator == '-':
-        result = num1 - num2
-    elif operator == '*':
-        result = num1 * num2
-    elif operator == '/':
-        result = num1 / num2
-    else:
-        raise ValueError("Unsupported operator")    
-    return int(result)
+class DepthFormula:
+    """A heading or loop depth such as '2', 'i' or 'i+1', parsed once at compile time."""
+    OPERATORS = {
+        '+': lambda a, b: a + b,
+        '-': lambda a, b: a - b,
+        '*': lambda a, b: a * b,
+        '/': lambda a, b: int(a / b),
+    }
+
+    def __init__(self, expression):
+        self.expression = expression
+        # Remove any whitespace
+        match = re.fullmatch(r"(i|\d+)(?:([+\-*/])(i|\d+))?", expression.replace(" ", ""))
+        if not match:
+            raise ValueError(f"Invalid depth expression '{expression}'")
+        left, self.operator, right = match.groups()
+        self.left = None if left == "i" else int(left)
+        self.right = None if right in (None, "i") else int(right)
+        self.right_is_depth = right == "i"
+        if self.operator == '/' and self.right == 0:
+            raise ValueError(f"Division by zero in depth expression '{expression}'")
+
+    def resolve(self, depth):
+        """Return the depth value, replacing 'i' with the current depth."""
+        left = depth if self.left is None else self.left
+        if self.operator is None:
+            return left
+        right = depth if self.right_is_depth else self.right
+        return self.OPERATORS[self.operator](left, right)
 
 class GenerateElement:
     def __init__(self, decoder, depth, element, *args):
@@ -44,6 +57,8 @@ class GenerateElement:
                 self.element = obj[0].get("label")
                 self.ref = True
         elif isinstance(self.element, list):
+            # Work on a copy so the labels never leak back into the shared model
+            self.element = list(self.element)
             for item in self.element:
                 obj = decoder.search_by_id(decoder.extract_guid(item))
                 #Check if obj is a list
@@ -65,23 +80,10 @@ class GenerateElement:
 class MDTitle(GenerateElement):
     def _generateElement(self):
         try:
-            # Remove all empty spaces from the arguments
-            self.args = [arg.strip() for arg in self.args if arg.strip()]       
-            # Convert the first argument to an integer if possible, otherwise default to 1
-            heading_level = self.args[0].strip()
-            #Check if it contains a "i" character
-            if "i" in heading_level:
-                #Replace the i character for the self.depth
-                heading_level = heading_level.replace("i", str(self.depth))
-
-            #Check if the heading_level contains an expression
-            if "+" in heading_level or "-" in heading_level or "*" in heading_level or "/" in heading_level:
-                heading_level = evaluate_expression(heading_level)
-            else:
-                heading_level = int(heading_level)
-    
-            # Check if "backtick" is in the arguments
-            backticks = "backtick" in self.args     
+            # The heading level formula and backtick flag are resolved when the blueprint is compiled
+            level, backticks = self.args
+            heading_level = level.resolve(self.depth)
+
             # If element is a string, replace newline characters with spaces
             if isinstance(self.element, str):
                 heading_text = self.element.replace("\n", " ")
@@ -159,176 +161,368 @@ class MDLink(GenerateElement):
       print(f"Error in MDLink: {e}")
       return f"{{Error in MDLink: {e}}}"
 
+class TextNode:
+    """Literal blueprint lines, emitted as they are."""
+    def __init__(self, text):
+        self.text = text
+
+class ElementNode:
+    """A '{{ type:key:args }}' placeholder rendered through one of the GenerateElement classes."""
+    def __init__(self, line, element_class, key, literal, args):
+        self.line = line
+        self.element_class = element_class
+        self.key = key
+        self.literal = literal
+        self.args = args
+
+class PlantUMLNode:
+    """A '{{ @plantuml }}' directive."""
+    def __init__(self, line):
+        self.line = line
+
+class RefNode:
+    """A '{{ @ref:tag }}' directive listing the parents with 'tag' that reference the element."""
+    def __init__(self, line, tag):
+        self.line = line
+        self.tag = tag
+
+class ForeachNode:
+    """A '{{ @foreach:tag.blueprint,...:depth }}' directive with its loop blueprints pre-compiled."""
+    def __init__(self, line, depth, searches):
+        self.line = line
+        self.depth = depth
+        self.searches = searches
+
+class CompiledBlueprint:
+    """A blueprint parsed once into a list of nodes that is walked for every rendered element."""
+    ELEMENTS = {
+        "title": MDTitle,
+        "text": MDText,
+        "list": MDList,
+        "image": MDImage,
+        "link": MDLink,
+    }
+
+    def __init__(self, blueprint_path):
+        self.blueprint_path = blueprint_path
+        self.nodes = []
+
+    def compile(self, blueprint_file, context):
+        """Parse the blueprint text, raising ValueError for any malformed placeholder."""
+        text = []
+        for lineno, line in enumerate(blueprint_file.split("\n"), start=1):
+            # If the line does not contain a placeholder it is copied as is
+            if not ("{{" in line and "}}" in line):
+                text.append(line + "\n\n")
+                continue
+            if text:
+                self.nodes.append(TextNode("".join(text)))
+                text = []
+            try:
+                self.nodes.append(self._compileLine(line, context))
+            except Exception as e:
+                raise ValueError(f"{self.blueprint_path}:{lineno}: {e}") from e
+        if text:
+            self.nodes.append(TextNode("".join(text)))
+
+    def _compileLine(self, line, context):
+        start_idx = line.find("{{") + 2
+        end_idx = line.find("}}")
+        placeholder = line[start_idx:end_idx]
+        arguments = placeholder.split(":")
+        type_data = arguments[0].strip()
+
+        if "@" not in type_data:
+            element_class = self.ELEMENTS.get(type_data)
+            if element_class is None:
+                raise ValueError(f"Invalid type '{type_data}'")
+            if len(arguments) < 2 or not arguments[1].strip():
+                raise ValueError(f"Missing data key for '{type_data}'")
+            key = arguments[1].strip()
+            #Check if data is a string surrounded by " "
+            literal = key[0] == '"' and key[-1] == '"'
+            if literal:
+                key = key[1:-1]
+            args = arguments[2:]
+            if element_class is MDTitle:
+                # Remove all empty spaces from the arguments
+                args = [arg.strip() for arg in args if arg.strip()]
+                if not args:
+                    raise ValueError("Missing heading level for 'title'")
+                args = (DepthFormula(args[0]), "backtick" in args)
+            return ElementNode(line, element_class, key, literal, tuple(args))
+
+        elif type_data == "@plantuml":
+            return PlantUMLNode(line)
+
+        elif type_data == "@ref":
+            if len(arguments) < 2 or not arguments[1].strip():
+                raise ValueError("Missing tag for '@ref'")
+            return RefNode(line, arguments[1].strip())
+
+        elif type_data == "@foreach":
+            if len(arguments) < 2 or len(arguments) > 3:
+                raise ValueError("Expected '@foreach:tag.blueprint' with an optional depth")
+            depth = DepthFormula(arguments[2].strip()) if len(arguments) == 3 else None
+            searches = []
+            for search in arguments[1].strip().split(","):
+                #Split the search by the . character
+                search_split = search.split(".")
+                if len(search_split) < 2 or not search_split[0].strip() or not search_split[1].strip():
+                    raise ValueError(f"Invalid search '{search.strip()}', expected 'tag.blueprint'")
+                tag = search_split[0].strip()
+                loop_blueprint_path = os.path.join(os.path.dirname(self.blueprint_path), f"{search_split[1].strip()}.md")
+                searches.append((tag, context.get_blueprint(loop_blueprint_path)))
+            return ForeachNode(line, depth, searches)
+
+        raise ValueError(f"Invalid type '{type_data}'")
+
+class GeneratorContext:
+    """Holds the state shared by a ViewGenerator and all of its nested @foreach generators."""
+    def __init__(self, json_path, decode=None):
+        self.json_path = json_path
+        self.decode = decode if decode is not None else DecodeJson(json_path)
+        self.blueprints = {}
+        # PlantUML text of every '@plantuml' rendered so far, keyed by the id used in '![](<id>.svg)'
+        self.diagrams = {}
+
+    def get_blueprint(self, blueprint_path):
+        """Return the compiled blueprint, reading and compiling the file only once."""
+        blueprint_path = os.path.abspath(blueprint_path)
+        blueprint = self.blueprints.get(blueprint_path)
+        if blueprint is None:
+            try:
+                with open(blueprint_path, "r") as file:
+                    blueprint_file = file.read()
+            except FileNotFoundError:
+                raise ValueError(f"Blueprint file not found: {blueprint_path}")
+            # Register before compiling so blueprints can loop over themselves
+            blueprint = CompiledBlueprint(blueprint_path)
+            self.blueprints[blueprint_path] = blueprint
+            try:
+                blueprint.compile(blueprint_file, self)
+            except Exception:
+                del self.blueprints[blueprint_path]
+                raise
+        return blueprint
+
 class ViewGenerator:
-    def __init__(self, json_path, id, blueprint_path, depth=1):
+    def __init__(self, json_path, id, blueprint_path, depth=1, context=None, pool=None, out=None):
         self.id = id
         self.jsonPath = json_path
-        self.decode = DecodeJson(json_path)
+        # Reuse the parent's loaded model and blueprints when called from a @foreach
+        self.context = context if context is not None else GeneratorContext(json_path)
+        self.decode = self.context.decode
         self.depth = depth
+        # Only the top-level generator fans its @foreach children out to the worker pool
+        self.pool = pool
         try:
-            self.item = self.decode.search_by_id(id)[0] if self.decode.search_by_id(id) else {}
+            # One lookup, the compact and indexed stores build the object again on every call
+            self.item = self.decode.search_by_id(id)[0]
         except Exception as e:
             print(f"Error decoding JSON: {e}")
             self.item = {}
-        self.md_file = ""
+        # The document is written to 'out' as it is produced; without one it is kept for md_file
+        self._buffer = io.StringIO() if out is None else None
+        self.out = out if out is not None else self._buffer
         self.blueprint_path = blueprint_path
-
-        # Open the blueprint file
-        try:
-            with open(blueprint_path, "r") as file:
-                self.blueprint_file = file.read()
-        except FileNotFoundError:
-            print("Blueprint file not found")
-            self.blueprint_file = ""
-        except Exception as e:
-            print(f"Error reading blueprint file: {e}")
-            self.blueprint_file = ""
+        self.blueprint = self.context.get_blueprint(blueprint_path)
 
         # Call the _decodeBlueprint method
         self._decodeBlueprint()
 
-    def _createMarkdownItem(self, type_data, data, arguments):
-        # Call the appropriate class based on the type
-        if type_data == "title":
-            element = MDTitle(self.decode, self.depth, data, *arguments[2:])
-        elif type_data == "text":
-            element = MDText(self.decode, self.depth, data)
-        elif type_data == "list":
-            element = MDList(self.decode, self.depth, data)
-        elif type_data == "image":
-            element = MDImage(self.decode, self.depth, data, *arguments[2:])
-        elif type_data == "link":
-            element = MDLink(self.decode, self.depth, data, *arguments[2:])
-        else:
-            print(f"Invalid type: {type_data}")
-            return None
+    @property
+    def md_file(self):
+        """The generated document, None when it was written to an output stream."""
+        return self._buffer.getvalue() if self._buffer is not None else None
 
-        # Append the generated element to the markdown file
-        self.md_file += element.result + "\n\n"
+    def _createMarkdownItem(self, node, data):
+        # Call the element class resolved at compile time
+        element = node.element_class(self.decode, self.depth, data, *node.args)
+
+        # Write the generated element to the markdown file
+        self.out.write(element.result + "\n\n")
         
-    def _processData(self, type_data, arguments, data):
+    def _processData(self, node, data):
         """
         Process the data based on the type and arguments.
         This function handles extracting data from the JSON and creating markdown items.
         """
         if isinstance(data, str):
-            self._createMarkdownItem(type_data, data, arguments)
+            self._createMarkdownItem(node, data)
         elif isinstance(data, list):
             if all(isinstance(item, str) for item in data):
-                self._createMarkdownItem(type_data, data, arguments)
+                self._createMarkdownItem(node, data)
             else:
                 print(f"Invalid data type in list: {data}")
         else:
             print(f"Invalid data type: {data}")
 
     def _decodeBlueprint(self):
-        try:
-            lines = self.blueprint_file.split("\n")
-            idx = 0
-
-            while idx < len(lines):
-                line = lines[idx]
-
-                # If the line contains a placeholder
-                if "{{" in line and "}}" in line:
-                    try:
-                        start_idx = line.find("{{") + 2
-                        end_idx = line.find("}}")
-                        placeholder = line[start_idx:end_idx]
-                        arguments = placeholder.split(":")
-                        type_data = arguments[0].strip()
-
-                        if "@" not in type_data:
-                            key = arguments[1].strip()
-                            #Check if data is a string surroudned by " "
-                            if key[0] == '"' and key[-1] == '"':
-                                data = key[1:-1]
-                            else:
-                                data = self.item.get(key, None)
-                                if data is None:
-                                    print(f"Data '{key}' not found")
-                                    idx += 1
-                                    continue
-                                # Call the new function to handle non-loop types
-                            self._processData(type_data, arguments, data)
-                            
-                        elif type_data == "@plantuml":
-                            plantuml_output =  PlantUMLConverter(self.item).plantuml_output
-                            plantuml_md = f"<!--\n{plantuml_output}\n-->\n![]({self.item.get('id')}.svg)\n"
-                            self.md_file += plantuml_md + "\n\n"
-                            
-                        elif type_data == "@ref":
-                            ref_key = arguments[1].strip()
-                            id = self.item.get("id")
-                            label = self.item.get("label", "No label")
-                            list_refs = self.decode.get_all_refs_to_object(id, self.decode.json_data, self.decode.json_data, ref_key)
-                            if not list_refs:
-                                self.md_file += f"`No references found for '{label}'`\n"
-                            for ref in list_refs:
-                                label = ref.get("label", "No label")
-                                #description = ref.get("description", "No description")[:60] + "..."
-                                #self.md_file += f"- **{label}**: {description}\n"
-                                anchor_label = label.lower().replace(" ", "-")
-                                self.md_file += f"- **[{label}](#{anchor_label})**\n\n"
-                                
-                        elif type_data == "@foreach":
-                            #Check if argument[2] exists
-                            if len(arguments) == 3:
-                                depth = arguments[2].strip()
-                                if "i" in depth:
-                                    #Replace the i character for the self.depth
-                                    depth = depth.replace("i", str(self.depth))
-                                self.depth = evaluate_expression(depth)
-                                
-                            searches = arguments[1].strip().split(",")
-                            # Iterate over the search queries
-                            for search in searches:
-                                #Split the search by the . character
-                                search_split = search.split(".")
-                                # Get the search tag
-                                tags = search_split[0].strip()
-                                # Get the blueprint_file
-                                blueprint_file = search_split[1]
-                                loop_blueprint_path = os.path.abspath(os.path.join(os.path.dirname(self.blueprint_path), f"{blueprint_file}.md"))
-                                ids = self.decode.get_ids_by_tag_within_parent_id(tags, self.item.get("id"))
-                                # Iterate over the ids
-                                for id in ids:
-                                    loop_generator = ViewGenerator(self.jsonPath, id, loop_blueprint_path, self.depth + 1)
-                                    # Append the loop markdown to the main markdown file
-                                    self.md_file += loop_generator.md_file
-                            
-                        else:
-                            print(f"Invalid type: {type_data}")
-
-                    except Exception as e:
-                        print(f"Error processing line '{line}': {e}")
-                        self.md_file += f"{{Error processing line: {e}}}\n"
-                else:
-                    self.md_file += line + "\n\n"
+        for node in self.blueprint.nodes:
+            if isinstance(node, TextNode):
+                self.out.write(node.text)
+                continue
 
-                idx += 1
+            try:
+                if isinstance(node, ElementNode):
+                    if node.literal:
+                        data = node.key
+                    else:
+                        data = self.item.get(node.key, None)
+                        if data is None:
+                            print(f"Data '{node.key}' not found")
+                            continue
+                    self._processData(node, data)
 
-        except Exception as e:
-            print(f"Error in _decodeBlueprint: {e}")
+                elif isinstance(node, PlantUMLNode):
+                    plantuml_output =  PlantUMLConverter(self.item).plantuml_output
+                    self.context.diagrams[self.item.get('id')] = plantuml_output
+                    plantuml_md = f"<!--\n{plantuml_output}\n-->\n![]({self.item.get('id')}.svg)\n"
+                    self.out.write(plantuml_md + "\n\n")
+
+                elif isinstance(node, RefNode):
+                    id = self.item.get("id")
+                    label = self.item.get("label", "No label")
+                    list_refs = self.decode.get_refs_to_object(id, node.tag)
+                    if not list_refs:
+                        self.out.write(f"`No references found for '{label}'`\n")
+                    for ref in list_refs:
+                        label = ref.get("label", "No label")
+                        #description = ref.get("description", "No description")[:60] + "..."
+                        #self.md_file += f"- **{label}**: {description}\n"
+                        anchor_label = label.lower().replace(" ", "-")
+                        self.out.write(f"- **[{label}](#{anchor_label})**\n\n")
+
+                elif isinstance(node, ForeachNode):
+                    if node.depth is not None:
+                        self.depth = node.depth.resolve(self.depth)
+                    # Iterate over the search queries
+                    for tag, loop_blueprint in node.searches:
+                        ids = self.decode.get_ids_by_tag_within_parent_id(tag, self.item.get("id"))
+                        if self.pool is not None and len(ids) > 1:
+                            # The children are independent, render them in the workers and keep their order
+                            count = len(ids)
+                            results = self.pool.map(_render_in_worker, ids, [loop_blueprint.blueprint_path] * count, [self.depth + 1] * count,
+                                                    chunksize=max(1, count // 32))
+                            for md_file, diagrams in results:
+                                self.context.diagrams.update(diagrams)
+                                self.out.write(md_file)
+                            continue
+                        # Iterate over the ids
+                        for id in ids:
+                            # The loop markdown is written straight into the main markdown file
+                            ViewGenerator(self.jsonPath, id, loop_blueprint.blueprint_path, self.depth + 1, self.context, out=self.out)
+
+            except Exception as e:
+                print(f"Error processing line '{node.line}': {e}")
+                self.out.write(f"{{Error processing line: {e}}}\n")
+
+# Model and compiled blueprints shared by every view rendered in a worker process
+_worker_context = None
+
+def _init_worker(json_path, store):
+    global _worker_context
+    # Workers open the model with the store the parent selected, with --index they only map the index it built
+    _worker_context = GeneratorContext(json_path, store(json_path))
+
+def _render_in_worker(id, blueprint_path, depth):
+    _worker_context.diagrams = {}
+    generator = ViewGenerator(_worker_context.json_path, id, blueprint_path, depth, _worker_context)
+    return generator.md_file, _worker_context.diagrams
+
+def serve_markdown(models, params):
+    """Preview server handler: render the element 'id' of the model 'json' with 'blueprint'."""
+    decode = models.get(params["json"])
+    generator = ViewGenerator(params["json"], params["id"], params["blueprint"], context=GeneratorContext(params["json"], decode))
+    if params.get("format", "md") == "html":
+        return markdown.markdown(generator.md_file)
+    return generator.md_file
 
 def main():
     # Set up argparse
     parser = argparse.ArgumentParser(description="Generate a Markdown file from a JSON input and blueprint.")
-    parser.add_argument('--json', type=str, required=True, help="Path to the JSON file")
-    parser.add_argument('--id', type=str, required=True, help="ID to search for in the JSON")
-    parser.add_argument('--blueprint', type=str, required=True, help="Path to the blueprint file")
+    parser.add_argument('--json', type=str, required=False, help="Path to the JSON file")
+    parser.add_argument('--id', type=str, required=False, help="ID to search for in the JSON")
+    parser.add_argument('--blueprint', type=str, required=False, help="Path to the blueprint file")
+    parser.add_argument('--view', nargs=3, action='append', metavar=('ID', 'BLUEPRINT', 'OUTPUT'),
+                        help="Render the element ID with BLUEPRINT into the OUTPUT file, can be repeated to render several views in one run")
     parser.add_argument('--format', type=str, default="md", help="Output format (md, html)")
+    parser.add_argument('-j', '--jobs', type=int, default=1, help="Number of worker processes rendering the top-level @foreach children")
+    parser.add_argument('--serve', action="store_true", help="Keep running and answer JSON-RPC requests on stdin/stdout")
+    store = parser.add_mutually_exclusive_group()
+    store.add_argument('--compact', action="store_true", help="Keep the model in the compact node store, for very large models")
+    store.add_argument('--index', action="store_true", help="Use the <json>.idx index next to the JSON file, building it if missing or stale")
+    parser.add_argument('--svg-dir', type=str, help="Render the '@plantuml' diagrams into this folder as <id>.svg")
+    parser.add_argument('--svg-cache', type=str, help="Folder of the SVG cache (default: <svg-dir>/.svg_cache)")
+    parser.add_argument('--plantuml', type=str, default="plantuml", help="Command that runs PlantUML, e.g. 'java -jar plantuml.jar'")
+    parser.add_argument('--plantuml-jobs', type=int, default=1, help="Number of PlantUML processes used to render the diagrams")
+    parser.add_argument('--validate', action="store_true", help="Check the model against elausa_aspice/schemas before generating")
+    parser.add_argument('-v', '--verbose', action="store_true", help="Print the generators' diagnostics, such as missing data, to stderr")
     args = parser.parse_args()
 
-    # Create a ViewGenerator instance with the provided arguments
-    generator = ViewGenerator(json_path=args.json, id=args.id, blueprint_path=args.blueprint)
-    output_data = generator.md_file
-    
-    if args.format == "html":
-        output_data = markdown.markdown(output_data)
-    else:
-        output_data = generator.md_file
-    print(output_data)
-    
+    if args.serve:
+        serve({"markdown": serve_markdown})
+        return
+    if not args.json or not (args.view or (args.id and args.blueprint)):
+        parser.error("the following arguments are required: --json, and --id with --blueprint or --view")
+
+    # A view without an output file is printed
+    views = [tuple(view) for view in args.view or []]
+    if args.id and args.blueprint:
+        views.insert(0, (args.id, args.blueprint, None))
+
+    # The model, the compiled blueprints and the workers are shared by every view
+    pool = None
+    stdout = sys.stdout
+    try:
+        if args.validate:
+            check_model(args.json)
+        store = CompactDecodeJson if args.compact else IndexedDecodeJson if args.index else DecodeJson
+        context = GeneratorContext(args.json, store(args.json))
+        # Malformed blueprints are reported before anything is written
+        for id, blueprint, output in views:
+            context.get_blueprint(blueprint)
+        if args.jobs > 1:
+            pool = ProcessPoolExecutor(max_workers=args.jobs, initializer=_init_worker, initargs=(args.json, store))
+
+        # stdout only carries the document, the generators' diagnostics are not errors of the run:
+        # they go to stderr with --verbose and are dropped otherwise
+        with contextlib.redirect_stdout(sys.stderr if args.verbose else io.StringIO()):
+            for id, blueprint, output in views:
+                if args.format == "html":
+                    # HTML is converted from the whole document, it cannot be streamed
+                    generator = ViewGenerator(args.json, id, blueprint, context=context, pool=pool)
+                    output_data = markdown.markdown(generator.md_file)
+                    if output is None:
+                        stdout.write(output_data + "\n")
+                    else:
+                        with open(output, 'w', encoding='utf-8') as output_file:
+                            output_file.write(output_data)
+                elif output is None:
+                    # Markdown is written as it is generated
+                    ViewGenerator(args.json, id, blueprint, context=context, pool=pool, out=stdout)
+                    stdout.write("\n")
+                else:
+                    with open(output, 'w', encoding='utf-8') as output_file:
+                        ViewGenerator(args.json, id, blueprint, context=context, pool=pool, out=output_file)
+                if output is not None:
+                    print(f"View {id} has been written to {output}", file=stdout)
+    except ValueError as e:
+        print(f"Error in blueprint: {e}", file=sys.stderr)
+        sys.exit(1)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    if args.svg_dir:
+        # Only diagrams whose text changed since the last build are rendered
+        try:
+            render_diagrams(context.diagrams, args.svg_dir, args.svg_cache or os.path.join(args.svg_dir, '.svg_cache'),
+                            args.plantuml, args.plantuml_jobs)
+        except (OSError, RuntimeError) as e:
+            print(f"Error rendering diagrams: {e}", file=sys.stderr)
+            sys.exit(1)
+
 if __name__ == "__main__":
     main()
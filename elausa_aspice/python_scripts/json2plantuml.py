@@ -1,6 +1,8 @@
-from decode_json import DecodeJson
+from decode_json import DecodeJson, IndexedDecodeJson, StreamingDecodeJson
 import argparse
 import sys
+from preview_server import serve
+from validate_json import check_model
 
 # Define colors array
 colors = [
@@ -47,18 +49,41 @@ class PlantUMLConverter:
         except Exception as e:  # Catching the general exception
             raise RuntimeError(f"Failed to generate PlantUML: {e}")
         
-        
+def serve_plantuml(models, params):
+    """Preview server handler: render the element 'id' of the model 'file'."""
+    json_data, path = models.get(params["file"]).search_by_id(params["id"])
+    if json_data is None:
+        raise ValueError(f"ID {params['id']} not found")
+    return PlantUMLConverter(json_data).plantuml_output
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Convert JSON to PlantUML")
-    parser.add_argument("-f", "--file", required=True, help="Path to the JSON file")
-    parser.add_argument("-i", "--id", required=True, help="ID to search for in the JSON")
+    parser.add_argument("-f", "--file", required=False, help="Path to the JSON file")
+    parser.add_argument("-i", "--id", required=False, help="ID to search for in the JSON")
     parser.add_argument("-o", "--output", required=False, help="Where to store the PlantUML file")
+    parser.add_argument("--serve", action="store_true", help="Keep running and answer JSON-RPC requests on stdin/stdout")
+    parser.add_argument("--stream", action="store_true", help="Scan the JSON file only as far as needed instead of loading it whole")
+    parser.add_argument("--index", action="store_true", help="Use the <file>.idx index next to the JSON file, building it if missing or stale")
+    parser.add_argument("--validate", action="store_true", help="Check the model against elausa_aspice/schemas before converting")
 
     args = parser.parse_args()
 
+    if args.serve:
+        serve({"plantuml": serve_plantuml})
+        sys.exit(0)
+    if not args.file or not args.id:
+        parser.error("the following arguments are required: -f/--file, -i/--id")
+
     try:
+        if args.validate:
+            check_model(args.file)
         #Read the json
-        decoder = DecodeJson(args.file)
+        if args.index:
+            decoder = IndexedDecodeJson(args.file)
+        elif args.stream:
+            decoder = StreamingDecodeJson(args.file)
+        else:
+            decoder = DecodeJson(args.file)
         json_data, path = decoder.search_by_id(args.id)
         converter = PlantUMLConverter(json_data)
         
@@ -0,0 +1,151 @@
+import argparse
+import hashlib
+import os
+import shlex
+import subprocess
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from file_writer import write_atomic, write_if_changed
+
+# Written by PlantUML after each diagram in -pipe mode, used to split the SVGs of a batch
+PIPE_DELIMITER = "___ELAUSA_PLANTUML_DIAGRAM_END___"
+# Texts PlantUML draws in the image of a diagram it could not render
+ERROR_MARKERS = ("Syntax Error?", "syntax error", "An error has occured", "An error has occurred")
+# Shown for a diagram without any PlantUML text, PlantUML itself renders nothing for it
+EMPTY_SVG = '<svg xmlns="http://www.w3.org/2000/svg" width="0" height="0"/>\n'
+
+def diagram_hash(source):
+    """Key of a diagram in the SVG cache, a hash of its PlantUML text."""
+    return hashlib.sha256(source.encode('utf-8')).hexdigest()
+
+class SvgCache:
+    """SVGs rendered by earlier builds, stored as <cache_dir>/<diagram hash>.svg."""
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.svg")
+
+    def get(self, key):
+        try:
+            with open(self._path(key), 'r', encoding='utf-8') as svg_file:
+                return svg_file.read()
+        except FileNotFoundError:
+            return None
+
+    def put(self, key, svg):
+        # Renamed into place so a concurrent build never reads a half written SVG
+        write_atomic(self._path(key), svg)
+
+def is_error_svg(svg):
+    """True if the SVG is the error image PlantUML draws for a diagram it could not render."""
+    return any(marker in svg for marker in ERROR_MARKERS)
+
+def render_batch(sources, plantuml_command="plantuml"):
+    """
+    Render several diagrams with a single PlantUML process, fed through stdin in -pipe mode.
+    Returns (svgs, oks), oks[i] is False when PlantUML drew an error image for sources[i]. Empty
+    sources are not sent to PlantUML, which renders nothing for them, and get EMPTY_SVG.
+    """
+    svgs = [EMPTY_SVG] * len(sources)
+    oks = [True] * len(sources)
+    rendered = [index for index, source in enumerate(sources) if source.strip()]
+    if not rendered:
+        return svgs, oks
+
+    command = shlex.split(plantuml_command) + ["-tsvg", "-charset", "UTF-8", "-pipe", "-pipedelimitor", PIPE_DELIMITER]
+    stdin = "".join(sources[index] if sources[index].endswith("\n") else sources[index] + "\n" for index in rendered)
+    try:
+        result = subprocess.run(command, input=stdin, capture_output=True, text=True, encoding='utf-8')
+    except FileNotFoundError:
+        raise RuntimeError(f"PlantUML executable not found: {plantuml_command}")
+
+    batch_svgs = [svg.strip() + "\n" for svg in result.stdout.split(PIPE_DELIMITER)[:-1]]
+    if len(batch_svgs) != len(rendered):
+        raise RuntimeError(f"PlantUML rendered {len(batch_svgs)} of {len(rendered)} diagrams: {result.stderr.strip()}")
+    batch_oks = [not is_error_svg(svg) for svg in batch_svgs]
+    # PlantUML failed without drawing an error image, no SVG of the batch can be trusted
+    if result.returncode != 0 and all(batch_oks):
+        batch_oks = [False] * len(rendered)
+    for index, svg, ok in zip(rendered, batch_svgs, batch_oks):
+        svgs[index] = svg
+        oks[index] = ok
+    return svgs, oks
+
+def render_diagrams(diagrams, output_path, cache_path, plantuml_command="plantuml", jobs=1):
+    """
+    Write <output_path>/<name>.svg for every {name: PlantUML text} in diagrams.
+    Diagrams found in the cache are not rendered again, the others are split over at most 'jobs'
+    PlantUML processes. Returns {name: 'cached' or 'rendered'}.
+    """
+    cache = SvgCache(cache_path)
+    keys = {name: diagram_hash(source) for name, source in diagrams.items()}
+    svgs = {}
+    pending = {}
+    for name, key in keys.items():
+        if key in svgs or key in pending:
+            continue
+        svg = cache.get(key)
+        if svg is None:
+            pending[key] = diagrams[name]
+        else:
+            svgs[key] = svg
+
+    if pending:
+        pending_keys = list(pending)
+        jobs = max(1, min(jobs, len(pending_keys)))
+        batches = [pending_keys[index::jobs] for index in range(jobs)]
+        # Each batch is one PlantUML JVM, threads only wait on the processes
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            results = executor.map(lambda batch: render_batch([pending[key] for key in batch], plantuml_command), batches)
+            for batch, (batch_svgs, oks) in zip(batches, results):
+                for key, svg, ok in zip(batch, batch_svgs, oks):
+                    svgs[key] = svg
+                    # Error images are shown but not cached, so the next build tries again
+                    if ok:
+                        cache.put(key, svg)
+
+    os.makedirs(output_path, exist_ok=True)
+    statuses = {}
+    for name, key in keys.items():
+        write_if_changed(os.path.join(output_path, f"{name}.svg"), svgs[key])
+        statuses[name] = 'rendered' if key in pending else 'cached'
+    return statuses
+
+def find_sources(paths):
+    """Return {name: PlantUML text} for the given .puml files and the .puml files found under the given folders."""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, names in os.walk(path):
+                files += [os.path.join(root, name) for name in sorted(names) if name.lower().endswith('.puml')]
+        else:
+            files.append(path)
+
+    diagrams = {}
+    for file_path in files:
+        with open(file_path, 'r', encoding='utf-8') as puml_file:
+            diagrams[os.path.splitext(os.path.basename(file_path))[0]] = puml_file.read()
+    return diagrams
+
+def main():
+    parser = argparse.ArgumentParser(description="Render PlantUML sources to SVG, reusing the SVGs of unchanged diagrams.")
+    parser.add_argument('sources', nargs='+', help=".puml files or folders containing them")
+    parser.add_argument('-o', '--output', required=True, help="Folder where the SVG files are written")
+    parser.add_argument('--cache', help="Folder of the SVG cache (default: <output>/.svg_cache)")
+    parser.add_argument('--plantuml', default="plantuml", help="Command that runs PlantUML, e.g. 'java -jar plantuml.jar'")
+    parser.add_argument('-j', '--jobs', type=int, default=1, help="Number of PlantUML processes")
+    args = parser.parse_args()
+
+    try:
+        diagrams = find_sources(args.sources)
+        statuses = render_diagrams(diagrams, args.output, args.cache or os.path.join(args.output, '.svg_cache'), args.plantuml, args.jobs)
+    except (OSError, RuntimeError) as e:
+        print(f"Error rendering diagrams: {e}", file=sys.stderr)
+        sys.exit(1)
+    rendered = sum(1 for status in statuses.values() if status == 'rendered')
+    print(f"{len(statuses)} diagrams written to {args.output}, {rendered} rendered, {len(statuses) - rendered} from cache.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+import contextlib
+import json
+import os
+import sys
+from decode_json import DecodeJson
+
+class ModelCache:
+    """Keeps decoded models in memory, reloading a file only when its mtime or size changes."""
+    def __init__(self):
+        self.models = {}
+
+    def get(self, json_path):
+        """Return the DecodeJson for json_path, loading it again only if the file changed."""
+        json_path = os.path.abspath(json_path)
+        stat = os.stat(json_path)
+        signature = (stat.st_mtime_ns, stat.st_size)
+        cached = self.models.get(json_path)
+        if cached is None or cached[0] != signature:
+            cached = (signature, DecodeJson(json_path))
+            self.models[json_path] = cached
+        return cached[1]
+
+def serve(methods, input_stream=None, output_stream=None):
+    """
+    Answer JSON-RPC requests, one JSON object per line, until the input is closed.
+    Each handler in 'methods' is called as handler(models, params) and returns the result.
+    """
+    input_stream = input_stream or sys.stdin
+    output_stream = output_stream or sys.stdout
+    models = ModelCache()
+
+    for line in input_stream:
+        if not line.strip():
+            continue
+        request_id = None
+        try:
+            request = json.loads(line)
+            request_id = request.get("id")
+            method = request.get("method")
+            if method == "shutdown":
+                _write_response(output_stream, request_id, result="ok")
+                break
+            if method not in methods:
+                raise ValueError(f"Unknown method: {method}")
+            # The generators print their diagnostics, keep them out of the response stream
+            with contextlib.redirect_stdout(sys.stderr):
+                result = methods[method](models, request.get("params", {}))
+            _write_response(output_stream, request_id, result=result)
+        except SystemExit:
+            # DecodeJson exits on unreadable files, that must not stop the server
+            _write_response(output_stream, request_id, error="Failed to load the JSON file")
+        except Exception as e:
+            _write_response(output_stream, request_id, error=str(e) or type(e).__name__)
+
+def _write_response(output_stream, request_id, result=None, error=None):
+    response = {"jsonrpc": "2.0", "id": request_id}
+    if error is not None:
+        response["error"] = {"code": -32000, "message": error}
+    else:
+        response["result"] = result
+    output_stream.write(json.dumps(response) + "\n")
+    output_stream.flush()
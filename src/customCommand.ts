@@ -1,7 +1,7 @@
 import * as fs from 'fs';
 import * as path from 'path';
 import * as vscode from 'vscode';
-import { exec as execCallback } from 'child_process';
+import { exec as execCallback, spawn, ChildProcessWithoutNullStreams } from 'child_process';
 import { promisify } from 'util';
 
 // Interfaces
@@ -50,8 +50,7 @@ export async function runCustomCommand(json: { [key: string]: any }, command: Co
             args = substitutePlaceholders(step.args, json, stdout, filepath);
 
             if (step.tool === 'shell') {
-                const commandString = args.join(' ');
-                const result = await exec(commandString);
+                const result = await runShellStep(args);
                 stdout = result.stdout;
                 stderr = result.stderr;
 
@@ -104,30 +103,160 @@ export async function runCustomCommand(json: { [key: string]: any }, command: Co
     }
 }
 
-// Function to run the Python script and capture its output
-async function runPythonScript(pythonScriptPath: string, jsonPath: string, id: string) {
-    try {
-        const command = `python ${pythonScriptPath} -f ${jsonPath} -i ${id}`;
-        const { stdout, stderr } = await exec(command);
+// Raised when a preview server exits before answering, e.g. a script without a --serve mode
+class PreviewServerUnavailableError extends Error {}
+
+// Long-running Python preview server answering JSON-RPC requests over stdin/stdout
+class PreviewServer {
+    private process: ChildProcessWithoutNullStreams;
+    private nextId = 1;
+    private answered = false;
+    private buffer = '';
+    private pending = new Map<number, { resolve: (result: any) => void; reject: (error: Error) => void }>();
+
+    constructor(private pythonScriptPath: string) {
+        this.process = spawn('python', [pythonScriptPath, '--serve']);
+        this.process.stdout.setEncoding('utf8');
+        this.process.stdout.on('data', (chunk: string) => this.onData(chunk));
+        this.process.stderr.on('data', (chunk: Buffer) => console.error(`Preview server: ${chunk}`));
+        this.process.on('exit', () => this.onExit());
+        this.process.on('error', (e) => this.onExit(e));
+    }
 
-        console.log(stdout);
+    request(method: string, params: { [key: string]: any }): Promise<any> {
+        const id = this.nextId++;
+        return new Promise((resolve, reject) => {
+            this.pending.set(id, { resolve, reject });
+            this.process.stdin.write(JSON.stringify({ jsonrpc: '2.0', id, method, params }) + '\n');
+        });
+    }
 
-        if (stderr) {
-            console.error(`Error from Python script: ${stderr}`);
-            throw new Error(`Error from Python script: ${stderr}`);
+    dispose() {
+        this.process.kill();
+    }
+
+    private onData(chunk: string) {
+        // Responses are one JSON object per line
+        this.buffer += chunk;
+        let newline: number;
+        while ((newline = this.buffer.indexOf('\n')) >= 0) {
+            const line = this.buffer.slice(0, newline);
+            this.buffer = this.buffer.slice(newline + 1);
+            if (!line.trim()) {
+                continue;
+            }
+            const response = JSON.parse(line);
+            this.answered = true;
+            const request = this.pending.get(response.id);
+            if (!request) {
+                continue;
+            }
+            this.pending.delete(response.id);
+            if (response.error) {
+                request.reject(new Error(response.error.message));
+            } else {
+                request.resolve(response.result);
+            }
         }
-    } catch (e) {
-        console.error(`Error executing Python script: ${e}`);
-        throw e;
+    }
+
+    private onExit(error?: Error) {
+        previewServers.delete(this.pythonScriptPath);
+        if (!this.answered) {
+            // The script cannot serve, later previews run it once per request
+            scriptsWithoutServer.add(this.pythonScriptPath);
+            error = new PreviewServerUnavailableError(`Preview server ${this.pythonScriptPath} exited at startup`);
+        }
+        for (const request of this.pending.values()) {
+            request.reject(error ?? new Error('Preview server exited'));
+        }
+        this.pending.clear();
     }
 }
 
-// Parse JSON file and generate PlantUML content
-export async function JSON2plantuml(pythonScriptPath: string, jsonPath: string, id: string) {
-    try {
-        // Run the Python script and capture the output
-        await runPythonScript(pythonScriptPath, jsonPath, id);
-    } catch (e) {
-        console.error(`Error in JSON2plantuml: ${e}`);
+// One preview server per script, started on first use and reused afterwards
+const previewServers = new Map<string, PreviewServer>();
+// Scripts whose preview server exited before answering
+const scriptsWithoutServer = new Set<string>();
+
+function getPreviewServer(pythonScriptPath: string): PreviewServer {
+    let server = previewServers.get(pythonScriptPath);
+    if (!server) {
+        server = new PreviewServer(pythonScriptPath);
+        previewServers.set(pythonScriptPath, server);
+    }
+    return server;
+}
+
+// Stop every running preview server
+export function disposePreviewServers() {
+    for (const server of previewServers.values()) {
+        server.dispose();
+    }
+    previewServers.clear();
+}
+
+// Scripts with a --serve mode: the method answering a preview and the request parameter of each option
+const previewScripts = new Map<string, { method: string; options: Map<string, string> }>([
+    ['generate_view_md.py', { method: 'markdown', options: new Map([['--json', 'json'], ['--id', 'id'], ['--blueprint', 'blueprint'], ['--format', 'format']]) }],
+    ['json2plantuml.py', { method: 'plantuml', options: new Map([['-f', 'file'], ['--file', 'file'], ['-i', 'id'], ['--id', 'id']]) }],
+]);
+
+// The preview server request of 'python <script> <options>', undefined when the script or one of its options cannot be served
+function previewRequest(args: string[]): { script: string; method: string; params: { [key: string]: string } } | undefined {
+    if (args[0] !== 'python' || args.length < 2 || args.length % 2 !== 0) {
+        return undefined;
+    }
+    const script = args[1];
+    // Schemas use Windows paths, win32 splits on both separators
+    const preview = previewScripts.get(path.win32.basename(script));
+    if (!preview) {
+        return undefined;
+    }
+    const params: { [key: string]: string } = {};
+    for (let index = 2; index < args.length; index += 2) {
+        const key = preview.options.get(args[index]);
+        if (!key) {
+            return undefined;
+        }
+        params[key] = args[index + 1];
+    }
+    return { script, method: preview.method, params };
+}
+
+// Run a shell command with 'input' on its standard input
+function execWithInput(command: string, input: string): Promise<{ stdout: string; stderr: string }> {
+    return new Promise((resolve, reject) => {
+        const child = execCallback(command, (error, stdout, stderr) => {
+            if (error) {
+                reject(error);
+            } else {
+                resolve({ stdout, stderr });
+            }
+        });
+        child.stdin?.end(input);
+    });
+}
+
+// Run a shell step, answering its Python preview part from the script's preview server when it has one
+async function runShellStep(args: string[]): Promise<{ stdout: string; stderr: string }> {
+    // Only the command before a pipe is the preview, the rest of the pipeline reads its output
+    const pipe = args.indexOf('|');
+    const request = previewRequest(pipe >= 0 ? args.slice(0, pipe) : args);
+    if (request && !scriptsWithoutServer.has(request.script)) {
+        try {
+            // The server keeps the model loaded and only reloads it when the file changes
+            const output: string = await getPreviewServer(request.script).request(request.method, request.params);
+            if (pipe < 0) {
+                return { stdout: output, stderr: '' };
+            }
+            return await execWithInput(args.slice(pipe + 1).join(' '), output);
+        } catch (e) {
+            if (!(e instanceof PreviewServerUnavailableError)) {
+                throw e;
+            }
+        }
     }
+    // Scripts without a --serve mode and every other command run once per step
+    return await exec(args.join(' '));
 }
\ No newline at end of file
@@ -3,7 +3,7 @@ import * as path from 'path';
 import * as fs from 'fs';
 import { ItemTreeProvider, Item } from './tree';
 import $RefParser from "@apidevtools/json-schema-ref-parser";
-import { runCustomCommand, Command } from './customCommand';
+import { runCustomCommand, Command, disposePreviewServers } from './customCommand';
 import { JsonGenerator } from './JsonGenerator';
 
 let schemas: any = [];
@@ -513,5 +513,5 @@ export function activate(context: vscode.ExtensionContext) {
 }
 
 export function deactivate() {
-    // Add any cleanup logic here if needed
+    disposePreviewServers();
 }
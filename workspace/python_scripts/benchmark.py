@@ -0,0 +1,297 @@
+import argparse
+import contextlib
+import datetime
+import glob
+import io
+import json
+import math
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+import uuid
+from code_generator import build_link_table, modify_templates, read_file_content
+from decode_json import DecodeJson, StreamingDecodeJson
+from json2plantuml import (
+    PlantUMLLayerConverter,
+    PlantUMLComponentConverter,
+    PlantUMLClassConverter,
+    PlantUMLHSMConverter
+)
+
+SCRIPTS_PATH = os.path.dirname(os.path.abspath(__file__))
+SCHEMAS_PATH = os.path.join(SCRIPTS_PATH, '..', 'schemas')
+
+class SyntheticModel:
+    """
+    Build a project shaped like workspace/schemas: layers with interfaces and components,
+    components with ports, subcomponents and libraries, and libraries with an HSM.
+    Fixed fields such as 'tags' and 'icon' are taken from the schemas' 'const' values.
+    """
+    def __init__(self, components, ports=4, members=10, states=6, seed=0):
+        self.random = random.Random(seed)
+        self.constants = self._load_constants()
+        self.ports = ports
+        self.members = members
+        self.states = states
+        self.nodes = 0
+        self.types = [self._node('primitivetypes', name) for name in ['int', 'float', 'uint8_t', 'char', 'void', 'bool']]
+        # At most 20 components per layer
+        layer_count = max(1, math.ceil(components / 20))
+        layers = [self._layer(index, len(range(index, components, layer_count))) for index in range(layer_count)]
+        self.data = self._node('profile', 'benchmark', **{
+            '$model': 'profile.model.json',
+            'version': '',
+            'documentation': '',
+            'Requirements': [],
+            'Architecture': layers,
+            'Integration Tests': [],
+            'Qualification Tests': [],
+            '$links': self.types,
+        })
+
+    def _load_constants(self):
+        constants = {}
+        for schema_path in glob.glob(os.path.join(SCHEMAS_PATH, '*.model.json')):
+            with open(schema_path, 'r', encoding='utf-8') as schema_file:
+                schema = json.load(schema_file)
+            properties = schema.get('properties', {})
+            name = os.path.basename(schema_path)[:-len('.model.json')]
+            constants[name] = {key: value['const'] for key, value in properties.items()
+                               if isinstance(value, dict) and 'const' in value}
+        return constants
+
+    def _id(self):
+        return str(uuid.UUID(int=self.random.getrandbits(128)))
+
+    def _ref(self, node):
+        return f"${{id:{node['id']}}}"
+
+    def _node(self, schema, label, **fields):
+        self.nodes += 1
+        node = {'id': self._id(), 'label': label}
+        node.update(self.constants.get(schema, {}))
+        node.update(fields)
+        return node
+
+    def _layer(self, index, components):
+        interfaces = [self._node('interface', f'if{index}_{i}', documentation='') for i in range(max(1, self.ports))]
+        return self._node('layer', f'layer{index}', documentation='', layers=[], interfaces=interfaces,
+                          components=[self._component(f'c{index}_{i}', interfaces, depth=0) for i in range(max(1, components))])
+
+    def _ports(self, label, interfaces):
+        return [self._node('port', f'{label}_p{i}', documentation='', direction=['in', 'out'][i % 2],
+                           interface=self._ref(interfaces[i % len(interfaces)]), use='')
+                for i in range(self.ports)]
+
+    def _component(self, label, interfaces, depth):
+        subcomponents = [self._component(f'{label}_{i}', interfaces, depth + 1) for i in range(2)] if depth == 0 else []
+        return self._node('component', label, documentation='', requirements=[],
+                          ports=self._ports(label, interfaces), components=subcomponents,
+                          libraries=[self._library(f'{label}_lib')])
+
+    def _datatype(self):
+        return self.random.choice(self.types)['id']
+
+    def _library(self, label):
+        count = self.members
+        visibility = lambda i: ['public', 'private'][i % 2]
+        variables = [self._node('variable', f'v{i}', datatype=self._datatype(), visibility=visibility(i),
+                                isPointer=i % 3 == 0, isConst=i % 4 == 0, isVolatile=False,
+                                defaultValue=[], documentation=f'Variable {i}')
+                     for i in range(count)]
+        funcions = [self._node('funcio', f'f{i}', visibility=visibility(i), documentation=f'Function {i}', diagrams=[],
+                               returntype={'datatype': self._datatype()},
+                               parameters=[self._node('parameter', f'p{j}', datatype=self._datatype(),
+                                                      isPointer=False, isConst=j % 2 == 0, isPointerConst=False)
+                                           for j in range(3)])
+                    for i in range(count)]
+        datastructures = [self._node('datastructure', f'{label}_s{i}', type='struct', visibility=visibility(i), documentation='',
+                                     members=[self._node('datamember', f'm{j}', datatype=self._datatype(), isPointer=False,
+                                                         isConst=False, isVolatile=False, documentation='')
+                                              for j in range(3)])
+                          for i in range(max(1, count // 5))]
+        typedefs = [self._node('typedefs', f'{label}_t{i}', datatype=self._datatype(), visibility=visibility(i), documentation='')
+                    for i in range(max(1, count // 5))]
+        enumerators = [self._node('enumerator', f'{label}_e{i}', visibility=visibility(i),
+                                  members=[self._node('enummember', f'{label}_e{i}_{j}', value=str(j)) for j in range(3)])
+                       for i in range(max(1, count // 5))]
+        return self._node('library', label, documentation='', variables=variables, funcions=funcions,
+                          datastructures=datastructures, typedefs=typedefs, enumerators=enumerators, macros=[],
+                          **{'public dependencies': [], 'private dependencies': [], 'HSM': [self._hsm(f'{label}_hsm')], 'Unit Tests': []})
+
+    def _hsm(self, label):
+        events = [self._node('event', f'{label}_ev{i}') for i in range(3)]
+        top = [self._node('state', f'{label}_s{i}', documentation='', isInit=i == 0, isTerminated='',
+                          states=[], transitions=[], guards=[], hsms=[])
+               for i in range(max(1, self.states // 2))]
+        # Half of the states are nested one level below the top states
+        for i in range(self.states - len(top)):
+            parent = top[i % len(top)]
+            parent['states'].append(self._node('state', f'{parent["label"]}_{i}', documentation='', isInit=not parent['states'],
+                                               isTerminated='', states=[], transitions=[], guards=[], hsms=[]))
+        every_state = top + [child for state in top for child in state['states']]
+        for index, state in enumerate(every_state):
+            target = every_state[(index + 1) % len(every_state)]
+            state['transitions'].append(self._node('transition', f'{state["label"]}_t', event=self._ref(events[index % len(events)]),
+                                                   transition={'to': self._ref(target)}))
+        return self._node('hsm', label, States=top, Events=events, Activities=[])
+
+def _nodes_with_tag(data, tag, found):
+    if isinstance(data, dict):
+        if tag in data.get('tags', []):
+            found.append(data)
+        for value in data.values():
+            _nodes_with_tag(value, tag, found)
+    elif isinstance(data, list):
+        for item in data:
+            _nodes_with_tag(item, tag, found)
+    return found
+
+def benchmarks(model_path, model, output_path):
+    """Return {name: (function, items)}, each function runs one entry point over the whole model."""
+    decoder = DecodeJson(model_path)
+    ids = list(decoder.id_index)
+    layers = _nodes_with_tag(model.data, 'layer', [])
+    components = _nodes_with_tag(model.data, 'component', [])
+    libraries = _nodes_with_tag(model.data, 'lib', [])
+    hsms = _nodes_with_tag(model.data, 'hsm', [])
+    c_template = read_file_content(os.path.join(SCRIPTS_PATH, 'elausa_template.c'))
+    h_template = read_file_content(os.path.join(SCRIPTS_PATH, 'elausa_template.h'))
+    links = build_link_table(model.types)
+
+    def convert(converter, items):
+        return lambda: [converter(item, decoder).generate() for item in items]
+
+    def search_all():
+        for id in ids:
+            decoder.search_by_id(id)
+
+    def stream_last():
+        streaming = StreamingDecodeJson(model_path)
+        streaming.search_by_id(ids[-1])
+        streaming.close()
+
+    def generate_code():
+        for library in libraries:
+            modify_templates(c_template, h_template, library, output_path, links, None)
+
+    return {
+        'decoder.load': (lambda: DecodeJson(model_path), model.nodes),
+        'decoder.search_by_id': (search_all, len(ids)),
+        'decoder.streaming_scan': (stream_last, model.nodes),
+        'plantuml.layer': (convert(PlantUMLLayerConverter, layers), len(layers)),
+        'plantuml.component': (convert(PlantUMLComponentConverter, components), len(components)),
+        'plantuml.class': (convert(PlantUMLClassConverter, libraries), len(libraries)),
+        'plantuml.hsm': (convert(PlantUMLHSMConverter, hsms), len(hsms)),
+        'code_generator.modify_templates': (generate_code, len(libraries)),
+    }
+
+def measure(function, repeat):
+    """Return the best and mean wall time over 'repeat' runs and the peak traced memory of one run."""
+    times = []
+    # The generators print diagnostics, keep them out of the report
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(repeat):
+            start = time.perf_counter()
+            function()
+            times.append(time.perf_counter() - start)
+        tracemalloc.start()
+        function()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return min(times), sum(times) / len(times), peak
+
+def scaling_exponent(points):
+    """Slope of log(time) over log(size) between the smallest and largest size, 1.0 is linear."""
+    points = [(size, seconds) for size, seconds in points if size > 0 and seconds > 0]
+    if len(points) < 2 or points[0][0] == points[-1][0]:
+        return None
+    (size_a, time_a), (size_b, time_b) = points[0], points[-1]
+    return math.log(time_b / time_a) / math.log(size_b / size_a)
+
+def run(sizes, repeat, only=None):
+    results = {'metadata': {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'date': datetime.datetime.now().isoformat(timespec='seconds'),
+        'sizes': sizes,
+        'repeat': repeat,
+    }, 'benchmarks': {}}
+    with tempfile.TemporaryDirectory() as temp_path:
+        for size in sizes:
+            model = SyntheticModel(size)
+            model_path = os.path.join(temp_path, f'model-{size}.json')
+            with open(model_path, 'w') as model_file:
+                json.dump(model.data, model_file, indent=2)
+            output_path = os.path.join(temp_path, f'code-{size}')
+            os.makedirs(output_path)
+            for name, (function, items) in benchmarks(model_path, model, output_path).items():
+                if only and not any(name.startswith(prefix) for prefix in only):
+                    continue
+                best, mean, peak = measure(function, repeat)
+                results['benchmarks'].setdefault(name, []).append({
+                    'size': size,
+                    'nodes': model.nodes,
+                    'items': items,
+                    'best_s': best,
+                    'mean_s': mean,
+                    'items_per_s': items / best if best else None,
+                    'peak_memory_bytes': peak,
+                })
+                print(f"{name:<34} size={size:<6} nodes={model.nodes:<8} best={best * 1000:10.2f} ms "
+                      f"{items / best if best else 0:12.0f} items/s  peak={peak / 1e6:8.2f} MB", file=sys.stderr)
+    for name, points in results['benchmarks'].items():
+        exponent = scaling_exponent([(point['nodes'], point['best_s']) for point in points])
+        for point in points:
+            point['scaling_exponent'] = exponent
+    return results
+
+def compare(results, baseline, threshold):
+    """Print the time ratio against a previous results file and return the regressed benchmarks."""
+    regressions = []
+    for name, points in results['benchmarks'].items():
+        previous = {point['size']: point for point in baseline.get('benchmarks', {}).get(name, [])}
+        for point in points:
+            before = previous.get(point['size'])
+            if not before or not before['best_s']:
+                continue
+            ratio = point['best_s'] / before['best_s']
+            flag = ''
+            if ratio > 1 + threshold:
+                flag = '  REGRESSION'
+                regressions.append((name, point['size'], ratio))
+            print(f"{name:<34} size={point['size']:<6} {ratio:6.2f}x{flag}", file=sys.stderr)
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the decoder, PlantUML converters and C code generator on synthetic models.")
+    parser.add_argument('--sizes', default='10,100,1000', help="Comma-separated number of components per model")
+    parser.add_argument('--repeat', type=int, default=3, help="Timed runs per benchmark, the best one is reported")
+    parser.add_argument('--only', help="Comma-separated benchmark name prefixes to run")
+    parser.add_argument('-o', '--output', help="Where to write the JSON results")
+    parser.add_argument('--compare', help="Previous JSON results to compare against")
+    parser.add_argument('--threshold', type=float, default=0.10, help="Slowdown ratio reported as a regression")
+    args = parser.parse_args()
+
+    sizes = sorted(int(size) for size in args.sizes.split(',') if size.strip())
+    only = [prefix.strip() for prefix in args.only.split(',')] if args.only else None
+    results = run(sizes, args.repeat, only)
+
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(results, output_file, indent=2)
+    else:
+        print(json.dumps(results, indent=2))
+
+    if args.compare:
+        with open(args.compare, 'r') as baseline_file:
+            regressions = compare(results, json.load(baseline_file), args.threshold)
+        if regressions:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
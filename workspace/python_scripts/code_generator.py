@@ -1,9 +1,17 @@
 import json
 import re
 import datetime
+import functools
+import hashlib
+import os
 import argparse
 import sys
 import subprocess
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from file_writer import write_atomic, write_if_changed
+from state_machine import StateMachine, reference_id
+from validate_json import check_model
 
 # Define placeholders replacement patterns
 patterns = {
@@ -20,15 +28,95 @@ def read_file_content(file_path):
     with open(file_path, 'r') as file:
         return file.read()
 
-# Helper function to search for an ID in a list
+def build_link_table(links):
+    """Turn the '$links' array into an id-keyed table, keeping the first entry of each id."""
+    table = {}
+    for link in links:
+        table.setdefault(link['id'], link)
+    return table
+
+# Helper function to search for an ID in the link table
 def search_id(links, id):
-    return next((link for link in links if link['id'] == id), None)
+    return links.get(id)
+
+# Tags of the elements a state machine can reference from anywhere in the model
+HSM_REFERENCE_TAGS = ('event', 'activity')
+
+def build_element_table(json_data, tags=HSM_REFERENCE_TAGS):
+    """Turn every element of the model with one of 'tags' into an id-keyed table, keeping the first entry of each id."""
+    table = {}
+    stack = [json_data]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, dict):
+            if 'id' in node and any(tag in tags for tag in node.get('tags', [])):
+                table.setdefault(node['id'], node)
+            stack += reversed([value for key, value in node.items() if key != '$links'])
+        elif isinstance(node, list):
+            stack += reversed(node)
+    return table
+
+def resolve_reference(elements, reference):
+    """Return the element of the table a reference such as '${id:...}' points to, None if there is none."""
+    return elements.get(reference_id(reference))
+
+# Section markers of the templates, the generated code of each section is written right after its marker
+C_TEMPLATE_SECTIONS = (
+    ('/***************** HEADERS ****************/', 'private_includes'),
+    ('/***************** TYPEDEFS ***************/', 'private_types'),
+    ('/******* STATIC VARIABLES DECLARATION ******/', 'private_variables'),
+    ('/******* GLOBAL VARIABLES DECLARATION ******/', 'public_variables'),
+    ('/******* STATIC FUNCTION DECLARATION *******/', 'private_functions'),
+    ('/********* GLOBAL FUNCTION DEFINITION *********/', 'public_definitions'),
+)
+H_TEMPLATE_SECTIONS = (
+    ('/***************** HEADERS ****************/', 'public_includes'),
+    ('/***************** TYPEDEFS ***************/', 'public_types'),
+    ('/****** GLOBAL VARIABLES DECLARATION ******/', 'header_variables'),
+    ('/****** GLOBAL FUNCTION DECLARATION *******/', 'public_functions'),
+)
+# Placeholders filled in for every library
+TEMPLATE_PLACEHOLDERS = ('_className', '__CLASS_NAME_UC_H__', '_req', '_classDescription')
+
+@functools.lru_cache(maxsize=None)
+def _keys_pattern(keys):
+    # Longest keys first so a key is never matched by one of its prefixes
+    return re.compile('|'.join(re.escape(key) for key in sorted(keys, key=len, reverse=True)))
 
 # Replace placeholders in template
 def replace_placeholders(template, replacements):
-    for key, value in replacements.items():
-        template = template.replace(key, value)
-    return template
+    if not replacements:
+        return template
+    return _keys_pattern(tuple(replacements)).sub(lambda match: replacements[match.group(0)], template)
+
+@functools.lru_cache(maxsize=None)
+def parse_template(template, sections, placeholders=TEMPLATE_PLACEHOLDERS):
+    """
+    Split a template once into (text, field) segments. 'field' names the value written after 'text':
+    a placeholder, which is left out of 'text', or the section of a marker, which is kept in 'text'
+    followed by a newline. The last segment has no field.
+    """
+    markers = dict(sections)
+    segments = []
+    start = 0
+    for match in _keys_pattern(tuple(markers) + tuple(placeholders)).finditer(template):
+        key = match.group(0)
+        if key in markers:
+            segments.append((template[start:match.end()] + '\n', markers[key]))
+        else:
+            segments.append((template[start:match.start()], key))
+        start = match.end()
+    segments.append((template[start:], None))
+    return tuple(segments)
+
+def render_template(segments, values):
+    """Assemble a parsed template in a single pass, taking the value of every field from 'values'."""
+    parts = []
+    for text, field in segments:
+        parts.append(text)
+        if field is not None:
+            parts.append(values[field])
+    return ''.join(parts)
 
 def get_requirements_description(requirements, links):
     """Get a comma-separated list of requirement descriptions."""
@@ -40,9 +128,9 @@ def get_requirements_description(requirements, links):
     return ', '.join(descriptions)
 
 def generate_variable_declarations(variables, links):
-    private_declarations_c = ''
-    public_declarations_c = ''
-    header_declarations = ''
+    private_declarations_c = []
+    public_declarations_c = []
+    header_declarations = []
     
     for var in variables:
         # Search for the datatype's label in links
@@ -84,17 +172,17 @@ def generate_variable_declarations(variables, links):
         else:
             declaration_c = f'{type_str} {var_name};\n'
         if visibility == 'private':
-            private_declarations_c += comment_doc + 'static ' + declaration_c
+            private_declarations_c += [comment_doc, 'static ', declaration_c]
         else:
-            public_declarations_c += comment_doc + declaration_c
+            public_declarations_c += [comment_doc, declaration_c]
         
-        header_declarations += header_declaration
+        header_declarations.append(header_declaration)
 
-    return private_declarations_c, public_declarations_c, header_declarations
+    return ''.join(private_declarations_c), ''.join(public_declarations_c), ''.join(header_declarations)
 
 def generate_function_declaration(functions, links):
-    private_declarations = ''
-    public_declarations = ''
+    private_declarations = []
+    public_declarations = []
 
     for func in functions:
         # Search for the return type's label in links
@@ -153,17 +241,17 @@ def generate_function_declaration(functions, links):
         declaration = f'{return_type} {func_name}({params_str});\n'
 
         if visibility == 'private':
-            private_declarations += doc_comment + 'static ' + declaration
+            private_declarations += [doc_comment, 'static ', declaration]
         else:
-            public_declarations += doc_comment + declaration
+            public_declarations += [doc_comment, declaration]
 
-    return (private_declarations, public_declarations)
+    return (''.join(private_declarations), ''.join(public_declarations))
 
 def generate_data_structures_and_typedefs(data_structures, links):
-    private_structures = ''
-    public_structures = ''
-    private_typedefs = ''
-    public_typedefs = ''
+    private_structures = []
+    public_structures = []
+    private_typedefs = []
+    public_typedefs = []
     
     for ds in data_structures:
         # Determine visibility
@@ -186,7 +274,7 @@ def generate_data_structures_and_typedefs(data_structures, links):
         structure_start = f'{doc_comment}{ds_type} {ds_label} {{\n'
         structure_end = '};\n'
         
-        member_declarations = ''
+        member_declarations = []
         for member in members:
             # Search for the member's datatype label in links
             member_type_info = search_id(links, member['datatype'])
@@ -222,23 +310,23 @@ def generate_data_structures_and_typedefs(data_structures, links):
                 f'     */\n'
             )
             member_declaration = f'    {member_doc_comment}    {type_str} {member_name};\n'
-            member_declarations += member_declaration
+            member_declarations.append(member_declaration)
 
-        # Append the structure to the appropriate declarations string
-        structure_declaration = f'{structure_start}{member_declarations}{structure_end}\n'
+        # Append the structure to the appropriate declarations list
+        structure_declaration = f'{structure_start}{"".join(member_declarations)}{structure_end}\n'
         
         if ds_visibility == 'private':
-            private_structures += structure_declaration
-            private_typedefs += f'{doc_comment}typedef {ds_type} {ds_label};\n'
+            private_structures.append(structure_declaration)
+            private_typedefs.append(f'{doc_comment}typedef {ds_type} {ds_label};\n')
         else:
-            public_structures += structure_declaration
-            public_typedefs += f'{doc_comment}typedef {ds_type} {ds_label};\n'
+            public_structures.append(structure_declaration)
+            public_typedefs.append(f'{doc_comment}typedef {ds_type} {ds_label};\n')
 
-    return private_structures, public_structures, private_typedefs, public_typedefs
+    return ''.join(private_structures), ''.join(public_structures), ''.join(private_typedefs), ''.join(public_typedefs)
 
 def generate_typedefs(typedefs, links):
-    private_typedefs = ''
-    public_typedefs = ''
+    private_typedefs = []
+    public_typedefs = []
     
     for typedef in typedefs:
         # Determine visibility
@@ -266,19 +354,19 @@ def generate_typedefs(typedefs, links):
         
         typedef_declaration = f'{doc_comment}typedef {typedef_type} {typedef_label};\n'
         
-        # Append the typedef to the appropriate declarations string
+        # Append the typedef to the appropriate declarations list
         if typedef_visibility == 'private':
-            private_typedefs += typedef_declaration
+            private_typedefs.append(typedef_declaration)
         else:
-            public_typedefs += typedef_declaration
+            public_typedefs.append(typedef_declaration)
 
-    return private_typedefs, public_typedefs
+    return ''.join(private_typedefs), ''.join(public_typedefs)
 
 def generate_enums(enumerators, links):
-    private_enums = ''
-    public_enums = ''
-    private_enum_typedefs = ''
-    public_enum_typedefs = ''
+    private_enums = []
+    public_enums = []
+    private_enum_typedefs = []
+    public_enum_typedefs = []
     
     for enum in enumerators:
         # Determine visibility
@@ -300,7 +388,7 @@ def generate_enums(enumerators, links):
         enum_start = f'{doc_comment}enum {enum_label}{{\n'
         enum_end = f'}};\n'
         
-        member_declarations = ''
+        member_declarations = []
         for member in members:
             member_name = member.get('label', 'unknown')
             member_value = member.get('value', '0')
@@ -311,23 +399,222 @@ def generate_enums(enumerators, links):
                 f'     */\n'
             )
             member_declaration = f'    {member_doc_comment}    {member_name} = {member_value},\n'
-            member_declarations += member_declaration
+            member_declarations.append(member_declaration)
 
         # Complete enum declaration
-        enum_declaration = f'{enum_start}{member_declarations.rstrip(",\n")}\n{enum_end}\n'
+        member_declarations = ''.join(member_declarations).rstrip(",\n")
+        enum_declaration = f'{enum_start}{member_declarations}\n{enum_end}\n'
 
         if enum_visibility == 'private':
-            private_enums += enum_declaration
-            private_enum_typedefs += f'{doc_comment}typedef enum {enum_label};\n'
+            private_enums.append(enum_declaration)
+            private_enum_typedefs.append(f'{doc_comment}typedef enum {enum_label};\n')
         else:
-            public_enums += enum_declaration
-            public_enum_typedefs += f'{doc_comment}typedef enum {enum_label};\n'
+            public_enums.append(enum_declaration)
+            public_enum_typedefs.append(f'{doc_comment}typedef enum {enum_label};\n')
+
+    return ''.join(private_enums), ''.join(public_enums), ''.join(private_enum_typedefs), ''.join(public_enum_typedefs)
+
+def c_identifier(text):
+    """Turn a label into a valid C identifier."""
+    identifier = re.sub(r'\W', '_', text, flags=re.ASCII) or '_'
+    return '_' + identifier if identifier[0].isdigit() else identifier
+
+def unique_identifiers(labels):
+    """C identifiers for a list of labels, numbered when two labels give the same identifier."""
+    identifiers = [c_identifier(label) for label in labels]
+    seen = {}
+    for index, identifier in enumerate(identifiers):
+        if identifier in seen:
+            seen[identifier] += 1
+            identifiers[index] = f'{identifier}_{seen[identifier]}'
+        else:
+            seen[identifier] = 0
+    return identifiers
+
+def find_state_machines(hsms, resolve=None):
+    """
+    Build a StateMachine for every HSM, with the ones nested in their states after each of them.
+    'resolve' (reference -> element) finds the events and activities defined outside an HSM.
+    """
+    machines = []
+    stack = list(reversed(hsms))
+    while stack:
+        machine = StateMachine(stack.pop(), resolve=resolve)
+        machines.append(machine)
+        stack += reversed(machine.submachines)
+    return machines
+
+# Codes of a step's 'next' that are not a state, guards are numbered from STEP_GUARD
+STEP_GUARD = 0x8000
+STEP_INTERNAL = 0xFFFD
+STEP_TERMINATE = 0xFFFE
+
+def generate_state_machine(machine, prefix):
+    """
+    C code of one state machine, with the dispatch resolved into constant tables.
+    Unreachable states and conflicting transitions are printed as warnings, unresolved references and
+    guard cycles raise a ValueError.
+    Returns (public_types, public_declarations, private_types, private_variables, definitions).
+    """
+    upper = prefix.upper()
+    states = unique_identifiers([machine.states[state].get('label', 'unknown') for state in machine.leaves])
+    events = unique_identifiers([event.get('label', 'unknown') for event in machine.events])
+    activities = [f'{prefix}_{name}' for name in unique_identifiers([activity.get('label', 'unknown') for activity in machine.activities])]
+    guards = [f'{prefix}_{name}' for name in unique_identifiers([guard.get('label', 'unknown') for guard in machine.guards])]
+    if len(states) >= STEP_GUARD or len(guards) >= STEP_INTERNAL - STEP_GUARD:
+        raise ValueError(f"HSM {machine.label} has too many states or guards for its dispatch tables")
+    # A transition left out of the tables would make the code disagree with the model and its diagrams
+    if machine.problems:
+        raise ValueError(f"HSM {machine.label} has unresolved references: {'; '.join(machine.problems)}")
+    report = machine.analyze()
+    # The dispatch loop follows guards until it reaches a state, a guard cycle would never end
+    if report.guard_cycles:
+        cycles = ', '.join(' -> '.join(machine.guards[guard].get('label', 'unknown') for guard in cycle) for cycle in report.guard_cycles)
+        raise ValueError(f"HSM {machine.label} has guard cycles its dispatch would never leave: {cycles}")
+    for message in report.messages():
+        print(f"Warning: {message}")
+
+    public_types = []
+    public_declarations = []
+    private_types = []
+    private_variables = []
+    definitions = []
+
+    def doc(brief, id=machine.id, indent=''):
+        return f'{indent}/**\n{indent} * @brief {brief}\n{indent} * @id {id}\n{indent} */\n'
 
-    return private_enums, public_enums, private_enum_typedefs, public_enum_typedefs
+    # The states and events are public, so callers can dispatch events and read the state
+    public_types.append(doc(f'Leaf states of the state machine {machine.label}, the only states that can be active.'))
+    public_types.append('typedef enum {\n')
+    public_types += [f'    {upper}_STATE_{name},\n' for name in states]
+    public_types.append(f'    {upper}_STATE_COUNT,\n    {upper}_STATE_TERMINATED = {upper}_STATE_COUNT\n}} {prefix}_state_t;\n')
+    public_types.append(doc(f'Events of the state machine {machine.label}.'))
+    public_types.append('typedef enum {\n')
+    public_types += [f'    {upper}_EVENT_{name},\n' for name in events]
+    public_types.append(f'    {upper}_EVENT_COUNT\n}} {prefix}_event_t;\n')
+    public_types.append(doc(f'Instance of the state machine {machine.label}.'))
+    public_types.append(f'typedef struct {{\n    {prefix}_state_t state;\n}} {prefix}_t;\n')
+
+    public_declarations.append(doc(f'Enter the initial state of {machine.label}.'))
+    public_declarations.append(f'void {prefix}_init({prefix}_t *hsm);\n')
+    public_declarations.append(doc(f'Dispatch an event to {machine.label} and return the new state, events are ignored once it has terminated.'))
+    public_declarations.append(f'{prefix}_state_t {prefix}_dispatch({prefix}_t *hsm, {prefix}_event_t event);\n')
+    # Activities and guard conditions are implemented by hand next to the generated sources
+    for activity, name in zip(machine.activities, activities):
+        public_declarations.append(doc(activity.get('documentation') or f'Activity {activity.get("label", "unknown")} of {machine.label}.', activity.get('id', 'unknown')))
+        public_declarations.append(f'void {name}(void);\n')
+    for guard, name in zip(machine.guards, guards):
+        public_declarations.append(doc(f'Condition of the guard {guard.get("label", "unknown")}: {guard.get("condition", "")}', guard.get('id', 'unknown')))
+        public_declarations.append(f'bool {name}(void);\n')
+
+    # A state machine without events only has its initial state, it needs no tables
+    if events:
+        private_types.append(f'#define {upper}_GUARD {STEP_GUARD:#x}u\n#define {upper}_INTERNAL {STEP_INTERNAL:#x}u\n#define {upper}_TERMINATE {STEP_TERMINATE:#x}u\n')
+        private_types.append(doc(f'Step of {machine.label}: the activity to run, then the state entered, {upper}_GUARD + the guard to evaluate, {upper}_INTERNAL or {upper}_TERMINATE.'))
+        private_types.append(f'typedef struct {{\n    uint16_t next;\n    uint16_t activity;\n}} {prefix}_step_t;\n')
+        if guards:
+            private_types.append(doc(f'Guard of {machine.label}: its condition, its activity and the step taken for each result.'))
+            private_types.append(f'typedef struct {{\n    bool (*condition)(void);\n    uint16_t activity;\n    {prefix}_step_t on_true;\n    {prefix}_step_t on_false;\n}} {prefix}_guard_t;\n')
+
+        def step_code(step):
+            (target, activity) = step
+            if target[0] == 'state':
+                next = f'{upper}_STATE_{states[target[1]]}'
+            elif target[0] == 'guard':
+                next = f'{upper}_GUARD + {target[1]}u'
+            else:
+                next = f'{upper}_{target[0].upper()}'
+            # Activity 0 is the empty slot of the activity table
+            return f'{{ {next}, {0 if activity is None else activity + 1}u }}'
+
+        # Identical steps are stored once, step 0 is taken on events no state handles
+        steps = {None: 0}
+        step_codes = [f'{{ {upper}_INTERNAL, 0u }}']
+        rows = []
+        for leaf_steps in machine.table:
+            row = []
+            for step in leaf_steps:
+                if step not in steps:
+                    steps[step] = len(step_codes)
+                    step_codes.append(step_code(step))
+                row.append(f'{steps[step]}u')
+            rows.append(row)
+
+        private_variables.append(doc(f'Activities of {machine.label}, the first slot stands for no activity.'))
+        private_variables.append(f'static void (*const {prefix}_activities[])(void) = {{\n    NULL,\n')
+        private_variables += [f'    {name},\n' for name in activities]
+        private_variables.append('};\n')
+        private_variables.append(doc(f'Steps of {machine.label}, the first one is taken on events that are not handled.'))
+        private_variables.append(f'static const {prefix}_step_t {prefix}_steps[] = {{\n')
+        private_variables += [f'    {code},\n' for code in step_codes]
+        private_variables.append('};\n')
+        if guards:
+            private_variables.append(doc(f'Guards of {machine.label}.'))
+            private_variables.append(f'static const {prefix}_guard_t {prefix}_guards[] = {{\n')
+            private_variables += [f'    {{ {name}, {0 if activity is None else activity + 1}u, {step_code(on_true)}, {step_code(on_false)} }},\n'
+                                  for name, (activity, on_true, on_false) in zip(guards, machine.guard_steps)]
+            private_variables.append('};\n')
+        private_variables.append(doc(f'Step taken by every leaf state of {machine.label} on every event, nested states already resolved.'))
+        private_variables.append(f'static const uint16_t {prefix}_table[{upper}_STATE_COUNT][{upper}_EVENT_COUNT] = {{\n')
+        private_variables += [f'    /* {name} */ {{ {", ".join(row)} }},\n' for name, row in zip(states, rows)]
+        private_variables.append('};\n')
+
+    initial = f'{upper}_STATE_{states[machine.initial]}' if states else f'{upper}_STATE_TERMINATED'
+    definitions.append(doc(f'Enter the initial state of {machine.label}.'))
+    definitions.append(f'void {prefix}_init({prefix}_t *hsm)\n{{\n    hsm->state = {initial};\n}}\n\n')
+    definitions.append(doc(f'Dispatch an event to {machine.label} and return the new state, events are ignored once it has terminated.'))
+    definitions.append(f'{prefix}_state_t {prefix}_dispatch({prefix}_t *hsm, {prefix}_event_t event)\n{{\n')
+    if events:
+        guard_code = ''
+        if guards:
+            guard_code = (f'        const {prefix}_guard_t *guard = &{prefix}_guards[step->next - {upper}_GUARD];\n'
+                          f'        if (guard->activity != 0u) {{\n'
+                          f'            {prefix}_activities[guard->activity]();\n'
+                          f'        }}\n'
+                          f'        step = guard->condition() ? &guard->on_true : &guard->on_false;\n')
+        definitions.append(
+            f'    if ((hsm->state >= {upper}_STATE_COUNT) || ((unsigned int)event >= (unsigned int){upper}_EVENT_COUNT)) {{\n'
+            f'        return hsm->state;\n'
+            f'    }}\n'
+            f'    const {prefix}_step_t *step = &{prefix}_steps[{prefix}_table[hsm->state][event]];\n'
+            f'    for (;;) {{\n'
+            f'        if (step->activity != 0u) {{\n'
+            f'            {prefix}_activities[step->activity]();\n'
+            f'        }}\n'
+            f'        if (step->next < {upper}_GUARD) {{\n'
+            f'            hsm->state = ({prefix}_state_t)step->next;\n'
+            f'            break;\n'
+            f'        }}\n'
+            f'        if (step->next == {upper}_TERMINATE) {{\n'
+            f'            hsm->state = {upper}_STATE_TERMINATED;\n'
+            f'            break;\n'
+            f'        }}\n'
+            + (f'        if (step->next == {upper}_INTERNAL) {{\n'
+               f'            break;\n'
+               '        }\n' + guard_code if guards else '        break;\n') +
+            '    }\n'
+            '    return hsm->state;\n}\n\n')
+    else:
+        definitions.append('    (void)event;\n    return hsm->state;\n}\n\n')
+
+    return ''.join(public_types), ''.join(public_declarations), ''.join(private_types), ''.join(private_variables), ''.join(definitions)
+
+def generate_state_machines(hsms, resolve=None):
+    """
+    C code of every state machine of a library, its symbols are prefixed with the HSM label.
+    Returns (public_types, public_declarations, private_types, private_variables, definitions).
+    """
+    machines = find_state_machines(hsms, resolve)
+    prefixes = unique_identifiers([machine.label for machine in machines])
+    sections = [[], [], [], [], []]
+    for machine, prefix in zip(machines, prefixes):
+        for section, code in zip(sections, generate_state_machine(machine, prefix)):
+            section.append(code)
+    return tuple(''.join(section) for section in sections)
 
 def generate_includes(class_name, public_includes, private_includes, links):
-    private_includes_str = '#include "'+class_name+'.h"\n'
-    public_includes_str = ''
+    private_includes_str = ['#include "'+class_name+'.h"\n']
+    public_includes_str = []
 
     for include in public_includes:
         include_info = search_id(links, include)
@@ -335,7 +622,7 @@ def generate_includes(class_name, public_includes, private_includes, links):
             continue  # Skip if include is not found
     
         include_label = include_info.get('label', 'unknown')
-        public_includes_str += f'#include "{include_label}.h"\n'
+        public_includes_str.append(f'#include "{include_label}.h"\n')
 
     for include in private_includes:
         include_info = search_id(links, include)
@@ -343,26 +630,147 @@ def generate_includes(class_name, public_includes, private_includes, links):
             continue
 
         include_label = include_info.get('label', 'unknown')
-        private_includes_str += f'#include "{include_label}.h"\n'
+        private_includes_str.append(f'#include "{include_label}.h"\n')
 
-    return public_includes_str, private_includes_str
+    return ''.join(public_includes_str), ''.join(private_includes_str)
 
-# Modify template based on JSON data
-def modify_templates(c_template, h_template, entry, output_path, links, clang_format_command):
-    # Using the `id` from the JSON data
-    entry_id = entry['id']
+def library_filenames(entry, output_path):
+    """Return the .c and .h paths generated for a library."""
+    return (f'{output_path}/{entry["label"]}-{entry["id"]}.c',
+            f'{output_path}/{entry["label"]}-{entry["id"]}.h')
+
+# Files formatted by earlier runs are kept here, under the output directory
+FORMAT_CACHE_DIRNAME = '.clang_format_cache'
+
+@functools.lru_cache(maxsize=None)
+def clang_format_version(clang_format_command):
+    """Version reported by clang-format, formatting changes between releases."""
+    try:
+        return subprocess.run([clang_format_command, '--version'], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return ''
+
+def find_style(directory):
+    """Return the .clang-format style clang-format uses for files in directory, '' if there is none."""
+    directory = os.path.abspath(directory)
+    while True:
+        for name in ('.clang-format', '_clang-format'):
+            try:
+                with open(os.path.join(directory, name), 'r') as style_file:
+                    return style_file.read()
+            except OSError:
+                pass
+        parent = os.path.dirname(directory)
+        if parent == directory:
+            return ''
+        directory = parent
+
+def format_key(content, extension, style, version):
+    """Key of a formatted file in the cache, a hash of everything its formatting depends on."""
+    digest = hashlib.sha256()
+    for text in (version, style, extension, content):
+        digest.update(text.encode('utf-8') + b'\0')
+    return digest.hexdigest()
+
+class FormatCache:
+    """Formatted sources of earlier runs, stored as <cache_dir>/<format key><extension>."""
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, key, extension):
+        return os.path.join(self.cache_dir, key + extension)
+
+    def get(self, key, extension):
+        try:
+            with open(self._path(key, extension), 'r', encoding='utf-8', newline='') as cached_file:
+                return cached_file.read()
+        except FileNotFoundError:
+            return None
+
+    def put(self, key, extension, content):
+        # Renamed into place so a concurrent run never reads a half written file
+        write_atomic(self._path(key, extension), content, newline='')
+
+def _run_clang_format(clang_format_command, filename, content):
+    """Format content through the stdin of a clang-format process, styled as filename. Returns None on failure."""
+    try:
+        result = subprocess.run([clang_format_command, f'--assume-filename={filename}'], input=content,
+                                capture_output=True, text=True, check=True)
+        return result.stdout
+    except (subprocess.CalledProcessError, OSError) as e:
+        print(f"Error occurred while formatting {filename}: {e}")
+        return None
+
+def format_sources(sources, clang_format_command, cache_path, jobs=None):
+    """
+    Format generated sources in memory with clang-format, sources maps each file name to its content.
+    Contents formatted before are taken from the cache in cache_path. The others are piped through
+    clang-format once per distinct content, with up to 'jobs' processes at a time (one per core by
+    default); a content clang-format fails on is kept as it is.
+    Returns (formatted sources, number of files formatted by clang-format, number taken from the cache,
+    file names clang-format failed on).
+    """
+    cache = FormatCache(cache_path)
+    version = clang_format_version(clang_format_command)
+    styles = {}
+    formatted_sources = {}
+    pending = {}
+    for filename, content in sources.items():
+        directory = os.path.dirname(os.path.abspath(filename))
+        if directory not in styles:
+            styles[directory] = find_style(directory)
+        extension = os.path.splitext(filename)[1]
+        key = format_key(content, extension, styles[directory], version)
+        formatted = cache.get(key, extension)
+        if formatted is None:
+            pending.setdefault((key, extension), []).append(filename)
+        else:
+            formatted_sources[filename] = formatted
+    cached = len(formatted_sources)
+    if not pending:
+        return formatted_sources, 0, cached, []
+
+    keys = list(pending)
+    failed = []
+    jobs = max(1, min(jobs or os.cpu_count() or 1, len(keys)))
+    # Each content is one clang-format process, threads only wait on the processes
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        results = executor.map(lambda key: _run_clang_format(clang_format_command, pending[key][0], sources[pending[key][0]]), keys)
+        for (key, extension), formatted in zip(keys, results):
+            if formatted is None:
+                formatted_sources.update((filename, sources[filename]) for filename in pending[(key, extension)])
+                failed += pending[(key, extension)]
+                continue
+            cache.put(key, extension, formatted)
+            formatted_sources.update((filename, formatted) for filename in pending[(key, extension)])
+    return formatted_sources, len(keys), cached, failed
+
+def write_sources(sources):
+    """
+    Write every {file name: content} of sources that changed, so build tools do not see a change.
+    Each file is renamed into place, a concurrent build never reads a partial one. Returns the number
+    of files written.
+    """
+    return sum(write_if_changed(filename, content) for filename, content in sources.items())
+
+def render_library(c_template, h_template, entry, output_path, links, elements=None):
+    """
+    Return {file name: content} of the .c and .h generated for a library, without writing them.
+    'elements' is the build_element_table of the model, for the events and activities its state machines
+    reference from outside the library.
+    """
+    # Accept the raw '$links' array too, every lookup below goes through the id-keyed table
+    if isinstance(links, list):
+        links = build_link_table(links)
     class_name = entry['label']
-    patterns = {
+    values = {
         '_className': class_name,
         '__CLASS_NAME_UC_H__': '__' + class_name.upper() + '_H__',
         '_req': get_requirements_description(entry.get('requirements', []), links),
         '_classDescription': f'{class_name} description'
     }
 
-    # Replace placeholders in the template
-    c_template_modified = replace_placeholders(c_template, patterns)
-    h_template_modified = replace_placeholders(h_template, patterns)
-
     # Generate declarations based on JSON data
     var_private_declarations, var_public_declarations, var_header_declarations = generate_variable_declarations(entry['variables'], links)
     fun_private_declarations, fun_public_declarations = generate_function_declaration(entry['funcions'], links)
@@ -374,61 +782,165 @@ def modify_templates(c_template, h_template, entry, output_path, links, clang_fo
     private_enums, public_enums, \
     private_typdef_enums, public_typdef_enums = generate_enums(entry['enumerators'], links)
     public_includes, private_includes = generate_includes(class_name, entry.get('public dependencies', []), entry.get('private dependencies', []), links)
+    hsm_public_types, hsm_public_declarations, \
+    hsm_private_types, hsm_private_variables, hsm_definitions = generate_state_machines(entry.get('HSM', []), functools.partial(resolve_reference, elements or {}))
+    if entry.get('HSM'):
+        # The state machines use bool guards, uint16_t tables and NULL activities
+        public_includes = '#include <stdbool.h>\n#include <stdint.h>\n' + public_includes
+        private_includes += '#include <stddef.h>\n'
 
-    # Insert generated declarations into template sections
-    c_template_modified = c_template_modified.replace('/******* GLOBAL VARIABLES DECLARATION ******/', 
-                                                      '/******* GLOBAL VARIABLES DECLARATION ******/\n' + var_public_declarations)
+    # Generated declarations of every template section
+    values.update({
+        'public_variables': var_public_declarations,
+        'private_variables': var_private_declarations + hsm_private_variables,
+        'header_variables': var_header_declarations,
+        'private_functions': fun_private_declarations,
+        'public_functions': fun_public_declarations + hsm_public_declarations,
+        'public_definitions': hsm_definitions,
+        'private_types': ''.join([private_typdef_enums, private_data_struct_typedefs, private_typdefs, private_enums, data_struct_private_declarations, hsm_private_types]),
+        'public_types': ''.join([public_typdef_enums, public_data_struct_typedefs, public_typdefs, public_enums, data_struct_public_declarations, hsm_public_types]),
+        'private_includes': private_includes,
+        'public_includes': public_includes,
+    })
 
-    c_template_modified = c_template_modified.replace('/******* STATIC VARIABLES DECLARATION ******/', 
-                                                      '/******* STATIC VARIABLES DECLARATION ******/\n' + var_private_declarations)
+    # The templates are parsed once and filled in a single pass
+    c_template_modified = render_template(parse_template(c_template, C_TEMPLATE_SECTIONS), values)
+    h_template_modified = render_template(parse_template(h_template, H_TEMPLATE_SECTIONS), values)
+    
+    # Use the `id` for the filename
+    c_filename, h_filename = library_filenames(entry, output_path)
+    return {c_filename: c_template_modified, h_filename: h_template_modified}
 
-    c_template_modified = c_template_modified.replace('/******* STATIC FUNCTION DECLARATION *******/', 
-                                                      '/******* STATIC FUNCTION DECLARATION *******/\n' + fun_private_declarations)
+# Modify template based on JSON data
+def modify_templates(c_template, h_template, entry, output_path, links, clang_format_command, elements=None):
+    sources = render_library(c_template, h_template, entry, output_path, links, elements)
 
-    h_template_modified = h_template_modified.replace('/****** GLOBAL FUNCTION DECLARATION *******/', 
-                                                      '/****** GLOBAL FUNCTION DECLARATION *******/\n' + fun_public_declarations)
+    # Format the sources in memory using clang-format if a command is provided
+    failed = []
+    if clang_format_command:
+        sources, formatted, cached, failed = format_sources(sources, clang_format_command, os.path.join(output_path, FORMAT_CACHE_DIRNAME))
+        print(f"Formatted files {' and '.join(sources)} using {clang_format_command}, {cached} from cache.")
 
-    c_template_modified = c_template_modified.replace('/***************** TYPEDEFS ***************/', 
-                                                      '/***************** TYPEDEFS ***************/\n' + private_typdef_enums + private_data_struct_typedefs + private_typdefs + private_enums + data_struct_private_declarations)
+    # Only files whose content changed are written
+    written = write_sources(sources)
+    # The unformatted files are kept, but the library must not be taken as up to date
+    if failed:
+        raise RuntimeError(f"clang-format failed on {', '.join(failed)}")
+    return written
 
-    h_template_modified = h_template_modified.replace('/***************** TYPEDEFS ***************/', 
-                                                      '/***************** TYPEDEFS ***************/\n' + public_typdef_enums + public_data_struct_typedefs + public_typdefs + public_enums + data_struct_public_declarations)
+# Manifest kept in the output directory with the input hash of every generated library
+MANIFEST_FILENAME = '.code_generator_manifest.json'
 
-    h_template_modified = h_template_modified.replace('/****** GLOBAL VARIABLES DECLARATION ******/', 
-                                                      '/****** GLOBAL VARIABLES DECLARATION ******/\n' + var_header_declarations)
-    
-    c_template_modified = c_template_modified.replace('/***************** HEADERS ****************/', 
-                                                      '/***************** HEADERS ****************/\n' + private_includes)
+def load_manifest(output_path):
+    """Return the {library id: entry} manifest of output_path, or an empty one."""
+    try:
+        with open(os.path.join(output_path, MANIFEST_FILENAME), 'r') as manifest_file:
+            return json.load(manifest_file).get('libraries', {})
+    except (FileNotFoundError, json.JSONDecodeError, AttributeError):
+        return {}
 
-    h_template_modified = h_template_modified.replace('/***************** HEADERS ****************/', 
-                                                      '/***************** HEADERS ****************/\n' + public_includes)
-    
-    # Use the `id` for the filename
-    c_filename = f'{output_path}/{class_name}-{entry_id}.c'
-    h_filename = f'{output_path}/{class_name}-{entry_id}.h'
+def save_manifest(output_path, manifest):
+    with open(os.path.join(output_path, MANIFEST_FILENAME), 'w') as manifest_file:
+        json.dump({'libraries': manifest}, manifest_file, indent=2, sort_keys=True)
 
-    # Write the modified templates to new files
-    with open(c_filename, 'w') as c_file:
-        c_file.write(c_template_modified)
-    with open(h_filename, 'w') as h_file:
-        h_file.write(h_template_modified)
+def _collect_strings(data, strings):
+    if isinstance(data, dict):
+        for value in data.values():
+            _collect_strings(value, strings)
+    elif isinstance(data, list):
+        for item in data:
+            _collect_strings(item, strings)
+    elif isinstance(data, str):
+        strings.add(data)
+    return strings
 
-    # Format the files using clang-format if a command is provided
-    if clang_format_command:
-        for filename in [c_filename, h_filename]:
-            try:
-                subprocess.run([clang_format_command, '-i', filename], check=True)
-                print(f"Formatted file {filename} using {clang_format_command}.")
-            except subprocess.CalledProcessError as e:
-                print(f"Error occurred while formatting {filename}: {e}")
+def library_fingerprint(entry, links_by_id, inputs_hash, elements=None):
+    """
+    Hash the library subtree, the $links entries it refers to, the elements of the 'elements' table it
+    references and the shared generator inputs.
+    """
+    strings = _collect_strings(entry, set())
+    referenced = sorted(value for value in strings if value in links_by_id)
+    elements = elements or {}
+    referenced_elements = sorted({reference_id(value) for value in strings} & set(elements), key=str)
+    payload = json.dumps([inputs_hash, entry, [links_by_id[id] for id in referenced], [elements[id] for id in referenced_elements]],
+                         sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+# Modules the generated sources come from, a change to any of them regenerates every library
+GENERATOR_MODULES = (__file__, sys.modules[StateMachine.__module__].__file__)
+
+def generator_inputs_hash(c_template, h_template, clang_format_command):
+    """Hash what every library depends on: the templates, the generator modules and the formatter."""
+    digest = hashlib.sha256()
+    for module_path in GENERATOR_MODULES:
+        with open(module_path, 'rb') as generator_file:
+            digest.update(generator_file.read() + b'\0')
+    for text in (c_template, h_template, clang_format_command or ''):
+        digest.update(b'\0' + text.encode('utf-8'))
+    return digest.hexdigest()
+
+def is_up_to_date(entry, fingerprint, manifest, output_path):
+    """True if the library was generated from the same inputs and its files are still there."""
+    previous = manifest.get(entry['id'])
+    if not previous or previous.get('hash') != fingerprint:
+        return False
+    return all(os.path.exists(filename) for filename in library_filenames(entry, output_path))
+
+def find_libraries(json_data):
+    """Yield every library listed under 'Structure' -> 'libraries'."""
+    for structure in json_data.get('Structure', []):
+        for library in structure.get('libraries', []):
+            yield library
+
+def generate_library(entry, c_template, h_template, output_path, links, clang_format_command, write=True, elements=None):
+    """
+    Generate the sources of one library. Returns (seconds, sources): with write=False the files are
+    not written and sources maps each of them to its content, otherwise sources is empty.
+    """
+    start = time.perf_counter()
+    if write:
+        modify_templates(c_template, h_template, entry, output_path, links, clang_format_command, elements)
+        sources = {}
+    else:
+        sources = render_library(c_template, h_template, entry, output_path, links, elements)
+    return time.perf_counter() - start, sources
+
+# Templates, links and options shared by every library generated in a worker process
+_worker_args = None
+
+def _init_worker(*args):
+    global _worker_args
+    _worker_args = args
+
+def _generate_library_in_worker(entry):
+    return generate_library(entry, *_worker_args)
+
+def generate_libraries(libraries, c_template, h_template, output_path, links, clang_format_command, jobs=1, write=True, elements=None):
+    """Generate every library, across a process pool when jobs > 1. Yields (library, seconds, sources) in order."""
+    args = (c_template, h_template, output_path, links, clang_format_command, write, elements)
+    if jobs > 1 and len(libraries) > 1:
+        # The shared data is sent once per worker, only the library itself is sent per task
+        with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker, initargs=args) as executor:
+            for library, (elapsed, sources) in zip(libraries, executor.map(_generate_library_in_worker, libraries)):
+                yield library, elapsed, sources
+    else:
+        for library in libraries:
+            yield (library,) + generate_library(library, *args)
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Convert JSON to Autogenerated C Code")
     parser.add_argument("-f", "--file", required=True, help="Path to the JSON file")
-    parser.add_argument("-i", "--id", required=True, help="ID to search for in the JSON")
+    selection = parser.add_mutually_exclusive_group(required=True)
+    selection.add_argument("-i", "--id", help="ID to search for in the JSON")
+    selection.add_argument("--ids", help="Comma-separated list of library IDs to generate")
+    selection.add_argument("--all", action="store_true", help="Generate every library in the JSON")
     parser.add_argument("-t", "--templates", required=True, help="Path where templates are located")
     parser.add_argument("-o", "--output", required=True, help="Path where to refresh the autogenerated code")
     parser.add_argument("--clang-format", help="Path to the clang-format executable")
+    parser.add_argument("-j", "--jobs", type=int, default=1, help="Number of worker processes used to generate libraries")
+    parser.add_argument("--force", action="store_true", help="Regenerate libraries even if their inputs did not change")
+    parser.add_argument("--validate", action="store_true", help="Check the model against workspace/schemas before generating")
 
     args = parser.parse_args()
 
@@ -440,20 +952,81 @@ if __name__ == "__main__":
         # Load the JSON data from the file
         with open(args.file, 'r') as json_file:
             json_data = json.load(json_file)
+        if args.validate:
+            check_model(args.file, json_data=json_data)
+
+        # Only libraries whose inputs changed since the last run are generated again
+        # The '$links' table is built once and shared by every generator
+        links = build_link_table(json_data['$links'])
+        # State machines may use events and activities defined anywhere in the model
+        elements = build_element_table(json_data)
+        inputs_hash = generator_inputs_hash(c_template, h_template, args.clang_format)
+        # --force regenerates the selected libraries, the entries of the others are kept
+        manifest = load_manifest(args.output)
 
-        # Check if 'Structure' and 'libraries' keys are present and non-empty
-        if 'Structure' in json_data and len(json_data['Structure']) > 0:
-            structures = json_data['Structure']
-            for structure in structures:
-                if 'libraries' in structure and len(structure['libraries']) > 0: 
-                    libraries = structure['libraries']
-                    for library in libraries:
-                        # Check id matches the one requested
-                        if 'id' in library and library['id'] == args.id:
-                            # Run the function with the actual template contents and output path
-                            modify_templates(c_template, h_template, library, args.output, json_data['$links'], args.clang_format)
-                            print(f"Templates generated successfully at {args.output} for ID {args.id}.")
-                            sys.exit(0)
+        if args.id:
+            # Run the function with the actual template contents and output path
+            for library in find_libraries(json_data):
+                # Check id matches the one requested
+                if 'id' in library and library['id'] == args.id:
+                    fingerprint = library_fingerprint(library, links, inputs_hash, elements)
+                    if not args.force and is_up_to_date(library, fingerprint, manifest, args.output):
+                        print(f"Templates at {args.output} are up to date for ID {args.id}.")
+                        sys.exit(0)
+                    modify_templates(c_template, h_template, library, args.output, links, args.clang_format, elements)
+                    manifest[library['id']] = {'hash': fingerprint}
+                    save_manifest(args.output, manifest)
+                    print(f"Templates generated successfully at {args.output} for ID {args.id}.")
+                    sys.exit(0)
+        else:
+            # Batch mode, the model and templates are loaded once for every library
+            libraries = list(find_libraries(json_data))
+            if args.ids:
+                requested = [id.strip() for id in args.ids.split(',') if id.strip()]
+                by_id = {library.get('id'): library for library in libraries}
+                for id in requested:
+                    if id not in by_id:
+                        print(f"ID {id} not found.")
+                libraries = [by_id[id] for id in requested if id in by_id]
+
+            fingerprints = {library['id']: library_fingerprint(library, links, inputs_hash, elements) for library in libraries}
+            stale = [library for library in libraries
+                     if args.force or not is_up_to_date(library, fingerprints[library['id']], manifest, args.output)]
+
+            start = time.perf_counter()
+            try:
+                # With clang-format the sources stay in memory until every library is generated,
+                # they are then formatted together and only the files that changed are written
+                deferred = []
+                for library, elapsed, sources in generate_libraries(stale, c_template, h_template, args.output, links, None, args.jobs, write=not args.clang_format,
+                                                                    elements=elements):
+                    if args.clang_format:
+                        deferred.append((library, sources))
+                    else:
+                        manifest[library['id']] = {'hash': fingerprints[library['id']]}
+                    print(f"Generated {library['label']} ({library['id']}) in {elapsed * 1000:.1f} ms.")
+                if deferred:
+                    sources = {filename: content for library, library_sources in deferred for filename, content in library_sources.items()}
+                    sources, formatted, cached, failed = format_sources(sources, args.clang_format, os.path.join(args.output, FORMAT_CACHE_DIRNAME))
+                    failed = set(failed)
+                    written = 0
+                    unformatted = 0
+                    for library, library_sources in deferred:
+                        written += write_sources({filename: sources[filename] for filename in library_sources})
+                        # Libraries clang-format failed on stay out of the manifest, the next run formats them again
+                        if failed.intersection(library_sources):
+                            unformatted += 1
+                        else:
+                            manifest[library['id']] = {'hash': fingerprints[library['id']]}
+                    print(f"Formatted {len(sources)} files using {args.clang_format}, {formatted} through clang-format, {cached} from cache, "
+                          f"{written} files changed.")
+                    if unformatted:
+                        print(f"clang-format failed on {len(failed)} files, {unformatted} libraries will be generated again on the next run.")
+            finally:
+                # Keep the libraries finished so far even if a later one fails
+                save_manifest(args.output, manifest)
+            print(f"Templates generated successfully at {args.output} for {len(stale)} libraries in {time.perf_counter() - start:.2f} s, "
+                  f"{len(libraries) - len(stale)} unchanged libraries skipped.")
 
     except Exception as e:
         print(f"An error occurred: {e}")
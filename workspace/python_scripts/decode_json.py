@@ -1,4 +1,6 @@
+import collections
 import json
+import mmap
 import re
 import sys
 
@@ -16,48 +18,51 @@ class DecodeJson:
             print(f"Failed to decode JSON from file {self.json_path}.")
             sys.exit(1)  # Exit if there's an error in JSON format
 
+        # Build the id and path indexes once so lookups do not walk the tree
+        self.id_index = {}
+        self.path_index = {}
+        self.parent_index = {}
+        self._resolved = {}
+        self._build_index(self.json_data, [])
+
+    def _build_index(self, json_data, path, parent=None):
+        """Helper function for recursively indexing every object that has an 'id'."""
+        if isinstance(json_data, dict):
+            if 'id' in json_data:
+                obj_path = tuple(path)
+                try:
+                    # Keep the first match, the same one the tree walk used to return
+                    self.id_index.setdefault(json_data['id'], (json_data, obj_path))
+                except TypeError:
+                    pass  # Unhashable 'id' values can never be searched for
+                self.path_index[obj_path] = json_data
+                # Point to the nearest enclosing object with an 'id', ancestors are then found without walking paths
+                self.parent_index[id(json_data)] = (parent, obj_path)
+                parent = json_data
+            for key, value in json_data.items():
+                if isinstance(value, (dict, list)):
+                    path.append(key)
+                    self._build_index(value, path, parent)
+                    path.pop()
+
+        elif isinstance(json_data, list):
+            for index, item in enumerate(json_data):
+                if isinstance(item, (dict, list)):
+                    path.append(str(index))
+                    self._build_index(item, path, parent)
+                    path.pop()
+
     def search_by_id(self, target_id, path=[]):
         """Search for an object by its 'id' field within self.json_data."""
         try:
-            if isinstance(self.json_data, dict):
-                for key, value in self.json_data.items():
-                    if key == "id" and value == target_id:
-                        return self.json_data, path  # Return the entire object and its path
-                    else:
-                        result = self._recursive_search(target_id, value, path + [key])
-                        if result[0]:  # Return as soon as the object is found
-                            return result  # Already a tuple (object, path)
-
-            elif isinstance(self.json_data, list):
-                for index, item in enumerate(self.json_data):
-                    result = self._recursive_search(target_id, item, path + [str(index)])
-                    if result[0]:
-                        return result  # Already a tuple (object, path)
-        except Exception as e:
-            print(f"Error encountered during search: {e}")
-            return None, path
+            entry = self.id_index.get(target_id)
+        except TypeError:
+            entry = None  # Unhashable ids cannot be in the index
+        if entry is None:
+            return None, path  # Return (None, path) if no matching object is found
 
-        return None, path  # Return (None, path) if no matching object is found
-
-    def _recursive_search(self, target_id, json_data, path):
-        """Helper function for recursively searching by 'id'."""
-        try:
-            if isinstance(json_data, dict):
-                for key, value in json_data.items():
-                    if key == "id" and value == target_id:
-                        return json_data, path  # Return the matched dictionary object and path
-                    result = self._recursive_search(target_id, value, path + [key])
-                    if result[0]:
-                        return result  # Already a tuple (object, path)
-
-            elif isinstance(json_data, list):
-                for index, item in enumerate(json_data):
-                    result = self._recursive_search(target_id, item, path + [str(index)])
-                    if result[0]:
-                        return result  # Already a tuple (object, path)
-        except Exception as e:
-            print(f"Error during recursive search: {e}")
-        return None, path  # Return (None, path) if nothing is found at this level
+        obj, obj_path = entry
+        return obj, path + list(obj_path)  # Return a fresh path list, callers may modify it
     
     def extract_guid(self, text):
         """Extract a GUID from the provided text."""
@@ -70,43 +75,211 @@ class DecodeJson:
             print(f"Error extracting GUID: {e}")
             return None
 
+    def resolve(self, reference):
+        """Return the object a reference such as '${id:...}' points to, caching the result per reference."""
+        try:
+            return self._resolved[reference]
+        except KeyError:
+            pass
+        except TypeError:
+            return self.search_by_id(self.extract_guid(reference))[0]  # Unhashable references are not cached
+        target = self.search_by_id(self.extract_guid(reference))[0]
+        self._resolved[reference] = target
+        return target
+
     def return_parent(self, target_id, tag):
         """Return the parent object of an item with the specified 'id' and 'tag'."""
-        def search_parent(path_child, tag):
-            try:
-                # Base case: If path is empty, return None (we have reached the root)
-                if not path_child:
-                    return [None, []]
-
-                result = self.json_data  # Start with the root of the JSON
-                for key in path_child:
-                    if isinstance(key, str) and key.isdigit():
-                        key = int(key)  # Convert string key to integer if it's a numeric index
-                    result = result[key]  # Navigate one level deeper
-
-                # If 'id' and 'tags' exist and the tag matches, return the current object
-                if 'id' in result and 'tags' in result and tag in result['tags']:
-                    return [result, path_child]
-
-                # If no match, go up one level in the path
-                path_child.pop()
-                return search_parent(path_child, tag)
-
-            except KeyError as e:
-                print(f"KeyError encountered: {e} in path {path_child}")
-                return None, path_child
-            except Exception as e:
-                print(f"Unexpected error during parent search: {e}")
-                return None, path_child
-
         try:
             # First, find the child item with the specified 'id'
-            [child, path_child] = self.search_by_id(target_id)
+            child = self.search_by_id(target_id)[0]
             if not child:
                 return [None, []]
 
-            # Then, find the parent with the matching 'tag'
-            return search_parent(path_child, tag)
+            # Then, follow the parent pointers up to the first object with the matching 'tag'
+            while child is not None:
+                parent, child_path = self.parent_index[id(child)]
+                if not child_path:
+                    break  # We have reached the root
+                if 'tags' in child and tag in child['tags']:
+                    return [child, list(child_path)]
+                child = parent
+            return [None, []]
         except Exception as e:
             print(f"Error in return_parent: {e}")
-            return [None, []]
\ No newline at end of file
+            return [None, []]
+
+class _StreamRecord:
+    """Offsets and metadata of one object with an 'id' seen by StreamingDecodeJson."""
+    __slots__ = ('start', 'end', 'depth', 'subpath', 'tags', 'parent')
+
+    def __init__(self, start, path, parent):
+        self.start = start
+        self.end = None  # Set once the closing brace has been scanned
+        # Only the part of the path below the parent record is stored
+        self.depth = len(path)
+        self.subpath = tuple(path[parent.depth:]) if parent is not None else tuple(path)
+        self.tags = ()
+        self.parent = parent
+
+    @property
+    def path(self):
+        parts = []
+        record = self
+        while record is not None:
+            parts.append(record.subpath)
+            record = record.parent
+        return [key for subpath in reversed(parts) for key in subpath]
+
+class StreamingDecodeJson:
+    """
+    Answer id lookups without loading the whole file. The file is memory-mapped and scanned
+    as a stream of tokens only as far as a lookup needs; the index keeps offsets, paths and
+    tags, and a subtree is parsed only when it is returned.
+    """
+    # Strings (with an optional ':' when they are keys) and the structural characters we track
+    _TOKEN = re.compile(rb'"([^"\\]*(?:\\.[^"\\]*)*)"(\s*:)?|[{}\[\],]')
+    # Objects parsed most recently, a converter looks the same elements up many times
+    LOADED_CACHE_SIZE = 256
+
+    extract_guid = DecodeJson.extract_guid
+    resolve = DecodeJson.resolve
+
+    def __init__(self, json_path):
+        self.json_path = json_path
+        try:
+            with open(self.json_path, 'rb') as json_file:
+                self._map = mmap.mmap(json_file.fileno(), 0, access=mmap.ACCESS_READ)
+        except FileNotFoundError:
+            print(f"File {self.json_path} not found.")
+            sys.exit(1)  # Exit the program if the file is not found
+        except ValueError:
+            print(f"Failed to decode JSON from file {self.json_path}.")
+            sys.exit(1)  # Empty files cannot be mapped
+        self.id_index = {}
+        self._resolved = {}
+        self._loaded = collections.OrderedDict()
+        self.finished = False
+        self._tokens = self._TOKEN.finditer(self._map)
+        # Each frame is [opener, start offset, record, array index, pending key, tags list]
+        self._stack = []
+        self._path = []
+
+    def close(self):
+        # The token iterator holds a view of the map, release it first
+        self._tokens = iter(())
+        self.finished = True
+        self._map.close()
+
+    @staticmethod
+    def _decode_string(raw):
+        # Keys and tags repeat on every node, interning keeps one copy of each
+        if b'\\' in raw:
+            return sys.intern(json.loads(b'"' + raw + b'"'))
+        return sys.intern(raw.decode('utf-8'))
+
+    def _fail(self):
+        print(f"Failed to decode JSON from file {self.json_path}.")
+        sys.exit(1)  # Exit if there's an error in JSON format
+
+    def _advance(self):
+        """Scan tokens until an object with an 'id' is closed; return its record, or None at the end."""
+        stack = self._stack
+        path = self._path
+        for match in self._tokens:
+            token = match.group(0)
+            first = token[0]
+            if first == 0x22:  # '"'
+                if not stack:
+                    continue
+                top = stack[-1]
+                if match.group(2):
+                    top[4] = self._decode_string(match.group(1))  # An object key
+                elif top[0] == 0x7b and top[4] == 'id' and top[2] is None:
+                    # The object's id, remember where it starts and which object encloses it
+                    value = self._decode_string(match.group(1))
+                    parent = None
+                    for frame in reversed(stack[:-1]):
+                        if frame[2] is not None:
+                            parent = frame[2]
+                            break
+                    top[2] = _StreamRecord(top[1], path, parent)
+                    self.id_index.setdefault(value, top[2])
+                elif top[0] == 0x5b and top[5] is not None:
+                    top[5].append(self._decode_string(match.group(1)))
+            elif first == 0x7b or first == 0x5b:  # '{' or '['
+                tags = None
+                if stack:
+                    top = stack[-1]
+                    if top[0] == 0x7b:
+                        path.append(top[4])
+                        if top[4] == 'tags' and first == 0x5b:
+                            tags = top[5] = []  # The parent object keeps the tag list
+                    else:
+                        path.append(str(top[3]))
+                stack.append([first, match.start(), None, 0, None, tags])
+            elif first == 0x2c:  # ','
+                if stack:
+                    if stack[-1][0] == 0x5b:
+                        stack[-1][3] += 1
+                    else:
+                        stack[-1][4] = None
+            else:  # '}' or ']'
+                if not stack or stack[-1][0] != (0x7b if first == 0x7d else 0x5b):
+                    self._fail()
+                frame = stack.pop()
+                if stack:
+                    path.pop()
+                record = frame[2]
+                if record is not None:
+                    record.end = match.end()
+                    if frame[5]:
+                        record.tags = tuple(frame[5])
+                    return record
+        if stack:
+            self._fail()
+        self.finished = True
+        return None
+
+    def _find(self, target_id):
+        """Return the record of 'target_id', scanning until its 'id' has been seen."""
+        record = self.id_index.get(target_id)
+        while record is None and not self.finished:
+            self._advance()
+            record = self.id_index.get(target_id)
+        return record
+
+    def _complete(self, record):
+        """Keep scanning until the object of 'record' has been closed."""
+        while record.end is None and not self.finished:
+            self._advance()
+        return record.end is not None
+
+    def _load(self, record):
+        """Parse the object of a completed record, keeping the last LOADED_CACHE_SIZE ones so memory stays bounded."""
+        obj = self._loaded.pop(record, None)
+        if obj is None:
+            try:
+                obj = json.loads(self._map[record.start:record.end])
+            except json.JSONDecodeError:
+                self._fail()
+            if len(self._loaded) >= self.LOADED_CACHE_SIZE:
+                self._loaded.popitem(last=False)
+        self._loaded[record] = obj
+        return obj
+
+    def search_by_id(self, target_id, path=[]):
+        """Search for an object by its 'id' field, scanning the file only as far as needed."""
+        record = self._find(target_id)
+        if record is None or not self._complete(record):
+            return None, path  # Return (None, path) if no matching object is found
+        return self._load(record), path + record.path
+
+    def return_parent(self, target_id, tag):
+        """Return the parent object of an item with the specified 'id' and 'tag'."""
+        record = self._find(target_id)
+        # The item itself is checked first, the root object never is
+        while record is not None and record.depth:
+            if self._complete(record) and tag in record.tags:
+                return [self._load(record), record.path]
+            record = record.parent
+        return [None, []]
@@ -0,0 +1,38 @@
+import os
+import threading
+
+def write_atomic(file_path, content, encoding='utf-8', newline=None):
+    """
+    Write content, text or bytes, to file_path through a temporary file renamed over it, so a
+    concurrent reader finds the old or the new file but never a half written one.
+    """
+    directory, basename = os.path.split(os.path.abspath(file_path))
+    os.makedirs(directory, exist_ok=True)
+    # Hidden and unique per process and thread, build tools matching *.c or *.svg never pick it up
+    temp_path = os.path.join(directory, f".{basename}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        if isinstance(content, bytes):
+            with open(temp_path, 'wb') as temp_file:
+                temp_file.write(content)
+        else:
+            with open(temp_path, 'w', encoding=encoding, newline=newline) as temp_file:
+                temp_file.write(content)
+        os.replace(temp_path, file_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+def write_if_changed(file_path, content, encoding='utf-8', newline=None):
+    """
+    Write content to file_path with write_atomic unless the file already holds it, an unchanged
+    file keeps its timestamp. Returns True if the file was written.
+    """
+    try:
+        with open(file_path, 'r', encoding=encoding, newline=newline) as existing_file:
+            if existing_file.read() == content:
+                return False
+    except (FileNotFoundError, UnicodeDecodeError):
+        pass
+    write_atomic(file_path, content, encoding, newline)
+    return True
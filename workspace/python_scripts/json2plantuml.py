@@ -1,4 +1,12 @@
-from decode_json import DecodeJson
+from decode_json import DecodeJson, StreamingDecodeJson
+from validate_json import check_model
+from state_machine import StateMachine
+import argparse
+import os
+import sys
+from file_writer import write_if_changed
+from preview_server import serve
+from concurrent.futures import ProcessPoolExecutor
 
 # Define colors array
 colors = [
@@ -57,6 +65,25 @@ class PlantUMLReqConverter(PlantUMLConverter):
         else:
             raise NotImplementedError("Json provided on PlantUMLReqConverter does not contain the 'reqs' tag")
         
+class PlantUMLInterfaceConverter(PlantUMLConverter):
+    def generate(self):
+        type = 'interface'
+        if 'tags' in self.json and 'interface' in self.json['tags']:
+            try:
+                plantuml_output = f"@startuml {self.json['id']}\n"
+                plantuml_output += f'class {self.json["label"]} <<{type}>>\n'
+                plantuml_output += f'hide <<{type}>> methods\n' 
+                plantuml_output += f'hide <<{type}>> circle\n'
+                plantuml_output += f'hide <<{type}>> attributes\n'
+                plantuml_output += '@enduml\n'
+                return plantuml_output
+                
+            except Exception as e:  # Catching the general exception
+                raise RuntimeError(f"Failed to generate PlantUML: {e}")
+                
+        else:
+            raise NotImplementedError("Json provided on PlantUMLInterfaceConverter does not contain the 'interface' tag")
+        
 class PlantUMLLayerConverter(PlantUMLConverter):
     def generate(self):
         type = 'layer'
@@ -74,7 +101,7 @@ class PlantUMLLayerConverter(PlantUMLConverter):
                         # Optionally handle ports for each component, if needed
                         if 'ports' in component:
                             for port in component['ports']:
-                                interface = self.decoder.search_by_id(self.decoder.extract_guid(port['interface']))[0]
+                                interface = self.decoder.resolve(port['interface'])
                                 print(port)
                                 use = "" if port["use"] == "" else f': <<{port["use"]}>>'
                                 if interface:
@@ -98,12 +125,13 @@ class PlantUMLComponentConverter(PlantUMLConverter):
         label = json['label']
         ports = json['ports']
         plantuml = f'  component {label}\n'
+        # Resolve the parent's interfaces once, not once per subcomponent port
+        parent_interfaces = [(parent_port, self.decoder.resolve(parent_port['interface'])) for parent_port in parent_ports]
         for port in ports:
-            interface = self.decoder.search_by_id(self.decoder.extract_guid(port['interface']))[0]
+            interface = self.decoder.resolve(port['interface'])
             use = "" if port["use"] == "" else f': <<{port["use"]}>>'
             found_port = False    
-            for parent_port in parent_ports:
-                parent_int = self.decoder.search_by_id(self.decoder.extract_guid(parent_port['interface']))[0]
+            for parent_port, parent_int in parent_interfaces:
                 if interface and parent_int and parent_int['label'] == interface['label']:
                     found_port = True
                     if port["direction"] == 'in':
@@ -138,7 +166,7 @@ class PlantUMLComponentConverter(PlantUMLConverter):
                 #Implement the interfaces
                 for port in ports:
                     use = "" if port["use"] == "" else f': <<{port["use"]}>>'
-                    interface = self.decoder.search_by_id(self.decoder.extract_guid(port['interface']))[0]
+                    interface = self.decoder.resolve(port['interface'])
                     if interface:
                         if port["direction"] == 'in':
                             plantuml_output += f'{port["label"]} <--( {interface["label"]} {use}\n'
@@ -165,7 +193,7 @@ class PlantUMLClassConverter(PlantUMLConverter):
                 plantuml_output = f"@startuml {id}\n"
                 plantuml_output += f'class {label} <<{type}>>{{\n'
                 for var in variables:
-                    datatype = self.decoder.search_by_id(self.decoder.extract_guid(var['datatype']))[0]['label']
+                    datatype = self.decoder.resolve(var['datatype'])['label']
                     datatype = self._apply_modifiers(datatype, var)
 
                     visibility = var['visibility']
@@ -176,14 +204,14 @@ class PlantUMLClassConverter(PlantUMLConverter):
                     visibility_symbol = self._get_visibility_symbol(visibility)
 
                     # Parameters
-                    param_strs = [f"{p['label']}: {self.decoder.search_by_id(self.decoder.extract_guid(p['datatype']))[0]['label']}" for p in fun['parameters']]
+                    param_strs = [f"{p['label']}: {self.decoder.resolve(p['datatype'])['label']}" for p in fun['parameters']]
 
                     # Function signature
                     plantuml_output += f"  {visibility_symbol}{fun['label']}({', '.join(param_strs)})"
 
                     # Return type
                     return_type_info = fun.get('returntype', {})
-                    return_datatype = self.decoder.search_by_id(self.decoder.extract_guid(return_type_info['datatype']))[0]['label']
+                    return_datatype = self.decoder.resolve(return_type_info['datatype'])['label']
                     return_datatype = self._apply_modifiers(return_datatype, return_type_info)
 
                     plantuml_output += f" : {return_datatype}\n"
@@ -199,47 +227,56 @@ class PlantUMLClassConverter(PlantUMLConverter):
             raise NotImplementedError("Json provided on PlantUMLClassConverter does not contain the 'lib' tag")
 
 class PlantUMLHSMConverter(PlantUMLConverter):
-    def _decode_states(self, json, depth=0):
-        """Recursively decode states into PlantUML format."""
+    def _decode_states(self, machine, index):
+        """Recursively decode a state of the StateMachine and its children into PlantUML format."""
+        state = machine.states[index]
+        depth = machine.depths[index]
         indent = '  ' * depth
+        label = lambda node: node['label']
+        target_label = lambda target: label(machine.states[target[1]] if target[0] == 'state' else machine.guards[target[1]])
+        transitions = [transition for transition in machine.transitions[index] if transition[2][0] != 'terminate']
+        if len(transitions) != len(state.get('transitions', [])):
+            raise RuntimeError('; '.join(machine.problems))
         plantuml = ''
-        if 'isInit' in json and json['isInit']:
-            plantuml += indent+f'[*] --> {json["label"]}\n'
-        if 'isTerminated' in json and json['isTerminated'] != "":
-            plantuml += indent+f'{json["label"]} --> [*] : {self.decoder.search_by_id(self.decoder.extract_guid(json["isTerminated"]))[0]["label"]}\n'
-        plantuml += indent+f'state {json["label"]} #{colors[depth]}{{\n'
-        if 'states' in json and json['states']:
-            for state in json['states']:
-                plantuml += self._decode_states(state, depth+1)  # Recursively call and accumulate PlantUML string
-        if 'hsms' in json and json['hsms']:
-            for hsm in json['hsms']:
-                plantuml += indent + f'  state {hsm["label"]} #line.dotted;\n'
-        if 'guards' in json and json['guards']:
-            for guard in json['guards']:
-                    choice_state = guard['label']
-                    plantuml += indent+f"  state {choice_state} <<choice>> : {guard['condition']}\n"
-                    plantuml += indent+f"  {choice_state} --> {self.decoder.search_by_id(self.decoder.extract_guid(guard['true']['to']))[0]['label']} : [{guard['condition']}=true]\n"
-                    plantuml += indent+f"  {choice_state} --> {self.decoder.search_by_id(self.decoder.extract_guid(guard['false']['to']))[0]['label']} : [{guard['condition']}=false]\n"
-        if 'transitions' in json and json['transitions']:
-            for tran in json['transitions']:
-                event = self.decoder.search_by_id(self.decoder.extract_guid(tran['event']))[0]['label']
-                target_state = self.decoder.search_by_id(self.decoder.extract_guid(tran['transition']['to']))[0]['label']
-                if target_state != json['label']:
-                    plantuml += indent + f"  {json['label']} --> {target_state} : {event}\n"
-                else:
-                    plantuml += indent + f"  {target_state} : {event}\n"
+        if state.get('isInit'):
+            plantuml += indent+f'[*] --> {state["label"]}\n'
+        for node, event, target, activity in machine.transitions[index]:
+            if target[0] == 'terminate':
+                plantuml += indent+f'{state["label"]} --> [*] : {label(machine.events[event])}\n'
+        # Colors repeat for states nested deeper than there are colors
+        plantuml += indent+f'state {state["label"]} #{colors[depth % len(colors)]}{{\n'
+        for child in machine.children[index]:
+            plantuml += self._decode_states(machine, child)
+        for hsm in state.get('hsms', []):
+            plantuml += indent + f'  state {hsm["label"]} #line.dotted;\n'
+        for guard in state.get('guards', []):
+            choice_state = guard['label']
+            activity, on_true, on_false = machine.guard_branches[machine.guard_index[guard['id']]]
+            plantuml += indent+f"  state {choice_state} <<choice>> : {guard['condition']}\n"
+            for value, (target, activity) in (('true', on_true), ('false', on_false)):
+                # A branch without a target stays in the current state, there is nothing to draw
+                if target is not None:
+                    plantuml += indent+f"  {choice_state} --> {target_label(target)} : [{guard['condition']}={value}]\n"
+                elif guard[value].get('to'):
+                    raise RuntimeError('; '.join(machine.problems))
+        for node, event, target, activity in transitions:
+            if target != ('state', index):
+                plantuml += indent + f"  {state['label']} --> {target_label(target)} : {label(machine.events[event])}\n"
+            else:
+                plantuml += indent + f"  {state['label']} : {label(machine.events[event])}\n"
         plantuml += indent + '}\n'
         return plantuml
-        
+
     def generate(self):
         if 'tags' in self.json and 'hsm' in self.json['tags']:
             id = self.json['id']
-            label = self.json['label']
             try:
+                # Events and activities may be defined outside the HSM, the decoder finds them
+                machine = StateMachine(self.json, resolve=self.decoder.resolve)
                 plantuml_output = f"@startuml {id}\n"
-                for state in self.json['States']:
-                    plantuml_output += self._decode_states(state)
-                
+                for state in machine.top_states:
+                    plantuml_output += self._decode_states(machine, state)
+
                 plantuml_output += '@enduml\n'
                 return plantuml_output
 
@@ -247,4 +284,161 @@ class PlantUMLHSMConverter(PlantUMLConverter):
                 raise RuntimeError(f"Failed to generate PlantUML: {e}")
 
         else:
-            raise NotImplementedError("Json provided on PlantUMLClassConverter does not contain the 'hsm' tag")
\ No newline at end of file
+            raise NotImplementedError("Json provided on PlantUMLClassConverter does not contain the 'hsm' tag")
+
+# Converter used for each tag, an element is rendered by the first of its tags found here
+CONVERTERS = {
+    'layer': PlantUMLLayerConverter,
+    'component': PlantUMLComponentConverter,
+    'lib': PlantUMLClassConverter,
+    'hsm': PlantUMLHSMConverter,
+    'reqs': PlantUMLReqConverter,
+    'interface': PlantUMLInterfaceConverter
+}
+
+def diagram_tag(json):
+    """Return the tag that selects the converter for this element, or None if it has no diagram."""
+    for tag in json.get('tags', []):
+        if tag in CONVERTERS:
+            return tag
+    return None
+
+def convert(json, decoder):
+    """Render the PlantUML diagram of a single element."""
+    tag = diagram_tag(json)
+    if tag is None:
+        raise NotImplementedError(f"No PlantUML converter for an element tagged {json.get('tags', [])}")
+    return CONVERTERS[tag](json, decoder).generate()
+
+def find_diagram_elements(json_data):
+    """Yield (tag, element) for every element that has a diagram, in a single pass over the model."""
+    if isinstance(json_data, dict):
+        if 'id' in json_data and isinstance(json_data.get('tags'), list):
+            tag = diagram_tag(json_data)
+            if tag is not None:
+                yield tag, json_data
+        for key, value in json_data.items():
+            # '$links' only repeats elements defined elsewhere in the model
+            if key != '$links':
+                yield from find_diagram_elements(value)
+    elif isinstance(json_data, list):
+        for item in json_data:
+            yield from find_diagram_elements(item)
+
+def diagram_filename(tag, id, output_path):
+    return os.path.join(output_path, tag, f'{id}.puml')
+
+def export_diagram(tag, id, decoder, output_path):
+    """Render one element and store it. Returns (status, detail) with status 'written', 'unchanged' or 'failed'."""
+    try:
+        json, path = decoder.search_by_id(id)
+        file_path = diagram_filename(tag, id, output_path)
+        written = write_if_changed(file_path, convert(json, decoder), newline='')
+        return ('written' if written else 'unchanged'), file_path
+    except Exception as e:
+        return 'failed', str(e)
+
+# Model and output folder shared by every diagram exported in a worker process
+_worker_decoder = None
+_worker_output_path = None
+
+def _init_worker(json_path, output_path):
+    global _worker_decoder, _worker_output_path
+    _worker_decoder = DecodeJson(json_path)
+    _worker_output_path = output_path
+
+def _export_diagram_in_worker(element):
+    tag, id = element
+    return export_diagram(tag, id, _worker_decoder, _worker_output_path)
+
+def export_project(json_path, output_path, jobs=1, decoder=None):
+    """
+    Write one .puml per diagram element of the model into output_path/<tag>/<id>.puml, across a process pool when
+    jobs > 1. Files whose content did not change are left untouched. Yields (tag, id, status, detail) in model order.
+    """
+    decoder = decoder or DecodeJson(json_path)
+    elements = [(tag, json['id']) for tag, json in find_diagram_elements(decoder.json_data)]
+    if jobs > 1 and len(elements) > 1:
+        # Each worker loads the model once, only the tag and id are sent per task
+        with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker, initargs=(json_path, output_path)) as executor:
+            for (tag, id), (status, detail) in zip(elements, executor.map(_export_diagram_in_worker, elements, chunksize=8)):
+                yield tag, id, status, detail
+    else:
+        for tag, id in elements:
+            status, detail = export_diagram(tag, id, decoder, output_path)
+            yield tag, id, status, detail
+
+def serve_plantuml(models, params):
+    """Preview server handler: render the element 'id' of the model 'file'."""
+    decoder = models.get(params["file"])
+    json_data, path = decoder.search_by_id(params["id"])
+    if json_data is None:
+        raise ValueError(f"ID {params['id']} not found")
+    return convert(json_data, decoder)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert JSON to PlantUML")
+    parser.add_argument("-f", "--file", help="Path to the JSON file")
+    selection = parser.add_mutually_exclusive_group()
+    selection.add_argument("-i", "--id", help="ID to search for in the JSON")
+    selection.add_argument("--export", metavar="DIR", help="Write a .puml for every layer, component, lib, hsm, reqs and interface into DIR")
+    parser.add_argument("-o", "--output", help="Where to store the PlantUML file of a single ID")
+    parser.add_argument("-j", "--jobs", type=int, default=1, help="Number of worker processes used by --export")
+    parser.add_argument("--validate", action="store_true", help="Check the model against workspace/schemas before converting")
+    parser.add_argument("--serve", action="store_true", help="Keep running and answer JSON-RPC requests on stdin/stdout")
+    parser.add_argument("--stream", action="store_true", help="Scan the JSON file only as far as needed instead of loading it whole, with -i/--id")
+
+    args = parser.parse_args()
+
+    if args.serve:
+        serve({"plantuml": serve_plantuml})
+        sys.exit(0)
+    if not args.file or not (args.id or args.export):
+        parser.error("the following arguments are required: -f/--file and one of -i/--id, --export")
+    if args.stream and args.export:
+        parser.error("--stream cannot be used with --export, the export walks the whole model")
+
+    if args.export:
+        if args.validate:
+            check_model(args.file)
+        counts = {'written': 0, 'unchanged': 0, 'failed': 0}
+        for tag, id, status, detail in export_project(args.file, args.export, args.jobs):
+            counts[status] += 1
+            if status == 'written':
+                print(f"PlantUML content has been written to {detail}")
+            elif status == 'failed':
+                print(f"Failed to export {tag} {id}: {detail}", file=sys.stderr)
+        print(f"{counts['written']} diagrams written, {counts['unchanged']} unchanged, {counts['failed']} failed.")
+        sys.exit(1 if counts['failed'] else 0)
+
+    try:
+        if args.stream:
+            decoder = StreamingDecodeJson(args.file)
+            if args.validate:
+                check_model(args.file)
+        else:
+            decoder = DecodeJson(args.file)
+            if args.validate:
+                check_model(args.file, json_data=decoder.json_data)
+        json_data, path = decoder.search_by_id(args.id)
+        if json_data is None:
+            print(f"ID {args.id} not found.", file=sys.stderr)
+            sys.exit(1)
+        plantuml_output = convert(json_data, decoder)
+
+        if args.output:
+            # Ensure the output filename has a .puml extension
+            output_file_path = args.output
+            if not output_file_path.lower().endswith('.puml'):
+                output_file_path += '.puml'
+
+            with open(output_file_path, 'w', encoding='utf-8') as output_file:
+                output_file.write(plantuml_output)
+
+            print(f"PlantUML content has been written to {output_file_path}")
+        else:
+            print(plantuml_output)
+
+    except Exception as e:
+        print(f"Error in main execution: {e}", file=sys.stderr)
+        sys.exit(1)
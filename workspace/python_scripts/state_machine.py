@@ -0,0 +1,332 @@
+import argparse
+import re
+import sys
+from decode_json import DecodeJson
+
+# References between elements are stored as '${id:<guid>}'
+GUID_PATTERN = re.compile(r'\b[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}\b')
+
+def reference_id(reference):
+    """Return the id a reference such as '${id:...}' points to, or None for an empty or malformed reference."""
+    match = GUID_PATTERN.search(reference) if isinstance(reference, str) else None
+    return match.group(0) if match else None
+
+def _label(node):
+    return node.get('label', 'unknown')
+
+class StateMachine:
+    """
+    An 'hsm' element resolved once into an indexed graph of numbered states, events, guards and activities.
+
+    States are numbered in preorder with their parent and children. Every transition of a state is kept
+    as declared, (node, event, target, activity), where target is ('state', state), ('guard', guard) or
+    ('terminate',) and activity an index in 'activities' or None. Guards keep (activity, true branch,
+    false branch), a branch being (target, activity) with a None target when it points to nothing.
+    Events and activities referenced from outside the HSM are added when a 'resolve' function
+    (reference -> element) is given. State machines nested in a state's 'hsms' are kept in 'submachines'.
+
+    Nested states are then flattened: 'table' holds, for every leaf, the step taken on every event,
+    inherited from the closest state that handles it. A step is (target, activity) where target is
+    ('state', leaf) with the leaf that is entered, ('guard', guard), ('internal',) or ('terminate',).
+    """
+    def __init__(self, hsm, resolve=None):
+        self.hsm = hsm
+        self.id = hsm.get('id', 'unknown')
+        self.label = _label(hsm)
+        self.resolve = resolve
+        # References that point to nothing in this state machine, as human readable messages
+        self.problems = []
+
+        self.events = list(hsm.get('Events', []))
+        self.event_index = {event.get('id'): index for index, event in enumerate(self.events)}
+        self.activities = list(hsm.get('Activities', []))
+        self.activity_index = {activity.get('id'): index for index, activity in enumerate(self.activities)}
+
+        # States in preorder, each with its parent (None at the top), children and depth
+        self.states = []
+        self.parents = []
+        self.children = []
+        self.depths = []
+        self.guards = []
+        self.guard_owners = []
+        self.submachines = []
+        stack = [(state, None) for state in reversed(hsm.get('States', []))]
+        while stack:
+            state, parent = stack.pop()
+            index = len(self.states)
+            self.states.append(state)
+            self.parents.append(parent)
+            self.children.append([])
+            self.depths.append(0 if parent is None else self.depths[parent] + 1)
+            if parent is not None:
+                self.children[parent].append(index)
+            for guard in state.get('guards', []):
+                self.guards.append(guard)
+                self.guard_owners.append(index)
+            self.submachines += state.get('hsms', [])
+            stack += [(child, index) for child in reversed(state.get('states', []))]
+        self.top_states = [index for index, parent in enumerate(self.parents) if parent is None]
+        self.state_index = {state.get('id'): index for index, state in enumerate(self.states)}
+        self.guard_index = {guard.get('id'): index for index, guard in enumerate(self.guards)}
+
+        self.leaves = [index for index, children in enumerate(self.children) if not children]
+        self.leaf_index = {state: leaf for leaf, state in enumerate(self.leaves)}
+        self.initial = self.initial_leaf(None) if self.states else None
+
+        # Every reference is resolved here, once
+        self.transitions = [self._state_transitions(index) for index in range(len(self.states))]
+        self.guard_branches = [self._guard_branches(index) for index in range(len(self.guards))]
+
+        self.guard_steps = [(activity, self.step(on_true), self.step(on_false))
+                            for activity, on_true, on_false in self.guard_branches]
+        self.table, self.table_transitions = self._flatten()
+
+    def initial_leaf(self, state):
+        """Leaf entered when 'state' is entered (None for the whole machine), following the 'isInit' children."""
+        children = self.children[state] if state is not None else self.top_states
+        while children:
+            state = next((child for child in children if self.states[child].get('isInit')), children[0])
+            children = self.children[state]
+        return self.leaf_index[state]
+
+    def _describe(self, node):
+        return f"{_label(node)} ({node.get('id', 'unknown')})"
+
+    def _lookup(self, reference, index, elements, tag):
+        """Index of the event or activity a reference points to, added when it is defined outside the HSM."""
+        id = reference_id(reference)
+        if id in index:
+            return index[id]
+        element = self.resolve(reference) if self.resolve and id else None
+        if not isinstance(element, dict) or tag not in element.get('tags', []):
+            return None
+        index[id] = len(elements)
+        elements.append(element)
+        return index[id]
+
+    def _activity(self, reference, owner):
+        if not reference:
+            return None
+        index = self._lookup(reference, self.activity_index, self.activities, 'activity')
+        if index is None:
+            self.problems.append(f"{self._describe(owner)}: activity {reference} not found in HSM {self.label}")
+        return index
+
+    def _event(self, reference, owner):
+        index = self._lookup(reference, self.event_index, self.events, 'event')
+        if index is None:
+            self.problems.append(f"{self._describe(owner)}: event {reference} not found in HSM {self.label}")
+        return index
+
+    def _target(self, reference, owner):
+        id = reference_id(reference)
+        if id in self.state_index:
+            return ('state', self.state_index[id])
+        if id in self.guard_index:
+            return ('guard', self.guard_index[id])
+        self.problems.append(f"{self._describe(owner)}: target {reference} not found in HSM {self.label}")
+        return None
+
+    def _state_transitions(self, index):
+        """Return [(node, event, target, activity)] of a state, an 'isTerminated' event comes after the explicit transitions."""
+        state = self.states[index]
+        transitions = []
+        for transition in state.get('transitions', []):
+            event = self._event(transition.get('event'), transition)
+            target = self._target(transition.get('transition', {}).get('to'), transition)
+            if event is not None and target is not None:
+                transitions.append((transition, event, target, self._activity(transition.get('transition', {}).get('activity'), transition)))
+        if state.get('isTerminated'):
+            event = self._event(state['isTerminated'], state)
+            if event is not None:
+                transitions.append((state, event, ('terminate',), None))
+        return transitions
+
+    def _guard_branches(self, index):
+        guard = self.guards[index]
+        branches = [(self._target(guard.get(branch, {}).get('to'), guard), self._activity(guard.get(branch, {}).get('activity'), guard))
+                    for branch in ('true', 'false')]
+        return (self._activity(guard.get('activity'), guard), branches[0], branches[1])
+
+    def step(self, branch, source=None):
+        """
+        Turn a declared (target, activity) into the step taken from state 'source'. A transition back to
+        its own state is internal, it does not leave the state; a branch without a target stays too.
+        """
+        target, activity = branch
+        if target is None or (target[0] == 'state' and target[1] == source):
+            return (('internal',), activity)
+        if target[0] == 'state':
+            return (('state', self.initial_leaf(target[1])), activity)
+        return (target, activity)
+
+    def _flatten(self):
+        """
+        Return, for every leaf, the step taken on every event (None when no state handles it) and the
+        transition node that step comes from. The first transition of a state on an event wins.
+        """
+        # Preorder numbering puts every parent before its children, one pass resolves the inheritance
+        handlers = []
+        for index, transitions in enumerate(self.transitions):
+            inherited = handlers[self.parents[index]] if self.parents[index] is not None else {}
+            own = {}
+            for node, event, target, activity in transitions:
+                if event not in own:
+                    own[event] = (self.step((target, activity), index), node)
+            handlers.append({**inherited, **own} if own else inherited)
+        table = []
+        sources = []
+        for state in self.leaves:
+            handled = [handlers[state].get(event, (None, None)) for event in range(len(self.events))]
+            table.append([step for step, node in handled])
+            sources.append([node for step, node in handled])
+        return table, sources
+
+    def analyze(self):
+        """Check the state machine, see StateMachineReport."""
+        return StateMachineReport(self)
+
+class StateMachineReport:
+    """
+    Checks of a StateMachine, each in time linear in the size of its graph and dispatch table:
+    - reachable: states that can be active, from the initial leaf through the dispatch table and guards;
+    - unreachable: the other states;
+    - stuck: reachable leaves no event can leave, unless the state machine never terminates anywhere;
+    - conflicts: (state, event, transitions) for states with several transitions on the same event,
+      only the first one is taken;
+    - never_taken: transitions of reachable states that no reachable leaf takes, because a nested
+      state handles their event;
+    - guard_cycles: guards that lead back to themselves without reaching a state;
+    - unhandled_events: events no reachable state handles.
+    """
+    def __init__(self, machine):
+        self.machine = machine
+        self.reachable, self.terminates = self._reachable()
+        self.unreachable = [state for state in range(len(machine.states)) if state not in self.reachable]
+        self.stuck = [machine.leaves[leaf] for leaf, row in enumerate(machine.table)
+                      if machine.leaves[leaf] in self.reachable and self.terminates
+                      and all(step is None or step[0] == ('internal',) for step in row)]
+
+        self.conflicts = []
+        for state, transitions in enumerate(machine.transitions):
+            by_event = {}
+            for transition in transitions:
+                by_event.setdefault(transition[1], []).append(transition[0])
+            self.conflicts += [(state, event, nodes) for event, nodes in by_event.items() if len(nodes) > 1]
+        losers = {id(node) for state, event, nodes in self.conflicts for node in nodes[1:]}
+
+        taken = {id(node) for leaf, nodes in enumerate(machine.table_transitions)
+                 if machine.leaves[leaf] in self.reachable for node in nodes if node is not None}
+        self.never_taken = [(state, node) for state, transitions in enumerate(machine.transitions) if state in self.reachable
+                            for node, event, target, activity in transitions if id(node) not in taken and id(node) not in losers]
+        handled = {event for leaf, row in enumerate(machine.table) if machine.leaves[leaf] in self.reachable
+                   for event, step in enumerate(row) if step is not None}
+        self.unhandled_events = [event for event in range(len(machine.events)) if event not in handled]
+        self.guard_cycles = self._guard_cycles()
+
+    def _reachable(self):
+        """Return (reachable states, whether termination is reachable), walking leaves and guards once each."""
+        machine = self.machine
+        if machine.initial is None:
+            return set(), False
+        seen_leaves = {machine.initial}
+        seen_guards = set()
+        pending = [('state', machine.initial)]
+        terminates = False
+        while pending:
+            kind, index = pending.pop()
+            if kind == 'state':
+                steps = [step for step in machine.table[index] if step is not None]
+            else:
+                activity, on_true, on_false = machine.guard_steps[index]
+                steps = [on_true, on_false]
+            for (target, activity) in steps:
+                if target[0] == 'terminate':
+                    terminates = True
+                elif target[0] == 'state' and target[1] not in seen_leaves:
+                    seen_leaves.add(target[1])
+                    pending.append(target)
+                elif target[0] == 'guard' and target[1] not in seen_guards:
+                    seen_guards.add(target[1])
+                    pending.append(target)
+        # A leaf is active together with all its ancestors
+        reachable = set()
+        for leaf in seen_leaves:
+            state = machine.leaves[leaf]
+            while state is not None and state not in reachable:
+                reachable.add(state)
+                state = machine.parents[state]
+        return reachable, terminates
+
+    def _guard_cycles(self):
+        """Cycles of the guard -> guard branches, found with an iterative depth first search."""
+        machine = self.machine
+        successors = [[target[1] for target, activity in (on_true, on_false) if target is not None and target[0] == 'guard']
+                      for activity, on_true, on_false in machine.guard_branches]
+        state = [0] * len(machine.guards)  # 0 not visited, 1 on the current path, 2 done
+        cycles = []
+        for start in range(len(machine.guards)):
+            if state[start]:
+                continue
+            path = [start]
+            iterators = [iter(successors[start])]
+            state[start] = 1
+            while iterators:
+                following = next(iterators[-1], None)
+                if following is None:
+                    state[path.pop()] = 2
+                    iterators.pop()
+                elif state[following] == 1:
+                    cycles.append(path[path.index(following):] + [following])
+                elif state[following] == 0:
+                    state[following] = 1
+                    path.append(following)
+                    iterators.append(iter(successors[following]))
+        return cycles
+
+    def messages(self):
+        """Every finding as a line of text, unresolved references first."""
+        machine = self.machine
+        state_label = lambda state: _label(machine.states[state])
+        messages = list(machine.problems)
+        messages += [f"HSM {machine.label}: state {state_label(state)} is unreachable" for state in self.unreachable]
+        messages += [f"HSM {machine.label}: state {state_label(state)} cannot be left" for state in self.stuck]
+        messages += [f"HSM {machine.label}: state {state_label(state)} has {len(nodes)} transitions on event {_label(machine.events[event])}, "
+                     f"only {_label(nodes[0])} is taken" for state, event, nodes in self.conflicts]
+        messages += [f"HSM {machine.label}: transition {_label(node)} of state {state_label(state)} is never taken, nested states handle its event"
+                     for state, node in self.never_taken]
+        messages += [f"HSM {machine.label}: guards {' -> '.join(_label(machine.guards[guard]) for guard in cycle)} form a cycle"
+                     for cycle in self.guard_cycles]
+        messages += [f"HSM {machine.label}: event {_label(machine.events[event])} is never handled" for event in self.unhandled_events]
+        return messages
+
+def find_hsms(json_data):
+    """Yield every 'hsm' element of a model, including the ones nested in states."""
+    stack = [json_data]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, dict):
+            if 'hsm' in node.get('tags', []):
+                yield node
+            stack += reversed([value for key, value in node.items() if key != '$links'])
+        elif isinstance(node, list):
+            stack += reversed(node)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check the state machines of a model for unreachable states, conflicts and guard cycles")
+    parser.add_argument("-f", "--file", required=True, help="Path to the JSON file")
+    parser.add_argument("-i", "--id", help="Only check the HSM with this ID")
+    args = parser.parse_args()
+
+    # Events and activities may be defined anywhere in the model, as for the PlantUML converter
+    decoder = DecodeJson(args.file)
+
+    findings = 0
+    for hsm in find_hsms(decoder.json_data):
+        if args.id and hsm.get('id') != args.id:
+            continue
+        for message in StateMachine(hsm, resolve=decoder.resolve).analyze().messages():
+            print(message)
+            findings += 1
+    print(f"{findings} findings.")
+    sys.exit(1 if findings else 0)
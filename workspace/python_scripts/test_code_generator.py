@@ -0,0 +1,168 @@
+import copy
+import functools
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+from code_generator import (
+    MANIFEST_FILENAME,
+    build_element_table,
+    build_link_table,
+    generate_state_machine,
+    load_manifest,
+    read_file_content,
+    render_library,
+    resolve_reference
+)
+from state_machine import StateMachine
+
+SCRIPTS_PATH = os.path.dirname(os.path.abspath(__file__))
+TEST_DATA_PATH = os.path.join(SCRIPTS_PATH, 'test_data')
+
+# A library with the 'motor' state machine: Idle, Running {RunA, RunB} with an inherited stop and reset,
+# the guards isOk -> isHot, Fault terminating on kill, and a state machine nested in Idle
+FIXTURE = os.path.join(TEST_DATA_PATH, 'library.json')
+
+def load_fixture():
+    with open(FIXTURE, 'r') as json_file:
+        return json.load(json_file)
+
+def reference(node):
+    return f"${{id:{node['id']}}}"
+
+def find_label(nodes, label):
+    return next(node for node in nodes if node.get('label') == label)
+
+class RenderLibraryTest(unittest.TestCase):
+    def test_golden_files(self):
+        # test_data/library.c and .h are the reviewed output, regenerate them when the templates change
+        fixture = load_fixture()
+        sources = render_library(read_file_content(os.path.join(SCRIPTS_PATH, 'elausa_template.c')),
+                                 read_file_content(os.path.join(SCRIPTS_PATH, 'elausa_template.h')),
+                                 fixture['library'], '', build_link_table(fixture['$links']))
+        self.assertEqual(len(sources), 2)
+        for filename, content in sources.items():
+            extension = os.path.splitext(filename)[1]
+            with self.subTest(extension=extension), open(os.path.join(TEST_DATA_PATH, 'library' + extension), 'r', newline='') as golden:
+                self.assertEqual(content, golden.read())
+
+class ManifestTest(unittest.TestCase):
+    def setUp(self):
+        self.temp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp.cleanup)
+        fixture = load_fixture()
+        library = fixture['library']
+        # Copies of the fixture library under other ids, every library of the model has its own files
+        self.ids = [library['id']] + [library['id'][:-1] + str(index) for index in range(2)]
+        libraries = [json.loads(json.dumps(library).replace(library['id'], id)) for id in self.ids]
+        for index, copied in enumerate(libraries):
+            copied['label'] = f'lib{index}'
+        self.model = os.path.join(self.temp.name, 'model.json')
+        with open(self.model, 'w') as json_file:
+            json.dump({'$links': fixture['$links'], 'Structure': [{'libraries': libraries}]}, json_file)
+        self.output = os.path.join(self.temp.name, 'output')
+        os.mkdir(self.output)
+
+    def generate(self, *args):
+        result = subprocess.run([sys.executable, os.path.join(SCRIPTS_PATH, 'code_generator.py'), '-f', self.model,
+                                 '-t', SCRIPTS_PATH, '-o', self.output] + list(args),
+                                capture_output=True, text=True, check=True)
+        self.assertNotIn('error', result.stdout.lower())
+        return result.stdout
+
+    def manifest(self):
+        self.assertTrue(os.path.isfile(os.path.join(self.output, MANIFEST_FILENAME)))
+        return load_manifest(self.output)
+
+    def test_incremental_runs(self):
+        self.assertIn('for 3 libraries', self.generate('--all'))
+        self.assertEqual(sorted(self.manifest()), sorted(self.ids))
+        self.assertEqual(len(os.listdir(self.output)), 7)  # A .c and a .h per library, and the manifest
+        self.assertIn('for 0 libraries', self.generate('--all'))
+        self.assertIn('up to date for ID', self.generate('-i', self.ids[1]))
+
+    def test_force_keeps_other_libraries(self):
+        self.generate('--all')
+        manifest = self.manifest()
+        self.assertIn('generated successfully', self.generate('-i', self.ids[1], '--force'))
+        self.assertEqual(self.manifest(), manifest)
+        self.assertIn('for 2 libraries', self.generate('--ids', ','.join(self.ids[:2]), '--force'))
+        self.assertEqual(self.manifest(), manifest)
+        # Nothing was lost, an incremental run still finds every library up to date
+        self.assertIn('for 0 libraries in', self.generate('--all'))
+
+    def test_changed_library_only(self):
+        self.generate('--all')
+        with open(self.model, 'r') as json_file:
+            model = json.load(json_file)
+        model['Structure'][0]['libraries'][2]['documentation'] = 'changed'
+        with open(self.model, 'w') as json_file:
+            json.dump(model, json_file)
+        output = self.generate('--all')
+        self.assertIn(f"({self.ids[2]})", output)
+        self.assertIn('for 1 libraries', output)
+
+class StateMachineTest(unittest.TestCase):
+    def setUp(self):
+        self.hsm = load_fixture()['library']['HSM'][0]
+
+    def test_dispatch_table(self):
+        machine = StateMachine(self.hsm)
+        self.assertEqual(machine.problems, [])
+        leaf = {machine.states[state]['label']: index for index, state in enumerate(machine.leaves)}
+        self.assertEqual(list(leaf), ['Idle', 'RunA', 'RunB', 'Fault'])
+        self.assertEqual([event['label'] for event in machine.events], ['go', 'stop', 'tick', 'reset', 'kill'])
+        self.assertEqual([activity['label'] for activity in machine.activities], ['log', 'beep', 'chk'])
+        log, beep, chk = range(3)
+        self.assertEqual(machine.table, [
+            # Idle: go enters Running, and so its initial leaf RunA
+            [(('state', leaf['RunA']), log), None, None, None, None],
+            # RunA: stop and reset inherited from Running, reset to Running itself is internal
+            [None, (('state', leaf['Idle']), None), (('guard', 0), None), (('internal',), log), None],
+            # RunB: its own stop overrides the inherited one
+            [None, (('internal',), beep), (('state', leaf['RunA']), None), (('internal',), log), None],
+            # Fault: terminates on kill
+            [None, None, None, (('state', leaf['Idle']), None), (('terminate',), None)],
+        ])
+        self.assertEqual(machine.guard_steps, [
+            (chk, (('state', leaf['RunB']), None), (('guard', 1), None)),
+            (None, (('state', leaf['Fault']), beep), (('state', leaf['Idle']), None)),
+        ])
+        self.assertEqual([submachine['label'] for submachine in machine.submachines], ['sub'])
+
+    def test_generated_tables(self):
+        private_variables = ''.join(generate_state_machine(StateMachine(self.hsm), 'motor')[3])
+        self.assertIn('    /* Idle */ { 1u, 0u, 0u, 0u, 0u },\n'
+                      '    /* RunA */ { 0u, 2u, 3u, 4u, 0u },\n'
+                      '    /* RunB */ { 0u, 5u, 6u, 4u, 0u },\n'
+                      '    /* Fault */ { 0u, 0u, 0u, 2u, 7u },\n', private_variables)
+        self.assertIn('    { motor_isOk, 3u, { MOTOR_STATE_RunB, 0u }, { MOTOR_GUARD + 1u, 0u } },\n'
+                      '    { motor_isHot, 0u, { MOTOR_STATE_Fault, 2u }, { MOTOR_STATE_Idle, 0u } },\n', private_variables)
+        self.assertIn('    { MOTOR_INTERNAL, 0u },\n    { MOTOR_STATE_RunA, 1u },\n', private_variables)
+        self.assertIn('    { MOTOR_TERMINATE, 0u },\n', private_variables)
+
+    def test_guard_cycle_is_rejected(self):
+        hsm = copy.deepcopy(self.hsm)
+        guards = find_label(hsm['States'], 'Running')['guards']
+        find_label(guards, 'isHot')['false']['to'] = reference(find_label(guards, 'isOk'))
+        machine = StateMachine(hsm)
+        self.assertEqual(machine.analyze().guard_cycles, [[0, 1, 0]])
+        with self.assertRaisesRegex(ValueError, 'guard cycles'):
+            generate_state_machine(machine, 'motor')
+
+    def test_external_references(self):
+        # Events of another state machine are found through the element table of the model
+        hsm = copy.deepcopy(self.hsm)
+        kill = find_label(hsm['Events'], 'kill')
+        hsm['Events'].remove(kill)
+        with self.assertRaisesRegex(ValueError, 'unresolved references'):
+            generate_state_machine(StateMachine(hsm), 'motor')
+        elements = build_element_table({'HSM': [hsm, {'id': 'other', 'Events': [kill]}]})
+        machine = StateMachine(hsm, resolve=functools.partial(resolve_reference, elements))
+        self.assertEqual(machine.problems, [])
+        self.assertEqual(machine.events[-1], kill)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,190 @@
+/****************************************************************************
+ * Copyright (C) 2020 by _authorName                                        *
+ *                                                                          *
+ * This file is part of EML ( Elausa Middleware Library ).                  *
+ *                                                                          *
+ *   EML is free software: you can redistribute it and/or modify it         *
+ *   under the terms of the GNU Lesser General Public License as published  *
+ *   by the Free Software Foundation, either version 3 of the License, or   *
+ *   (at your option) any later version.                                    *
+ *                                                                          *
+ *   You should have received a copy of the GNU Lesser General Public       *
+ *   License along with EML.  If not, see <http:www.gnu.org/licenses/>.     *
+ ****************************************************************************/
+
+/**
+ * @file c0_0_lib.c
+ * @author _authorName
+ * @date _date
+ * @brief c0_0_lib
+ * @req 
+ *
+ * c0_0_lib description
+ */
+/***************** HEADERS ****************/
+#include "c0_0_lib.h"
+#include <stddef.h>
+
+
+/****************** MACROS ****************/
+
+/***************** TYPEDEFS ***************/
+#define MOTOR_GUARD 0x8000u
+#define MOTOR_INTERNAL 0xfffdu
+#define MOTOR_TERMINATE 0xfffeu
+/**
+ * @brief Step of motor: the activity to run, then the state entered, MOTOR_GUARD + the guard to evaluate, MOTOR_INTERNAL or MOTOR_TERMINATE.
+ * @id 00000000-0000-0000-0000-00000000a019
+ */
+typedef struct {
+    uint16_t next;
+    uint16_t activity;
+} motor_step_t;
+/**
+ * @brief Guard of motor: its condition, its activity and the step taken for each result.
+ * @id 00000000-0000-0000-0000-00000000a019
+ */
+typedef struct {
+    bool (*condition)(void);
+    uint16_t activity;
+    motor_step_t on_true;
+    motor_step_t on_false;
+} motor_guard_t;
+
+
+/******* STATIC VARIABLES DECLARATION ******/
+/**
+ * @brief Variable 1.
+ * @id 7cbd7025-e28b-c9ff-870f-084c7244f536
+ */
+static float v1;
+/**
+ * @brief Activities of motor, the first slot stands for no activity.
+ * @id 00000000-0000-0000-0000-00000000a019
+ */
+static void (*const motor_activities[])(void) = {
+    NULL,
+    motor_log,
+    motor_beep,
+    motor_chk,
+};
+/**
+ * @brief Steps of motor, the first one is taken on events that are not handled.
+ * @id 00000000-0000-0000-0000-00000000a019
+ */
+static const motor_step_t motor_steps[] = {
+    { MOTOR_INTERNAL, 0u },
+    { MOTOR_STATE_RunA, 1u },
+    { MOTOR_STATE_Idle, 0u },
+    { MOTOR_GUARD + 0u, 0u },
+    { MOTOR_INTERNAL, 1u },
+    { MOTOR_INTERNAL, 2u },
+    { MOTOR_STATE_RunA, 0u },
+    { MOTOR_TERMINATE, 0u },
+};
+/**
+ * @brief Guards of motor.
+ * @id 00000000-0000-0000-0000-00000000a019
+ */
+static const motor_guard_t motor_guards[] = {
+    { motor_isOk, 3u, { MOTOR_STATE_RunB, 0u }, { MOTOR_GUARD + 1u, 0u } },
+    { motor_isHot, 0u, { MOTOR_STATE_Fault, 2u }, { MOTOR_STATE_Idle, 0u } },
+};
+/**
+ * @brief Step taken by every leaf state of motor on every event, nested states already resolved.
+ * @id 00000000-0000-0000-0000-00000000a019
+ */
+static const uint16_t motor_table[MOTOR_STATE_COUNT][MOTOR_EVENT_COUNT] = {
+    /* Idle */ { 1u, 0u, 0u, 0u, 0u },
+    /* RunA */ { 0u, 2u, 3u, 4u, 0u },
+    /* RunB */ { 0u, 5u, 6u, 4u, 0u },
+    /* Fault */ { 0u, 0u, 0u, 2u, 7u },
+};
+
+
+/******* GLOBAL VARIABLES DECLARATION ******/
+/**
+ * @brief Variable 0.
+ * @id b3969057-425c-b200-105a-da6b720299e3
+ */
+const float* v0;
+/**
+ * @brief Variable 2.
+ * @id e245a460-0004-884c-c167-733f9a9e4310
+ */
+void v2;
+
+
+/******* STATIC FUNCTION DECLARATION *******/
+/**
+ * @brief Function 1
+ * @id 9cb017c1-8741-ae91-acfe-bb4bd29e8693
+ */
+static bool f1(const float p0, bool p1, const int p2);
+
+
+/********* STATIC FUNCTION DEFINITION **********/
+
+/********* GLOBAL FUNCTION DEFINITION *********/
+/**
+ * @brief Enter the initial state of motor.
+ * @id 00000000-0000-0000-0000-00000000a019
+ */
+void motor_init(motor_t *hsm)
+{
+    hsm->state = MOTOR_STATE_Idle;
+}
+
+/**
+ * @brief Dispatch an event to motor and return the new state, events are ignored once it has terminated.
+ * @id 00000000-0000-0000-0000-00000000a019
+ */
+motor_state_t motor_dispatch(motor_t *hsm, motor_event_t event)
+{
+    if ((hsm->state >= MOTOR_STATE_COUNT) || ((unsigned int)event >= (unsigned int)MOTOR_EVENT_COUNT)) {
+        return hsm->state;
+    }
+    const motor_step_t *step = &motor_steps[motor_table[hsm->state][event]];
+    for (;;) {
+        if (step->activity != 0u) {
+            motor_activities[step->activity]();
+        }
+        if (step->next < MOTOR_GUARD) {
+            hsm->state = (motor_state_t)step->next;
+            break;
+        }
+        if (step->next == MOTOR_TERMINATE) {
+            hsm->state = MOTOR_STATE_TERMINATED;
+            break;
+        }
+        if (step->next == MOTOR_INTERNAL) {
+            break;
+        }
+        const motor_guard_t *guard = &motor_guards[step->next - MOTOR_GUARD];
+        if (guard->activity != 0u) {
+            motor_activities[guard->activity]();
+        }
+        step = guard->condition() ? &guard->on_true : &guard->on_false;
+    }
+    return hsm->state;
+}
+
+/**
+ * @brief Enter the initial state of sub.
+ * @id 00000000-0000-0000-0000-00000000a018
+ */
+void sub_init(sub_t *hsm)
+{
+    hsm->state = SUB_STATE_Only;
+}
+
+/**
+ * @brief Dispatch an event to sub and return the new state, events are ignored once it has terminated.
+ * @id 00000000-0000-0000-0000-00000000a018
+ */
+sub_state_t sub_dispatch(sub_t *hsm, sub_event_t event)
+{
+    (void)event;
+    return hsm->state;
+}
+
@@ -0,0 +1,211 @@
+/**
+ * @file c0_0_lib.h
+ * @author _authorName
+ * @date _date
+ * @brief c0_0_lib
+ * @req 
+ *
+ * Provide the interface of c0_0_lib
+ */
+#ifndef __C0_0_LIB_H__
+#define __C0_0_LIB_H__
+/***************** HEADERS ****************/
+#include <stdbool.h>
+#include <stdint.h>
+
+
+/****************** MACROS ****************/
+
+/***************** TYPEDEFS ***************/
+/**
+ * @brief No documentation available
+ * @id 7e969cf3-a7c5-cb87-9b8b-71a1b38a05fb
+ */
+typedef enum c0_0_lib_e0;
+/**
+ * @brief 
+ * @id 04c14982-d9ea-d926-4745-dd9e27896389
+ */
+typedef struct c0_0_lib_s0;
+/**
+ * @brief 
+ * @id 4279b14d-ae55-cdff-34ab-18fd0a68e88e
+ */
+typedef int c0_0_lib_t0;
+/**
+ * @brief No documentation available
+ * @id 7e969cf3-a7c5-cb87-9b8b-71a1b38a05fb
+ */
+enum c0_0_lib_e0{
+        /**
+     * @brief No documentation available
+     * @id 5decc06a-f24d-fdd8-5091-0bdc8ef066d4
+     */
+    c0_0_lib_e0_0 = 0,
+        /**
+     * @brief No documentation available
+     * @id d974c146-e8ec-01b3-9145-91aef03d866a
+     */
+    c0_0_lib_e0_1 = 1,
+        /**
+     * @brief No documentation available
+     * @id f61164ce-bfc7-4ca9-d8ab-0b300ac0cf0d
+     */
+    c0_0_lib_e0_2 = 2
+};
+
+/**
+ * @brief 
+ * @id 04c14982-d9ea-d926-4745-dd9e27896389
+ */
+struct c0_0_lib_s0 {
+        /**
+     * @brief 
+     * @id dc821527-1da3-b7e2-cad6-e514ccc14d51
+     */
+    char m0;
+        /**
+     * @brief 
+     * @id d138d150-8557-716a-a750-2a812227d96d
+     */
+    uint8_t m1;
+        /**
+     * @brief 
+     * @id df3277fd-1d77-ce40-58d8-7776a51ad4f3
+     */
+    bool m2;
+};
+
+/**
+ * @brief Leaf states of the state machine motor, the only states that can be active.
+ * @id 00000000-0000-0000-0000-00000000a019
+ */
+typedef enum {
+    MOTOR_STATE_Idle,
+    MOTOR_STATE_RunA,
+    MOTOR_STATE_RunB,
+    MOTOR_STATE_Fault,
+    MOTOR_STATE_COUNT,
+    MOTOR_STATE_TERMINATED = MOTOR_STATE_COUNT
+} motor_state_t;
+/**
+ * @brief Events of the state machine motor.
+ * @id 00000000-0000-0000-0000-00000000a019
+ */
+typedef enum {
+    MOTOR_EVENT_go,
+    MOTOR_EVENT_stop,
+    MOTOR_EVENT_tick,
+    MOTOR_EVENT_reset,
+    MOTOR_EVENT_kill,
+    MOTOR_EVENT_COUNT
+} motor_event_t;
+/**
+ * @brief Instance of the state machine motor.
+ * @id 00000000-0000-0000-0000-00000000a019
+ */
+typedef struct {
+    motor_state_t state;
+} motor_t;
+/**
+ * @brief Leaf states of the state machine sub, the only states that can be active.
+ * @id 00000000-0000-0000-0000-00000000a018
+ */
+typedef enum {
+    SUB_STATE_Only,
+    SUB_STATE_COUNT,
+    SUB_STATE_TERMINATED = SUB_STATE_COUNT
+} sub_state_t;
+/**
+ * @brief Events of the state machine sub.
+ * @id 00000000-0000-0000-0000-00000000a018
+ */
+typedef enum {
+    SUB_EVENT_COUNT
+} sub_event_t;
+/**
+ * @brief Instance of the state machine sub.
+ * @id 00000000-0000-0000-0000-00000000a018
+ */
+typedef struct {
+    sub_state_t state;
+} sub_t;
+
+
+/****** GLOBAL VARIABLES DECLARATION ******/
+/**
+ * @brief Variable 0.
+ * @id b3969057-425c-b200-105a-da6b720299e3
+ */
+extern const float* v0;
+/**
+ * @brief Variable 1.
+ * @id 7cbd7025-e28b-c9ff-870f-084c7244f536
+ */
+extern float v1;
+/**
+ * @brief Variable 2.
+ * @id e245a460-0004-884c-c167-733f9a9e4310
+ */
+extern void v2;
+
+
+/****** GLOBAL FUNCTION DECLARATION *******/
+/**
+ * @brief Function 0
+ * @id d663049d-155e-18b1-fa83-ada4a2121ac5
+ */
+int f0(const char p0, int p1, const char p2);
+/**
+ * @brief Function 2
+ * @id 4653a560-0597-aab6-14d3-0dbca0acf4c9
+ */
+int f2(const float p0, uint8_t p1, const int p2);
+/**
+ * @brief Enter the initial state of motor.
+ * @id 00000000-0000-0000-0000-00000000a019
+ */
+void motor_init(motor_t *hsm);
+/**
+ * @brief Dispatch an event to motor and return the new state, events are ignored once it has terminated.
+ * @id 00000000-0000-0000-0000-00000000a019
+ */
+motor_state_t motor_dispatch(motor_t *hsm, motor_event_t event);
+/**
+ * @brief Activity log of motor.
+ * @id 00000000-0000-0000-0000-00000000a006
+ */
+void motor_log(void);
+/**
+ * @brief Activity beep of motor.
+ * @id 00000000-0000-0000-0000-00000000a007
+ */
+void motor_beep(void);
+/**
+ * @brief Activity chk of motor.
+ * @id 00000000-0000-0000-0000-00000000a008
+ */
+void motor_chk(void);
+/**
+ * @brief Condition of the guard isOk: ok
+ * @id 00000000-0000-0000-0000-00000000a00f
+ */
+bool motor_isOk(void);
+/**
+ * @brief Condition of the guard isHot: temp > 10
+ * @id 00000000-0000-0000-0000-00000000a00e
+ */
+bool motor_isHot(void);
+/**
+ * @brief Enter the initial state of sub.
+ * @id 00000000-0000-0000-0000-00000000a018
+ */
+void sub_init(sub_t *hsm);
+/**
+ * @brief Dispatch an event to sub and return the new state, events are ignored once it has terminated.
+ * @id 00000000-0000-0000-0000-00000000a018
+ */
+sub_state_t sub_dispatch(sub_t *hsm, sub_event_t event);
+
+
+#endif /* __C0_0_LIB_H__  */
\ No newline at end of file
@@ -0,0 +1,133 @@
+import copy
+import importlib.util
+import json
+import os
+import re
+import tempfile
+import unittest
+from benchmark import SyntheticModel
+
+REPO_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..')
+ASPICE_SCRIPTS_PATH = os.path.join(REPO_PATH, 'elausa_aspice', 'python_scripts')
+
+# The elausa_aspice decoders are loaded under their own name, this folder has a decode_json of its own
+_spec = importlib.util.spec_from_file_location('aspice_decode_json', os.path.join(ASPICE_SCRIPTS_PATH, 'decode_json.py'))
+aspice_decode_json = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(aspice_decode_json)
+
+# Duplicate ids keep the first object, duplicate keys the last value, as json.load does
+DUPLICATES_MODEL = '''{"id": "root", "tags": ["project"], "children": [
+  {"id": "a", "tags": ["component"], "label": "first", "ref": "${id:b}"},
+  {"id": "a", "tags": ["component"], "label": "second"},
+  {"id": "b", "tags": ["interface"], "x": {"id": "old", "tags": ["port"]}, "x": {"id": "new", "tags": ["port"], "ref": "${id:a}"},
+   "items": [{"id": "c", "tags": ["port"], "refs": ["${id:a}", "${id:b}"]}]}
+]}'''
+
+def walk(data, path=(), ancestors=()):
+    """Yield (object, path, enclosing (object, path) pairs) for every object with an 'id', in document order."""
+    if isinstance(data, dict):
+        if 'id' in data:
+            yield data, list(path), ancestors
+            ancestors = ancestors + ((data, list(path)),)
+        for key, value in data.items():
+            yield from walk(value, path + (key,), ancestors)
+    elif isinstance(data, list):
+        for index, item in enumerate(data):
+            yield from walk(item, path + (str(index),), ancestors)
+
+class DecoderEquivalenceTest(unittest.TestCase):
+    """Every store answers like a walk of the parsed model, which is what DecodeJson did before its indexes."""
+    def setUp(self):
+        self.temp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp.cleanup)
+        synthetic_path = os.path.join(self.temp.name, 'synthetic.json')
+        with open(synthetic_path, 'w') as json_file:
+            json.dump(SyntheticModel(2, members=3).data, json_file, indent=1)
+        duplicates_path = os.path.join(self.temp.name, 'duplicates.json')
+        with open(duplicates_path, 'w') as json_file:
+            json_file.write(DUPLICATES_MODEL)
+        self.models = [os.path.join(REPO_PATH, 'elausa_aspice', '911509.json'), synthetic_path, duplicates_path]
+
+    def stores(self, json_path):
+        """The reference DecodeJson and the other stores of the same model, by name."""
+        indexed = aspice_decode_json.IndexedDecodeJson(json_path, os.path.join(self.temp.name, os.path.basename(json_path) + '.idx'))
+        streaming = aspice_decode_json.StreamingDecodeJson(json_path)
+        self.addCleanup(indexed.close)
+        self.addCleanup(streaming.close)
+        return aspice_decode_json.DecodeJson(json_path), {
+            'compact': aspice_decode_json.CompactDecodeJson(json_path),
+            'indexed': indexed,
+            'streaming': streaming,
+        }
+
+    def assertStoresAnswer(self, json_path, stores, expected, query):
+        """Ask every store the queries in 'expected', keyed by the query arguments."""
+        for name, decoder in stores:
+            with self.subTest(model=os.path.basename(json_path), store=name):
+                self.assertEqual({args: query(decoder, *args) for args in expected}, expected)
+
+    def test_search_by_id(self):
+        for json_path in self.models:
+            reference, stores = self.stores(json_path)
+            expected = {}
+            for obj, path, ancestors in walk(reference.json_data):
+                expected.setdefault((obj['id'],), (obj, path))
+            expected[('missing',)] = (None, [])
+            self.assertStoresAnswer(json_path, [('dict', reference)] + list(stores.items()), expected,
+                                    lambda decoder, id: decoder.search_by_id(id))
+            # Ids only in values that a later duplicate key replaced are not in the model. The streaming
+            # store answers before it has read the rest of the enclosing object, so it is not asked.
+            with open(json_path) as json_file:
+                for id in re.findall(r'"id":\s*"([^"]*)"', json_file.read()):
+                    expected.setdefault((id,), (None, []))
+            self.assertStoresAnswer(json_path, [('compact', stores['compact']), ('indexed', stores['indexed'])], expected,
+                                    lambda decoder, id: decoder.search_by_id(id))
+
+    def test_return_parent(self):
+        for json_path in self.models:
+            reference, stores = self.stores(json_path)
+            expected = {}
+            for obj, path, ancestors in walk(reference.json_data):
+                if reference.search_by_id(obj['id'])[0] is not obj:
+                    continue  # Only the first object of a duplicate id can be asked for
+                # The item itself first, then its ancestors, never the root object
+                candidates = [(node, node_path) for node, node_path in ancestors + ((obj, path),) if node_path]
+                for tag in sorted({tag for node, node_path in candidates for tag in node.get('tags', [])}) + ['missing']:
+                    expected[obj['id'], tag] = next(([node, node_path] for node, node_path in reversed(candidates)
+                                                     if tag in node.get('tags', [])), [None, []])
+            self.assertStoresAnswer(json_path, [('dict', reference)] + list(stores.items()), expected,
+                                    lambda decoder, id, tag: decoder.return_parent(id, tag))
+
+    def test_tag_queries(self):
+        for json_path in self.models:
+            reference, stores = self.stores(json_path)
+            objects = list(walk(reference.json_data))
+            tags = sorted({tag for obj, path, ancestors in objects for tag in obj.get('tags', [])}) + ['missing']
+            by_tag = {(tag,): [obj['id'] for obj, path, ancestors in objects if tag in obj.get('tags', [])] for tag in tags}
+            within = {}
+            for parent, path, ancestors in objects:
+                if reference.search_by_id(parent['id'])[0] is not parent:
+                    continue
+                for tag in tags:
+                    within[tag, parent['id']] = [obj['id'] for obj, path, obj_ancestors in objects if tag in obj.get('tags', [])
+                                                 and (obj is parent or any(node is parent for node, node_path in obj_ancestors))]
+            within['component', 'missing'] = []
+            queried = [('dict', reference), ('compact', stores['compact']), ('indexed', stores['indexed'])]
+            self.assertStoresAnswer(json_path, queried, by_tag, lambda decoder, tag: decoder.get_ids_by_tag(tag))
+            self.assertStoresAnswer(json_path, queried, within,
+                                    lambda decoder, tag, id: decoder.get_ids_by_tag_within_parent_id(tag, id))
+
+    def test_refs_queries(self):
+        for json_path in self.models:
+            reference, stores = self.stores(json_path)
+            tags = sorted({tag for obj, path, ancestors in walk(reference.json_data) for tag in obj.get('tags', [])})
+            # A copy is not the loaded model, so get_all_refs_to_object walks it as it did before the reference index
+            model = copy.deepcopy(reference.json_data)
+            referenced = set(re.findall(r'\$\{id:([^}]*)\}', json.dumps(model)))
+            expected = {(id, tag): reference.get_all_refs_to_object(id, model, model, tag)
+                        for id in sorted(referenced) + ['missing'] for tag in tags}
+            self.assertStoresAnswer(json_path, [('dict', reference), ('compact', stores['compact']), ('indexed', stores['indexed'])],
+                                    expected, lambda decoder, id, tag: decoder.get_refs_to_object(id, tag))
+
+if __name__ == "__main__":
+    unittest.main()
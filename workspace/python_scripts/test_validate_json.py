@@ -0,0 +1,44 @@
+import json
+import os
+import tempfile
+import unittest
+from benchmark import SyntheticModel
+from validate_json import validate_model
+
+REPO_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..')
+
+# Sample models shipped with the repository, with the folder of the schemas they were created from
+SAMPLE_MODELS = [
+    (os.path.join(REPO_PATH, 'workspace', '954068.json'), os.path.join(REPO_PATH, 'workspace', 'schemas')),
+    (os.path.join(REPO_PATH, 'elausa_aspice', '911509.json'), os.path.join(REPO_PATH, 'elausa_aspice', 'schemas')),
+]
+
+class SampleModelsTest(unittest.TestCase):
+    def test_sample_models_are_valid(self):
+        for json_path, schemas_path in SAMPLE_MODELS:
+            with self.subTest(model=os.path.basename(json_path)), tempfile.TemporaryDirectory() as cache_path:
+                self.assertEqual(validate_model(json_path, schemas_path, cache_path), [])
+
+    def test_synthetic_model_is_valid(self):
+        # The benchmarks must measure models the extension could have written
+        with tempfile.TemporaryDirectory() as temp_path:
+            json_path = os.path.join(temp_path, 'synthetic.json')
+            with open(json_path, 'w') as json_file:
+                json.dump(SyntheticModel(2).data, json_file)
+            self.assertEqual(validate_model(json_path, os.path.join(REPO_PATH, 'workspace', 'schemas')), [])
+
+    def test_cached_result_is_reused(self):
+        json_path, schemas_path = SAMPLE_MODELS[0]
+        with tempfile.TemporaryDirectory() as cache_path:
+            first = validate_model(json_path, schemas_path, cache_path)
+            self.assertEqual(validate_model(json_path, schemas_path, cache_path), first)
+
+    def test_cache_holds_no_code(self):
+        # Compiled validators stay in the process, the cache next to a model only holds results
+        json_path, schemas_path = SAMPLE_MODELS[0]
+        with tempfile.TemporaryDirectory() as cache_path:
+            validate_model(json_path, schemas_path, cache_path)
+            self.assertEqual(os.listdir(cache_path), [os.path.basename(json_path) + '.valid'])
+
+if __name__ == "__main__":
+    unittest.main()
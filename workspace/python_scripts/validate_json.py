@@ -0,0 +1,309 @@
+import argparse
+import hashlib
+import json
+import os
+import sys
+from file_writer import write_atomic
+
+# Folder of the schemas, next to this scripts folder
+SCHEMAS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'schemas')
+# The digests of valid subtrees are kept in <model folder>/.schema_cache by default
+CACHE_DIRNAME = '.schema_cache'
+# What is cached only holds for the validator that produced it, a change to this file invalidates it
+with open(__file__, 'rb') as _source_file:
+    SOURCE_HASH = hashlib.sha256(_source_file.read()).hexdigest()
+
+# Python test of each JSON schema type, {v} is the checked value
+TYPE_CHECKS = {
+    'string': 'type({v}) is str',
+    'boolean': 'type({v}) is bool',
+    'array': 'type({v}) is list',
+    'object': 'type({v}) is dict',
+    'integer': 'type({v}) is int',
+    'number': 'type({v}) in (int, float)',
+    'null': '{v} is None',
+}
+
+def json_type(value):
+    """Name of the JSON type of a decoded value, used in error messages."""
+    if value is None:
+        return 'null'
+    return {bool: 'boolean', str: 'string', list: 'array', dict: 'object', int: 'integer', float: 'number'}.get(type(value), type(value).__name__)
+
+def format_path(path):
+    """Show a path of keys and indexes like a JSON pointer, e.g. /Architecture/0/components."""
+    return '/' + '/'.join(str(key) for key in path)
+
+def _digest(value):
+    text = json.dumps(value, check_circular=False, separators=(',', ':'))
+    return hashlib.blake2b(text.encode('ascii'), digest_size=16).hexdigest()
+
+def load_schemas(schemas_path):
+    """Return {file name: (schema, sha256 of the file)} for every *.model.json file in schemas_path."""
+    schemas = {}
+    for name in sorted(os.listdir(schemas_path)):
+        if name.endswith('.model.json'):
+            with open(os.path.join(schemas_path, name), 'rb') as schema_file:
+                content = schema_file.read()
+            schemas[name] = (json.loads(content), hashlib.sha256(content).hexdigest())
+    return schemas
+
+class _ValidatorCompiler:
+    """
+    Turn one schema file into the Python source of a 'validate(value, path, errors, visit)' function.
+    Values referenced through '$ref' are checked inline, except object schemas of other files,
+    which are handed to visit(name, value, path, errors) so they are validated by their own function.
+    """
+    def __init__(self, name, schemas):
+        self.name = name
+        self.schemas = schemas
+        self.constants = []
+        self.delegates = False
+
+    def compile(self):
+        body = self._emit(self.schemas[self.name][0], 'value', ('path', ()), 0)
+        lines = [f'_C{index} = {constant!r}' for index, constant in enumerate(self.constants)]
+        lines.append('def validate(value, path, errors, visit):')
+        lines += ['    ' + line for line in body] or ['    pass']
+        return '\n'.join(lines) + '\n'
+
+    def _constant(self, value):
+        self.constants.append(value)
+        return f'_C{len(self.constants) - 1}'
+
+    def _resolve(self, schema):
+        """Merge '$ref' targets into schema like the extension does. Returns (schema, file name to delegate to)."""
+        while isinstance(schema, dict) and '$ref' in schema:
+            ref = schema['$ref']
+            siblings = {key: value for key, value in schema.items() if key != '$ref'}
+            if ref.startswith('#'):
+                target = self.schemas[self.name][0]
+                for key in ref.split('/')[1:]:
+                    target = target[key.replace('%24', '$')]
+            else:
+                target_name = os.path.basename(ref)
+                if target_name not in self.schemas:
+                    raise ValueError(f"{self.name}: schema {ref} not found")
+                target = self.schemas[target_name][0]
+                if target.get('type') == 'object':
+                    return None, target_name
+            schema = {**siblings, **target}
+        return schema, None
+
+    @staticmethod
+    def _path(path):
+        base, keys = path
+        return f'{base} + ({", ".join(keys)},)' if keys else base
+
+    def _emit(self, schema, value, path, depth):
+        schema, delegate = self._resolve(schema)
+        if delegate is not None:
+            self.delegates = True
+            return [f'visit({delegate!r}, {value}, {self._path(path)}, errors)']
+        if not isinstance(schema, dict):
+            return []
+
+        types = schema.get('type')
+        types = [types] if isinstance(types, str) else list(types or [])
+        checks = []
+
+        # 'const' is the value new nodes are created with, it only binds values the user cannot edit
+        if 'enum' in schema:
+            # New nodes hold the const, the default or an empty value until the user picks one of the enum
+            empty = {'string': '', 'number': 0, 'integer': 0, 'boolean': False, 'array': []}.get(types[0] if types else None)
+            initial = schema.get('const', schema.get('default', empty))
+            allowed = schema['enum'] + ([initial] if initial is not None and initial not in schema['enum'] else [])
+            checks += [f'if {value} not in {self._constant(allowed)}:',
+                       f'    errors.append(({self._path(path)}, repr({value}) + " is not one of " + {json.dumps(", ".join(map(repr, schema["enum"])))}))']
+        elif 'const' in schema and not schema.get('editable'):
+            constant = self._constant(schema['const'])
+            checks += [f'if {value} != {constant}:',
+                       f'    errors.append(({self._path(path)}, "expected " + repr({constant}) + ", got " + repr({value})))']
+
+        if 'properties' in schema and types in ([], ['object']):
+            required = schema.get('required', [])
+            member = f'v{depth + 1}'
+            properties = []
+            for key, property_schema in schema['properties'].items():
+                inner = self._emit(property_schema, member, (path[0], path[1] + (repr(key),)), depth + 1)
+                if key in required:
+                    properties += [f'{member} = {value}.get({key!r}, _MISSING)',
+                                   f'if {member} is _MISSING:',
+                                   f'    errors.append(({self._path(path)}, {json.dumps("missing property " + repr(key))}))']
+                    if inner:
+                        properties += ['else:'] + ['    ' + line for line in inner]
+                elif inner:
+                    properties += [f'if {key!r} in {value}:', f'    {member} = {value}[{key!r}]'] + ['    ' + line for line in inner]
+            if properties:
+                checks += properties if types else [f'if type({value}) is dict:'] + ['    ' + line for line in properties]
+
+        if 'items' in schema and types in ([], ['array']):
+            index, item = f'i{depth + 1}', f'v{depth + 1}'
+            inner = self._emit(schema['items'], item, (path[0], path[1] + (index,)), depth + 1)
+            if inner:
+                loop = [f'for {index}, {item} in enumerate({value}):'] + ['    ' + line for line in inner]
+                checks += loop if types else [f'if type({value}) is list:'] + ['    ' + line for line in loop]
+
+        known = [name for name in types if name in TYPE_CHECKS]
+        if not known:
+            return checks
+        test = ' or '.join(TYPE_CHECKS[name].format(v=value) for name in known)
+        lines = [f'if not ({test}):',
+                 f'    errors.append(({self._path(path)}, "expected {" or ".join(known)}, got " + _json_type({value})))']
+        if checks:
+            lines += ['else:'] + ['    ' + line for line in checks]
+        return lines
+
+# Validators compiled in this process, keyed by the hash of the schema files they were compiled from
+_compiled = {}
+
+class SchemaValidator:
+    """
+    Validators of every schema in schemas_path, compiled once to Python functions.
+    Compiled code is cached in this process only, keyed by the hash of this module, of the schema
+    file and of the schema files it refers to. Code is never loaded from disk, a cache folder next to
+    a model could hold anything.
+    """
+    def __init__(self, schemas_path=SCHEMAS_PATH):
+        self.schemas = load_schemas(schemas_path)
+        # Root nodes name their schema in '$model', by its '$id' or its file name
+        self.models = {schema.get('$id', name): name for name, (schema, _) in self.schemas.items()}
+        self.models.update({name: name for name in self.schemas})
+        self.hash = hashlib.sha256(''.join([SOURCE_HASH] + [sha for _, sha in self.schemas.values()]).encode('utf-8')).hexdigest()
+        self.validators = {}
+        # Schemas that hand nested objects to other schemas, only their subtrees are worth caching
+        self.containers = set()
+        for name in self.schemas:
+            self.validators[name], delegates = self._load(name)
+            if delegates:
+                self.containers.add(name)
+
+    def _dependencies(self, name, found):
+        """Add name and every schema file reachable from it through '$ref' to found."""
+        if name in found or name not in self.schemas:
+            return found
+        found.add(name)
+        stack = [self.schemas[name][0]]
+        while stack:
+            node = stack.pop()
+            if isinstance(node, dict):
+                ref = node.get('$ref')
+                if isinstance(ref, str) and not ref.startswith('#'):
+                    self._dependencies(os.path.basename(ref), found)
+                stack.extend(node.values())
+            elif isinstance(node, list):
+                stack.extend(node)
+        return found
+
+    def _load(self, name):
+        # Schemas referring to each other reach the same files, the key starts with the compiled one
+        key = hashlib.sha256(''.join([SOURCE_HASH, name] + [f';{dependency}:{self.schemas[dependency][1]}'
+                                               for dependency in sorted(self._dependencies(name, set()))]).encode('utf-8')).hexdigest()
+        if key not in _compiled:
+            compiler = _ValidatorCompiler(name, self.schemas)
+            code = compile(compiler.compile(), f'<schema {name}>', 'exec')
+            delegates = compiler.delegates
+            namespace = {'_MISSING': object(), '_json_type': json_type}
+            exec(code, namespace)
+            _compiled[key] = (namespace['validate'], delegates)
+        return _compiled[key]
+
+    def validate(self, json_data, known_valid=frozenset()):
+        """
+        Validate a model against the schema named by its '$model'.
+        Subtrees whose digest is in known_valid are skipped. Returns (errors, valid) where errors is a
+        list of (path, message) and valid the digests of the subtrees found valid in this run.
+        """
+        errors = []
+        valid = set()
+
+        def visit(name, value, path, errors):
+            if name not in self.containers:
+                self.validators[name](value, path, errors, visit)
+                return
+            digest = f'{name}:{_digest(value)}'
+            if digest not in known_valid:
+                count = len(errors)
+                self.validators[name](value, path, errors, visit)
+                if len(errors) != count:
+                    return
+            valid.add(digest)
+
+        model = json_data.get('$model') if isinstance(json_data, dict) else None
+        if model not in self.models:
+            errors.append(((), f"unknown '$model': {model!r}"))
+        else:
+            # The root changes with any edit, only the subtrees below it are looked up in known_valid
+            self.validators[self.models[model]](json_data, (), errors, visit)
+        return errors, valid
+
+def validate_model(json_path, schemas_path=SCHEMAS_PATH, cache_path=None, json_data=None):
+    """
+    Validate the model in json_path, or its already decoded json_data, and return a list of (path, message).
+    The result and the digests of valid subtrees are kept in cache_path (default <model folder>/.schema_cache):
+    an unchanged file is not validated again and an edited one only in the subtrees that changed.
+    json_data must be the content of json_path, the file is still read to tell if it changed.
+    """
+    if cache_path is None:
+        cache_path = os.path.join(os.path.dirname(os.path.abspath(json_path)), CACHE_DIRNAME)
+    os.makedirs(cache_path, exist_ok=True)
+    with open(json_path, 'rb') as json_file:
+        content = json_file.read()
+    file_digest = hashlib.blake2b(content, digest_size=16).hexdigest()
+
+    validator = SchemaValidator(schemas_path)
+    results_path = os.path.join(cache_path, os.path.basename(json_path) + '.valid')
+    try:
+        with open(results_path, 'r') as results_file:
+            results = json.load(results_file)
+        if results.get('schemas') != validator.hash:
+            results = {}
+    except (OSError, ValueError):
+        results = {}
+    if isinstance(results, dict) and results.get('file') == file_digest:
+        return [(tuple(path), message) for path, message in results['errors']]
+    known_valid = frozenset(results.get('valid', [])) if isinstance(results, dict) else frozenset()
+
+    if json_data is None:
+        json_data = json.loads(content)
+    errors, valid = validator.validate(json_data, known_valid)
+    # Only the subtrees of this version are kept, so the file does not grow with every edit
+    write_atomic(results_path, json.dumps({'schemas': validator.hash, 'file': file_digest,
+                                           'errors': errors, 'valid': sorted(valid)}).encode('utf-8'))
+    return errors
+
+def check_model(json_path, schemas_path=SCHEMAS_PATH, json_data=None):
+    """Validation stage of the generators: print every schema error and exit if the model is not valid."""
+    try:
+        errors = validate_model(json_path, schemas_path, json_data=json_data)
+    except (OSError, ValueError) as e:
+        print(f"Error validating {json_path}: {e}", file=sys.stderr)
+        sys.exit(1)
+    # Generators may write their output to stdout, the errors go to stderr
+    for path, message in errors:
+        print(f"{json_path}{format_path(path)}: {message}", file=sys.stderr)
+    if errors:
+        print(f"{len(errors)} schema errors found in {json_path}.", file=sys.stderr)
+        sys.exit(1)
+
+def main():
+    parser = argparse.ArgumentParser(description="Validate a model JSON file against the schemas it was created from.")
+    parser.add_argument("-f", "--file", required=True, help="Path to the JSON file")
+    parser.add_argument("-s", "--schemas", default=SCHEMAS_PATH, help="Folder of the *.model.json schemas")
+    parser.add_argument("--cache", help=f"Folder of the validation cache (default: <model folder>/{CACHE_DIRNAME})")
+    args = parser.parse_args()
+
+    try:
+        errors = validate_model(args.file, args.schemas, args.cache)
+    except (OSError, ValueError) as e:
+        print(f"Error validating {args.file}: {e}")
+        sys.exit(1)
+    for path, message in errors:
+        print(f"{format_path(path)}: {message}")
+    if errors:
+        print(f"{len(errors)} schema errors found in {args.file}.")
+        sys.exit(1)
+    print(f"{args.file} is valid.")
+
+if __name__ == "__main__":
+    main()